@@ -1,33 +1,56 @@
-import sympy.geometry as symgeo
+import numpy as np
+
+import Geometry
+import Stats
+from SpatialIndex import QUERY_CHUNK, SpatialIndex, box_overlap, to_csr
 
 class OBB:
     """
-    Oriented bounding box. This is a wrapper around sympy.geometry.convex_hull.
-    OBB is extracted after estimation of convex_hull.
+    Oriented bounding box of minimum area. The box is extracted from the float convex hull of points with rotating
+    calipers. See Geometry.obb for the batch version used by ADT.
     Only for 2D.
     """
     def __init__(self, dim, polygon=None, point=None):
         """
         Construct OBB from either the polygon which represents the convex hull or from a list of point.
-        :param polygon: the sympy.geometry.Polygon which represents the convex hull of a set of points.
-        :param point: list of sympy,geometry.Point.
-        :modify: if successful diagonal coordinates of OBB where
-                 r[0]: x_min
-                 r[1]: y_min
-                 r[2]: x_max
-                 r[3]: y_max.
+        :param polygon: the sympy.geometry.Polygon or list of coordinates which represents the convex hull of a set
+                        of points.
+        :param point: list of coordinates or sympy.geometry.Point.
+        :modify: if successful center, axis (unit vectors as rows), half extents and diagonal coordinates of OBB
+                 in the frame of its axes where
+                 r[0]: u_min
+                 r[1]: v_min
+                 r[2]: u_max
+                 r[3]: v_max.
         :error: if dim is not 2 or both polygon and point are None raise ValueError.
         """
 
         if dim != 2:
             raise ValueError('only 2D is supported.')
         if point is None and polygon is not None:
-            for _ in range(2*dim):
-                self.r.append(polygon.bounds[_])
+            hull = np.array(getattr(polygon, 'vertices', polygon), dtype=np.float64)
         elif point is not None and polygon is None:
-            symgeo.convex_hull(point)
+            hull = Geometry.convex_hull(np.array(point, dtype=np.float64))
         else:
             raise ValueError('both polygon and point are None.')
+        self.dim = dim
+        direction = np.roll(hull, -1, axis=0) - hull  # hull edges.
+        center, axis, half = Geometry.min_area_rect(hull[None], direction[None])
+        self.center = center[0]
+        self.axis = axis[0]
+        self.half = half[0]
+        mid = self.axis @ self.center
+        self.r = [float(_) for _ in np.concatenate((mid - self.half, mid + self.half))]
+
+    def overlap(self, other, tol=Geometry.TOL):
+        """
+        Evaluate overlap of two OBBs with the separating axis theorem.
+        :param other: OBB
+        :return: False if no overlap.
+                 True by default.
+        """
+        return bool(Geometry.obb_overlap((self.center[None], self.axis[None], self.half[None]),
+                                         (other.center[None], other.axis[None], other.half[None]), tol)[0])
 
 
 class AABB:
@@ -65,7 +88,6 @@ class AABB:
             for _ in range(dim):
                 self.r_min.append(1e6)
                 self.r_max.append(-1e6)
-            print(point)
             # loop through points to update variables.
             if point:
                 for e in point:  # element (polygon) in the list.
@@ -99,14 +121,260 @@ class AABB:
         return True
 
 
-class ADT:
+# arrays of the flat tree built by ADT.build_from_boxes.
+TREE_ARRAY = ('box', 'node_element', 'node_left', 'node_right', 'node_key', 'node_dim', 'node_level', 'node_box')
+
+
+def box_distance(point, box, dim):
+    """
+    Distances of pairs of points and boxes.
+
+    :param point: (n, dim) points.
+    :param box: (n, 2*dim) boxes.
+    :return: (n,) distances. zero for points in boxes.
+    """
+    d = np.maximum(np.maximum(box[:, :dim] - point, point - box[:, dim:]), 0)
+    return np.sqrt(np.einsum('nd,nd->n', d, d))
+
+
+class ADT(SpatialIndex):
+    NAME = 'adt'
+
     def __init__(self, dim):
         """
         :param dim: Spatial dimension.
         """
-        self.dim = dim
-        self.n_var = 2 * dim
+        super().__init__(dim)
         self.root = None
+        # flat tree built by build_from_boxes. nodes are numbered level by level starting from the root at 0.
+        self.node_element = None  # element stored at each node.
+        self.node_left = None  # left child of each node or -1.
+        self.node_right = None  # right child of each node or -1.
+        self.node_key = None  # key of each node on which its children are split.
+        self.node_dim = None  # the dimension (one of n_var) on which children of each node are split.
+        self.node_level = None  # level of each node.
+        self.node_box = None  # (n_node, n_var) bounding box of the elements in subtree of each node.
+
+    @property
+    def n_node(self):
+        return 0 if self.node_element is None else len(self.node_element)
+
+    @property
+    def depth(self):
+        return 0 if self.n_node == 0 else int(self.node_level[-1]) + 1
+
+    def depth_histogram(self):
+        """
+        :return: number of nodes at each level.
+        """
+        return np.bincount(self.node_level) if self.n_node else np.zeros(0, dtype=np.int64)
+
+    @Stats.timed('adt_build')
+    def build_from_boxes(self, boxes):
+        """
+        Build a balanced tree from element bounding boxes at once.
+
+        Boxes are points in n_var dimensional space. Each node stores the median element of its subtree along the
+        dimension level % n_var. Elements are presorted along every dimension once and the sorted orders are
+        partitioned stably level by level, so construction is O(M log M) with depth ceil(log2(M + 1)).
+        :param boxes: (n_element, n_var) array of min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        :error: if boxes do not have n_var columns raise ValueError.
+        :rtype: None
+        """
+        boxes = self.check_boxes_(boxes)
+        m = len(boxes)
+        self.box = boxes
+        self.node_element = np.empty(m, dtype=np.int64)
+        self.node_left = np.full(m, -1, dtype=np.int64)
+        self.node_right = np.full(m, -1, dtype=np.int64)
+        self.node_key = np.empty(m)
+        self.node_dim = np.empty(m, dtype=np.int64)
+        self.node_level = np.empty(m, dtype=np.int64)
+
+        # element ids sorted along each dimension. each one stays grouped by segment and sorted within segments.
+        order = [np.argsort(boxes[:, d], kind='stable') for d in range(self.n_var)]
+        side = np.empty(m, dtype=np.int8)  # 0: left, 1: median, 2: right.
+        seg_start = np.zeros(1 if m else 0, dtype=np.int64)
+        seg_len = np.full(len(seg_start), m, dtype=np.int64)
+        seg_parent = np.full(len(seg_start), -1, dtype=np.int64)
+        seg_right = np.zeros(len(seg_start), dtype=bool)  # whether segment is the right child of its parent.
+        n_node = 0
+        level = 0
+        while len(seg_start):
+            d = level % self.n_var
+            node = n_node + np.arange(len(seg_start))
+            n_node += len(node)
+            # link nodes to parents.
+            self.node_left[seg_parent[~seg_right & (seg_parent >= 0)]] = node[~seg_right & (seg_parent >= 0)]
+            self.node_right[seg_parent[seg_right]] = node[seg_right]
+            # median of each segment along dimension d.
+            half = seg_len // 2
+            mid = seg_start + half
+            element = order[d][mid]
+            self.node_element[node] = element
+            self.node_key[node] = boxes[element, d]
+            self.node_dim[node] = d
+            self.node_level[node] = level
+
+            # mark side of each element of segments with respect to the median.
+            seg = np.repeat(np.arange(len(seg_start)), seg_len)
+            seg_first = np.cumsum(seg_len) - seg_len  # index of the first entry of each segment.
+            pos = np.arange(len(seg)) + (seg_start - seg_first)[seg]
+            side[order[d][pos]] = np.sign(pos - mid[seg]) + 1
+            # partition sorted orders of the other dimensions stably as left, median, right.
+            for dd in range(self.n_var):
+                if dd != d:
+                    value = order[dd][pos]
+                    order[dd][partition(value, side, seg, seg_first, seg_start, half)] = value
+
+            # segments of the next level: left and right children of every node.
+            left_len = half
+            right_len = seg_len - half - 1
+            seg_start = np.stack((seg_start, mid + 1), axis=1).ravel()
+            seg_len = np.stack((left_len, right_len), axis=1).ravel()
+            seg_parent = np.repeat(node, 2)
+            seg_right = np.tile([False, True], len(node))
+            keep = seg_len > 0
+            seg_start = seg_start[keep]
+            seg_len = seg_len[keep]
+            seg_parent = seg_parent[keep]
+            seg_right = seg_right[keep]
+            level += 1
+
+        with Stats.timer(self.stats, 'adt_refit'):
+            self.refit()
+        if self.stats is not None:
+            self.stats.histogram['adt_depth'] = self.depth_histogram()
+
+    def refit(self, boxes=None):
+        """
+        Update bounding boxes of nodes from element boxes bottom-up without changing the tree topology.
+        Use for mildly deforming elements. Keys become stale but queries only use boxes, so results stay exact;
+        only pruning gets looser as elements drift from the positions the tree was built from.
+        :param boxes: (n_element, n_var) new element boxes. current element boxes are used if None.
+        :error: if boxes do not match the elements of the tree raise ValueError.
+        :rtype: None
+        """
+        if boxes is not None:
+            boxes = np.ascontiguousarray(boxes, dtype=np.float64)
+            if self.box is None or boxes.shape != self.box.shape:
+                raise ValueError('boxes must have the shape of the boxes the tree was built from.')
+            self.box = boxes
+        dim = self.dim
+        self.node_box = self.box[self.node_element].copy()
+        level_start = np.searchsorted(self.node_level, np.arange(self.depth + 1))
+        for level in range(self.depth - 1, 0, -1):
+            node = np.arange(level_start[level - 1], level_start[level])
+            for child in (self.node_left[node], self.node_right[node]):
+                has = child >= 0
+                parent = node[has]
+                child = child[has]
+                self.node_box[parent, :dim] = np.minimum(self.node_box[parent, :dim], self.node_box[child, :dim])
+                self.node_box[parent, dim:] = np.maximum(self.node_box[parent, dim:], self.node_box[child, dim:])
+
+    def search_boxes_(self, query, chunk=QUERY_CHUNK):
+        """
+        Search query boxes given in the reference frame of the tree. Do not call this function explicitly. It meant
+        to be called in search_boxes and search_points.
+
+        All queries of a chunk traverse the tree together. The frontier holds (query, node) pairs and is expanded
+        one level per step, so the number of Python steps per chunk is the depth of the tree.
+        """
+        stats = self.stats
+        with Stats.timer(stats, self.NAME + '_search'):
+            n_query = len(query)
+            found_query = list()
+            found_element = list()
+            if stats is not None:
+                n_visit = np.zeros(n_query, dtype=np.int64)  # nodes visited by each query.
+            for start in range(0, n_query if self.n_node else 0, chunk):
+                q = np.arange(start, min(start + chunk, n_query))
+                node = np.zeros(len(q), dtype=np.int64)
+                while len(q):
+                    if stats is not None:
+                        n_visit[start:start + chunk] += np.bincount(q - start, minlength=min(chunk, n_query - start))
+                    box = query[q]
+                    # drop pairs whose query does not overlap the subtree of node.
+                    hit = box_overlap(box, self.node_box[node], self.dim)
+                    q = q[hit]
+                    node = node[hit]
+                    box = box[hit]
+                    # check the element stored at node.
+                    element = self.node_element[node]
+                    own = box_overlap(box, self.box[element], self.dim)
+                    if stats is not None:
+                        stats.add('adt_node_test', len(hit))
+                        stats.add('adt_element_test', len(own))
+                    found_query.append(q[own])
+                    found_element.append(element[own])
+                    # expand frontier to children.
+                    left = self.node_left[node]
+                    right = self.node_right[node]
+                    q = np.concatenate((q[left >= 0], q[right >= 0]))
+                    node = np.concatenate((left[left >= 0], right[right >= 0]))
+            offset, index = to_csr(found_query, found_element, n_query)
+            if stats is not None:
+                stats.add('adt_query', n_query)
+                stats.add('adt_candidate', len(index))
+                stats.add_histogram('adt_node_visit_per_query', n_visit)
+            return offset, index
+
+    def search_nearest_segments(self, point, segment, chunk=QUERY_CHUNK):
+        """
+        Find the nearest segment to each of a batch of points by branch and bound. The tree must be built from the
+        boxes of the segments.
+
+        All queries of a chunk traverse the tree together as in search_boxes. The element stored at every visited
+        node tightens the distance bound of its query, and (query, node) pairs whose node box is not closer than the
+        bound are pruned. Elements near the root are spread over the whole domain, so bounds become tight in a few
+        levels.
+        :param point: (n_query, dim) array of coordinates.
+        :param segment: (n_element, 2, dim) end points of segments at the positions the tree was built from.
+        :param chunk: number of queries traversed together.
+        :return: (n_query,) nearest segments and distances. -1 and inf if the tree is empty.
+        :error: if tree is not built raise ValueError.
+        """
+        if self.node_element is None:
+            raise ValueError('tree is not built. call build_from_boxes first.')
+        # distances are invariant under rigid motion.
+        point = self.to_reference(np.asarray(point, dtype=np.float64).reshape(-1, self.dim))
+        segment = np.asarray(segment, dtype=np.float64)
+        n_query = len(point)
+        nearest = np.full(n_query, -1, dtype=np.int64)
+        distance = np.full(n_query, np.inf)
+        stats = self.stats
+        for start in range(0, n_query if self.n_node else 0, chunk):
+            q = np.arange(start, min(start + chunk, n_query))
+            node = np.zeros(len(q), dtype=np.int64)
+            while len(q):
+                keep = box_distance(point[q], self.node_box[node], self.dim) < distance[q]
+                if stats is not None:
+                    stats.add('adt_node_test', len(keep))
+                q = q[keep]
+                node = node[keep]
+                self.update_nearest_(point, segment, q, node, nearest, distance)
+                left = self.node_left[node]
+                right = self.node_right[node]
+                q = np.concatenate((q[left >= 0], q[right >= 0]))
+                node = np.concatenate((left[left >= 0], right[right >= 0]))
+        return nearest, distance
+
+    def update_nearest_(self, point, segment, q, node, nearest, distance):
+        """
+        Update nearest segments of queries q with the elements stored at nodes. Do not call this function explicitly.
+        It meant to be called in search_nearest_segments.
+        """
+        element = self.node_element[node]
+        d = Geometry.point_segment_distance(point[q], segment[element, 0], segment[element, 1])
+        if self.stats is not None:
+            self.stats.add('adt_element_test', len(d))
+        better = d < distance[q]
+        q = q[better]
+        d = d[better]
+        # a query may appear several times in q. keep the closest element.
+        np.minimum.at(distance, q, d)
+        win = d == distance[q]
+        nearest[q[win]] = element[better][win]
 
     def build(self, point):
         """
@@ -356,6 +624,30 @@ class ADT:
                 # pop() removes and at the same time return the last element of search_stack.
 
 
+def partition(value, side, seg, seg_first, seg_start, n_left):
+    """
+    Stable partition of element ids of every segment into left, median and right parts.
+
+    :param value: element ids of segments laid out one segment after another.
+    :param side: side of each element id. 0: left, 1: median, 2: right.
+    :param seg: segment of each entry of value.
+    :param seg_first: index of the first entry of each segment in value.
+    :param seg_start: start position of each segment.
+    :param n_left: number of left elements of each segment.
+    :return: new position of each entry of value.
+    """
+    s = side[value]
+    # number of left (right) entries before each entry in the same segment.
+    is_left = s == 0
+    n_before_left = np.cumsum(is_left) - is_left
+    n_before_left -= n_before_left[seg_first][seg]
+    is_right = s == 2
+    n_before_right = np.cumsum(is_right) - is_right
+    n_before_right -= n_before_right[seg_first][seg]
+    offset = np.where(is_left, n_before_left, np.where(is_right, n_left[seg] + 1 + n_before_right, n_left[seg]))
+    return seg_start[seg] + offset
+
+
 class ADTNode:
     def __init__(self, level, key, adt_point, aabb):
         self.key = key
@@ -368,25 +660,23 @@ class ADTNode:
 
 class ADTPoint:
     def __init__(self, point, tag, dim):
+        """
+        :param point: vertices of the element as a list of coordinates. example: [[1,2], [3,4], [5,6]]
+        :param tag: tag of the element.
+        :param dim: Spatial dimension.
+        """
         self.point = point
         self.tag = tag
-        self.aabb = AABB(point, dim)  # aabb of the element.
-
-    def true_overlap(self, other):
-        # convert list: [[1,2], [3,4], [5,6]] to tuple: [(1,2), (3,4), (5,6)]
-        point_tuple_self = list()
-        for p in self.point:
-            point_tuple_self.append(tuple(p))
-
-        point_tuple_other = list()
-        for p in other.point:
-            point_tuple_other.append(tuple(p))
-
-        poly_self = symgeo.Polygon(point_tuple_self)
-        poly_other = symgeo.Polygon(point_tuple_other)
-
-        return poly_self.intersection(poly_other)
-
-
-
+        # (1, 4, dim) vertices of the element as in Geometry.polygon.
+        self.polygon = Geometry.polygon(np.asarray(point, dtype=np.float64).reshape(-1, dim), [np.arange(len(point))])
+        self.aabb = AABB(self.polygon.tolist(), dim)  # aabb of the element.
 
+    def true_overlap(self, other, tol=Geometry.TOL):
+        """
+        Evaluate exact overlap of the elements of two ADTPoints. Elements are triangles or quads given as lists of
+        coordinates. example: [[1,2], [3,4], [5,6]]
+        :param other: ADTPoint
+        :param tol: elements closer than tol overlap. see Geometry.overlap.
+        :return: True if elements overlap.
+        """
+        return bool(Geometry.overlap(self.polygon, other.polygon, tol)[0])
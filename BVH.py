@@ -0,0 +1,224 @@
+import numpy as np
+
+import Stats
+from SpatialIndex import QUERY_CHUNK, SpatialIndex, box_overlap, expand_range, to_csr
+
+# maximum number of elements of a leaf.
+LEAF_SIZE = 4
+
+# number of bins of centroids along each dimension in which split planes are evaluated.
+N_BIN = 16
+
+
+def surface(lo, hi):
+    """
+    Surface measure of boxes: perimeter / 2 in 2D, area / 2 in 3D.
+
+    :param lo: (..., dim) lower corners.
+    :param hi: (..., dim) upper corners.
+    :return: (...) measures.
+    """
+    extent = hi - lo
+    dim = extent.shape[-1]
+    if dim == 1:
+        return np.ones(extent.shape[:-1])
+    return sum(np.prod(np.delete(extent, d, axis=-1), axis=-1) for d in range(dim))
+
+
+class BVH(SpatialIndex):
+    """
+    Bounding volume hierarchy built with the surface area heuristic (SAH). Nodes split elements into two groups of
+    any size which minimize the sum of surface times count of both groups, so dense clusters of small elements, e.g.
+    near-wall cells, are separated from sparse large ones early. Elements are stored in leaves.
+    """
+    NAME = 'bvh'
+
+    def __init__(self, dim):
+        """
+        :param dim: Spatial dimension.
+        """
+        super().__init__(dim)
+        # flat tree built by build_from_boxes. nodes are numbered level by level starting from the root at 0.
+        self.element = None  # elements ordered so that the elements of every node are contiguous.
+        self.node_start = None  # first entry in element of each node.
+        self.node_count = None  # number of elements of each node.
+        self.node_left = None  # left child of each node or -1 for leaves. the right child is node_left + 1.
+        self.node_level = None  # level of each node.
+        self.node_box = None  # (n_node, n_var) bounding box of the elements of each node.
+
+    @property
+    def n_node(self):
+        return 0 if self.node_start is None else len(self.node_start)
+
+    @property
+    def depth(self):
+        return 0 if self.n_node == 0 else int(self.node_level[-1]) + 1
+
+    def depth_histogram(self):
+        """
+        :return: number of nodes at each level.
+        """
+        return np.bincount(self.node_level) if self.n_node else np.zeros(0, dtype=np.int64)
+
+    @Stats.timed('bvh_build')
+    def build_from_boxes(self, boxes):
+        """
+        Build the tree top-down one level at a time. Centroids of the elements of every node are binned along each
+        dimension and the split between bins of the least SAH cost is chosen, using prefix scans over bins for all
+        nodes of a level at once. Nodes of at most LEAF_SIZE elements become leaves.
+        :param boxes: (n_element, n_var) array of min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        :error: if boxes do not have n_var columns raise ValueError.
+        :rtype: None
+        """
+        boxes = self.check_boxes_(boxes)
+        dim = self.dim
+        m = len(boxes)
+        self.box = boxes
+        self.element = np.arange(m)
+        center = (boxes[:, :dim] + boxes[:, dim:]) / 2
+        node_start = list()
+        node_count = list()
+        node_left = list()
+        node_level = list()
+        node_box = list()
+        seg_start = np.zeros(1 if m else 0, dtype=np.int64)
+        seg_len = np.full(len(seg_start), m, dtype=np.int64)
+        n_node = 0
+        level = 0
+        while len(seg_start):
+            n_seg = len(seg_start)
+            n_node += n_seg
+            seg, pos = expand_range(seg_start, seg_len)
+            seg_first = np.cumsum(seg_len) - seg_len
+            element = self.element[pos]
+            box = boxes[element]
+            node_box.append(np.hstack((np.minimum.reduceat(box[:, :dim], seg_first),
+                                       np.maximum.reduceat(box[:, dim:], seg_first))))
+            node_start.append(seg_start)
+            node_count.append(seg_len)
+            node_level.append(np.full(n_seg, level, dtype=np.int64))
+
+            split = seg_len > LEAF_SIZE
+            left = np.full(n_seg, -1, dtype=np.int64)
+            left[split] = n_node + 2 * np.arange(split.sum())
+            node_left.append(left)
+            if not split.any():
+                break
+            # entries of segments to split. split is sorted by segment, so they stay grouped.
+            entry = split[seg]
+            s = np.cumsum(split)[seg[entry]] - 1
+            k = int(split.sum())
+            right = self.split_(center[element[entry]], box[entry], s, k)
+            n_left = seg_len[split] - np.bincount(s[right], minlength=k)
+            # partition entries of every segment stably as left, right.
+            order = np.argsort(2 * s + right, kind='stable')
+            self.element[pos[entry]] = element[entry][order]
+
+            start = seg_start[split]
+            seg_start = np.stack((start, start + n_left), axis=1).ravel()
+            seg_len = np.stack((n_left, seg_len[split] - n_left), axis=1).ravel()
+            level += 1
+
+        self.node_start = np.concatenate(node_start) if node_start else np.empty(0, dtype=np.int64)
+        self.node_count = np.concatenate(node_count) if node_count else np.empty(0, dtype=np.int64)
+        self.node_left = np.concatenate(node_left) if node_left else np.empty(0, dtype=np.int64)
+        self.node_level = np.concatenate(node_level) if node_level else np.empty(0, dtype=np.int64)
+        self.node_box = np.concatenate(node_box) if node_box else np.empty((0, self.n_var))
+        if self.stats is not None:
+            self.stats.histogram['bvh_depth'] = self.depth_histogram()
+
+    def split_(self, center, box, s, k):
+        """
+        Choose SAH splits of segments. Do not call this function explicitly. It meant to be called in
+        build_from_boxes.
+
+        :param center: (n, dim) centroids of entries, grouped by segment.
+        :param box: (n, n_var) boxes of entries.
+        :param s: (n,) segment of each entry in 0, ..., k-1.
+        :param k: number of segments.
+        :return: (n,) bool array of entries going to the right child.
+        """
+        dim = self.dim
+        first = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+        c_min = np.minimum.reduceat(center, first)
+        c_max = np.maximum.reduceat(center, first)
+        count = np.bincount(s, minlength=k)
+        best_cost = np.full(k, np.inf)
+        best_dim = np.zeros(k, dtype=np.int64)
+        best_bin = np.zeros(k, dtype=np.int64)
+        bins = list()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for d in range(dim):
+                scale = np.where(c_max[:, d] > c_min[:, d], N_BIN / (c_max[:, d] - c_min[:, d]), 0)
+                b = np.minimum(((center[:, d] - c_min[s, d]) * scale[s]).astype(np.int64), N_BIN - 1)
+                bins.append(b)
+                key = s * N_BIN + b
+                n = np.bincount(key, minlength=k * N_BIN).reshape(k, N_BIN)
+                # scatter column by column. ufunc.at is much faster on 1D arrays.
+                lo = np.full((dim, k * N_BIN), np.inf)
+                hi = np.full((dim, k * N_BIN), -np.inf)
+                for dd in range(dim):
+                    np.minimum.at(lo[dd], key, box[:, dd])
+                    np.maximum.at(hi[dd], key, box[:, dim + dd])
+                lo = lo.T.reshape(k, N_BIN, dim)
+                hi = hi.T.reshape(k, N_BIN, dim)
+                # boxes and counts of bins 0..i (left) and i+1..N_BIN-1 (right) for splits after bin i.
+                n_left = np.cumsum(n, axis=1)[:, :-1]
+                left = surface(np.minimum.accumulate(lo, axis=1), np.maximum.accumulate(hi, axis=1))[:, :-1]
+                right = surface(np.minimum.accumulate(lo[:, ::-1], axis=1),
+                                np.maximum.accumulate(hi[:, ::-1], axis=1))[:, ::-1][:, 1:]
+                cost = np.where((n_left > 0) & (n_left < count[:, None]),
+                                left * n_left + right * (count[:, None] - n_left), np.inf)
+                i = np.argmin(cost, axis=1)
+                c = cost[np.arange(k), i]
+                better = c < best_cost
+                best_cost[better] = c[better]
+                best_dim[better] = d
+                best_bin[better] = i[better]
+        # coincident centroids cannot be split by planes. split them in halves.
+        right = np.choose(best_dim[s], bins) > best_bin[s]
+        local = np.arange(len(s)) - first[s]
+        return np.where(np.isinf(best_cost)[s], local >= count[s] // 2, right)
+
+    def search_boxes_(self, query, chunk=QUERY_CHUNK):
+        """
+        Search query boxes given in the reference frame of the tree. Do not call this function explicitly. It meant
+        to be called in search_boxes and search_points.
+
+        All queries of a chunk traverse the tree together as in ADT. Pairs reaching leaves are expanded to the
+        elements of the leaves.
+        """
+        stats = self.stats
+        with Stats.timer(stats, self.NAME + '_search'):
+            dim = self.dim
+            n_query = len(query)
+            found_query = list()
+            found_element = list()
+            for start in range(0, n_query if self.n_node else 0, chunk):
+                q = np.arange(start, min(start + chunk, n_query))
+                node = np.zeros(len(q), dtype=np.int64)
+                while len(q):
+                    hit = box_overlap(query[q], self.node_box[node], dim)
+                    q = q[hit]
+                    node = node[hit]
+                    left = self.node_left[node]
+                    leaf = left < 0
+                    pair, slot = expand_range(self.node_start[node[leaf]], self.node_count[node[leaf]])
+                    qq = q[leaf][pair]
+                    element = self.element[slot]
+                    own = box_overlap(query[qq], self.box[element], dim)
+                    if stats is not None:
+                        stats.add('bvh_node_test', len(hit))
+                        stats.add('bvh_element_test', len(own))
+                    found_query.append(qq[own])
+                    found_element.append(element[own])
+                    # expand frontier to children.
+                    q = q[~leaf]
+                    left = left[~leaf]
+                    q = np.concatenate((q, q))
+                    node = np.concatenate((left, left + 1))
+            offset, index = to_csr(found_query, found_element, n_query)
+            if stats is not None:
+                stats.add('bvh_query', n_query)
+                stats.add('bvh_candidate', len(index))
+            return offset, index
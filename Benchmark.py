@@ -0,0 +1,321 @@
+"""
+Scaling benchmark of mesh load, topology, output, spatial index build and search on synthetic meshes.
+
+usage:
+    python Benchmark.py run --size 1e3 1e4 1e5 --kind structured unstructured --out result.json
+    python Benchmark.py run --kind structured graded --backend adt grid bvh --out index.json
+    python Benchmark.py compare result.json baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy.spatial import Delaunay
+
+import Gmsh
+import Index
+from Mesh import Mesh
+
+# mesh kinds which can be generated.
+KIND = ('structured', 'jittered', 'unstructured', 'graded')
+
+# cells per point of unstructured meshes. Delaunay gives two triangles per point, and most pairs become quads.
+CELL_PER_POINT = 1.14
+
+# number of rounds matching triangles into quads.
+MERGE_ROUND = 8
+
+# ratio of the largest to the smallest row height of graded meshes.
+GRADING = 1e3
+
+# default number of cells of benchmark meshes.
+SIZE = (1e3, 1e4, 1e5)
+
+# phases shorter than this are not flagged as regressions since they are dominated by noise.
+MIN_TIME = 0.05
+
+
+def cross(a, b):
+    """
+    :return: z component of cross products of (..., 2) vectors.
+    """
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def mixed_cells(coord, rng, n_round=MERGE_ROUND):
+    """
+    Delaunay triangulate points and merge pairs of neighboring triangles into convex quads. Pairs are matched in
+    rounds: every unmatched triangle proposes to the neighbor of the highest random pair priority, and mutual
+    proposals are merged.
+
+    :param coord: (n_point, 2) points.
+    :param rng: numpy random Generator.
+    :param n_round: number of matching rounds.
+    :return: (n_tri, 3) counter-clockwise triangles and (n_quad, 4) counter-clockwise quads.
+    """
+    delaunay = Delaunay(coord)
+    tri = delaunay.simplices.astype(np.int64)
+    nei = delaunay.neighbors.astype(np.int64)  # nei[t, k] is the neighbor across the edge opposite vertex k.
+    p = coord[tri]
+    flip = cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]) < 0
+    tri[flip] = tri[flip][:, [0, 2, 1]]
+    nei[flip] = nei[flip][:, [0, 2, 1]]
+    m = len(tri)
+    t = np.arange(m)
+    other = np.maximum(nei, 0)
+    # quad of triangle t merged with its neighbor across the edge opposite vertex k: v_k, v_k+1, w, v_k+2.
+    k = np.arange(3)
+    w = tri[other, np.argmax(nei[other] == t[:, None, None], axis=2)]
+    quad = np.stack((tri, tri[:, (k + 1) % 3], w, tri[:, (k + 2) % 3]), axis=2)
+    edge = coord[np.roll(quad, -1, axis=2)] - coord[quad]
+    length = np.hypot(edge[..., 0], edge[..., 1])
+    # interior angles must stay clearly below 180 degrees.
+    convex = np.all(cross(edge, np.roll(edge, -1, axis=2)) > 0.1 * length * np.roll(length, -1, axis=2), axis=2)
+    allowed = (nei >= 0) & convex
+    priority = rng.random(m)
+    partner = np.full(m, -1, dtype=np.int64)
+    for _ in range(n_round):
+        free = partner < 0
+        score = np.where(allowed & free[:, None] & free[other], priority[:, None] + priority[other], -1)
+        best = np.argmax(score, axis=1)
+        proposal = np.where(score[t, best] >= 0, nei[t, best], -1)
+        mutual = (proposal >= 0) & (proposal[np.maximum(proposal, 0)] == t)
+        partner[mutual] = proposal[mutual]
+    first = np.flatnonzero(t < partner)
+    side = np.argmax(nei[first] == partner[first, None], axis=1)
+    return tri[partner < 0], quad[first, side]
+
+
+def shuffle(coord, cell, line, rng):
+    """
+    Shuffle numbering of points and cells and rotate the first vertex of each cell keeping orientation, like GMSH
+    output.
+
+    :param cell: dict of element type to (n, k) cells.
+    :return: coordinates, cells and lines.
+    """
+    perm = rng.permutation(len(coord))
+    inverse = np.empty_like(perm)
+    inverse[perm] = np.arange(len(perm))
+    shuffled = dict()
+    for etype, c in cell.items():
+        c = inverse[c][rng.permutation(len(c))]
+        k = c.shape[1]
+        shift = rng.integers(0, k, len(c))
+        shuffled[etype] = c[np.arange(len(c))[:, None], (np.arange(k) + shift[:, None]) % k]
+    return coord[perm], shuffled, inverse[line]
+
+
+def generate(kind, n_cell, seed=0):
+    """
+    Generate a mesh of the unit square with about n_cell cells.
+    Structured meshes are quad grids. Graded meshes have rows growing geometrically from the bottom side like
+    boundary layer meshes.
+    Jittered meshes are structured grids with jittered interior points and shuffled point and cell numbering like
+    GMSH output. Their connectivity stays structured.
+    Unstructured meshes are mixed triangles and quads of irregular valence: jittered points are Delaunay
+    triangulated, pairs of neighboring triangles are merged into convex quads and numbering is shuffled.
+    The bottom side is a wall (physical tag 1). Other sides have physical tag 2.
+
+    :param kind: 'structured', 'jittered', 'unstructured' or 'graded'.
+    :param n_cell: number of cells.
+    :param seed: seed of random numbers of jittered and unstructured meshes.
+    :return: coordinates and element dict as accepted by Gmsh.write.
+    """
+    if kind not in KIND:
+        raise ValueError('kind must be one of %s.' % ', '.join(KIND))
+    if kind == 'unstructured':
+        n = max(int(round(np.sqrt(n_cell / CELL_PER_POINT))), 1)
+    else:
+        n = max(int(round(np.sqrt(n_cell))), 1)
+    h = 1.0 / n
+    row = np.linspace(0, 1, n + 1)
+    if kind == 'graded' and n > 1:
+        r = GRADING ** (1 / (n - 1))
+        row = (r ** np.arange(n + 1) - 1) / (r ** n - 1)
+    x, y = np.meshgrid(np.linspace(0, 1, n + 1), row)
+    coord = np.column_stack((x.ravel(), y.ravel()))
+    index = np.arange((n + 1) ** 2).reshape(n + 1, n + 1)  # index[j, i] is the point at column i, row j.
+    cell = {3: np.column_stack((index[:-1, :-1].ravel(), index[:-1, 1:].ravel(), index[1:, 1:].ravel(),
+                                index[1:, :-1].ravel()))}
+    side = [np.column_stack((index[0, :-1], index[0, 1:])),  # bottom
+            np.column_stack((index[:-1, -1], index[1:, -1])),  # right
+            np.column_stack((index[-1, 1:], index[-1, :-1])),  # top
+            np.column_stack((index[1:, 0], index[:-1, 0]))]  # left
+    line = np.concatenate(side)
+    line_tag = np.concatenate([np.full(len(s), 1 if k == 0 else 2) for k, s in enumerate(side)])
+
+    if kind in ('jittered', 'unstructured'):
+        rng = np.random.default_rng(seed)
+        interior = np.ones((n + 1, n + 1), dtype=bool)
+        interior[[0, -1], :] = False
+        interior[:, [0, -1]] = False
+        interior = interior.ravel()
+        coord[interior] += (rng.random((interior.sum(), 2)) - 0.5) * 0.6 * h
+        if kind == 'unstructured':
+            # boundary points stay on the sides, so boundary edges of the triangulation are the side lines.
+            tri, quad = mixed_cells(coord, rng)
+            cell = {2: tri, 3: quad}
+        coord, cell, line = shuffle(coord, cell, line, rng)
+
+    element = {1: (line_tag, line)}
+    for etype, c in cell.items():
+        element[etype] = (np.full(len(c), 5), c)
+    return coord, element
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10  # bytes on macOS, KB otherwise.
+
+
+def run_case(kind, n_cell, work_dir, binary=True, backend=('adt',)):
+    """
+    Time phases on one mesh. Meant to run in a fresh process so that peak RSS belongs to this case only.
+    The spatial index of every backend is built from cell boxes and searched with cell centroids.
+
+    :param backend: names of spatial index backends. see Index.BACKEND.
+    :return: dict of case description, time of each phase in seconds and peak RSS in MB after each phase.
+    """
+    phase = dict()
+    rss = dict()
+
+    def timed(name, f):
+        start = time.perf_counter()
+        out = f()
+        phase[name] = time.perf_counter() - start
+        rss[name] = peak_rss()
+        return out
+
+    file_name = os.path.join(work_dir, '%s_%i.msh' % (kind, n_cell))
+    coord, element = generate(kind, n_cell)
+    timed('write_msh', lambda: Gmsh.write(file_name, coord, element, binary))
+    del coord, element
+    mesh = Mesh()
+    timed('read_gmsh', lambda: mesh.read_gmsh(file_name))
+    timed('topology_connectivity', mesh.topology_connectivity)
+    timed('print_vtk', lambda: mesh.print_vtk(os.path.join(work_dir, 'out.vtk'), binary=True))
+    timed('print_vtu', lambda: mesh.print_vtu(os.path.join(work_dir, 'out.vtu')))
+    box = mesh.cell_box()
+    centroid = mesh.cell_polygon().mean(axis=1)
+    for name in backend:
+        tree = Index.BACKEND[name](2)
+        timed(name + '_build', lambda: tree.build_from_boxes(box))
+        timed(name + '_search', lambda: tree.search_points(centroid))
+        del tree
+    os.remove(file_name)
+    return {'kind': kind, 'n_cell': int(len(mesh.cell_point)), 'n_point': int(len(mesh.coord)),
+            'binary_msh': binary, 'auto_backend': Index.select_backend(box, 2), 'time': phase, 'peak_rss_mb': rss}
+
+
+def run_case_(args):
+    return run_case(*args)
+
+
+def run(size=SIZE, kind=KIND, work_dir=None, binary=True, backend=('adt',)):
+    """
+    Run all cases, each in a fresh process.
+
+    :param size: numbers of cells.
+    :param kind: mesh kinds.
+    :param work_dir: directory for temporary mesh and output files. a temporary directory if None.
+    :param binary: write benchmark meshes as binary MSH.
+    :param backend: names of spatial index backends to compare.
+    :return: dict with machine description and list of case results.
+    """
+    result = list()
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        ctx = mp.get_context('spawn')
+        for k in kind:
+            for n in size:
+                with ctx.Pool(1) as pool:
+                    r = pool.apply(run_case_, ((k, int(n), tmp, binary, tuple(backend)),))
+                result.append(r)
+                print('%-12s %9i cells  %s' % (k, r['n_cell'], '  '.join('%s %.3fs' % p for p in r['time'].items())))
+    meta = {'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+    return {'meta': meta, 'result': result}
+
+
+def compare(result, baseline, threshold=0.25, min_time=MIN_TIME):
+    """
+    Compare results with a baseline run.
+
+    :param result: dict returned by run.
+    :param baseline: dict returned by run.
+    :param threshold: relative slow down (or growth of peak RSS) flagged as regression.
+    :param min_time: phases faster than this in both runs are not flagged.
+    :return: list of (kind, n_cell, metric, baseline value, new value, ratio) of regressions.
+    """
+    base = {(r['kind'], r['n_cell']): r for r in baseline['result']}
+    regression = list()
+    for r in result['result']:
+        b = base.get((r['kind'], r['n_cell']))
+        if b is None:
+            continue
+        for name, t in r['time'].items():
+            t0 = b['time'].get(name)
+            if t0 is None or max(t, t0) < min_time:
+                continue
+            ratio = t / t0 if t0 > 0 else np.inf
+            if ratio > 1 + threshold:
+                regression.append((r['kind'], r['n_cell'], 'time.' + name, t0, t, ratio))
+        m, m0 = max(r['peak_rss_mb'].values()), max(b['peak_rss_mb'].values())
+        if m0 > 0 and m / m0 > 1 + threshold:
+            regression.append((r['kind'], r['n_cell'], 'peak_rss_mb', m0, m, m / m0))
+    return regression
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scaling benchmark of Mesh and spatial indices.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('run', help='run benchmark and write json.')
+    p.add_argument('--size', type=float, nargs='+', default=SIZE, help='numbers of cells, e.g. 1e3 1e7.')
+    p.add_argument('--kind', nargs='+', choices=KIND, default=KIND)
+    p.add_argument('--out', default='benchmark.json')
+    p.add_argument('--work-dir', default=None, help='directory for temporary files.')
+    p.add_argument('--ascii', action='store_true', help='write benchmark meshes as ASCII MSH.')
+    p.add_argument('--backend', nargs='+', choices=tuple(Index.BACKEND), default=('adt',),
+                   help='spatial index backends to time.')
+    p.add_argument('--baseline', default=None, help='compare with this json after running.')
+    p.add_argument('--threshold', type=float, default=0.25)
+    p = sub.add_parser('compare', help='compare json with a baseline json.')
+    p.add_argument('result')
+    p.add_argument('baseline')
+    p.add_argument('--threshold', type=float, default=0.25)
+    p.add_argument('--min-time', type=float, default=MIN_TIME)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        result = run(args.size, args.kind, args.work_dir, not args.ascii, args.backend)
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=1)
+        if args.baseline is None:
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regression = compare(result, baseline, args.threshold)
+    else:
+        with open(args.result) as f:
+            result = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regression = compare(result, baseline, args.threshold, args.min_time)
+
+    for kind, n_cell, metric, old, new, ratio in regression:
+        print('REGRESSION %-12s %9i cells  %-30s %10.4g -> %10.4g  (x%.2f)' % (kind, n_cell, metric, old, new, ratio))
+    return 1 if regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
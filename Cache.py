@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from ADT import ADT, TREE_ARRAY
+from Mesh import Mesh
+
+# version of the cache layout. caches of other versions are rebuilt.
+VERSION = 1
+
+# arrays of Mesh which are cached. arrays of ADT are listed in ADT.TREE_ARRAY.
+MESH_ARRAY = ('coord', 'cell_point', 'cell_n_point', 'cell_tag', 'bface_point', 'bface_tag', 'bface_wall',
+              'bface_cell', 'iface_point', 'iface_cell', 'cell_nei', 'cell_bface', 'cell_iface')
+
+# size of chunks in which source files are hashed.
+HASH_CHUNK = 1 << 24
+
+
+def file_hash(file_name):
+    """
+    :return: hex digest of the content of file.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(file_name, option):
+    """
+    Key of a cache entry from the content of the source file, build options and cache version.
+
+    :param option: dict of build options. must be serializable to json.
+    :return: hex string.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(file_hash(file_name).encode())
+    h.update(json.dumps(option, sort_keys=True).encode())
+    h.update(str(VERSION).encode())
+    return h.hexdigest()
+
+
+def save(directory, array, header):
+    """
+    Write arrays as raw .npy files and a json header. Files are written to a temporary directory which is renamed
+    at the end, so an entry either exists completely or not at all. An existing entry which cannot be loaded is
+    replaced.
+
+    :param directory: directory of cache entry.
+    :param array: dict of name to array.
+    :param header: dict stored in header.json in addition to version and array layout.
+    :rtype: None
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        layout = dict()
+        for name, a in array.items():
+            a = np.ascontiguousarray(a)
+            np.save(os.path.join(tmp, name + '.npy'), a)
+            layout[name] = {'shape': list(a.shape), 'dtype': a.dtype.str}
+        with open(os.path.join(tmp, 'header.json'), 'w') as f:
+            json.dump(dict(header, version=VERSION, array=layout), f, indent=1)
+        if os.path.isdir(directory) and load(directory) is None:
+            # a corrupt or partial entry, or one of another version. move it aside so the new entry replaces it.
+            stale = tempfile.mkdtemp(dir=parent)
+            try:
+                os.rename(directory, os.path.join(stale, 'entry'))
+            except OSError:
+                # another process removed or replaced it first.
+                pass
+            shutil.rmtree(stale, ignore_errors=True)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            # another process wrote the same entry first.
+            shutil.rmtree(tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load(directory):
+    """
+    Memory-map arrays of a cache entry. Pages are read only when touched. Arrays are copy-on-write, so modifying
+    them does not change the cache.
+
+    :param directory: directory of cache entry.
+    :return: header and dict of name to array, or None if entry does not exist, has another version or is corrupt.
+    """
+    try:
+        with open(os.path.join(directory, 'header.json')) as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get('version') != VERSION:
+        return None
+    array = dict()
+    try:
+        for name in header['array']:
+            array[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode='c')
+    except (OSError, ValueError, KeyError, TypeError):
+        # partial or corrupt entry.
+        return None
+    return header, array
+
+
+def load_mesh(file_name, cache_dir, tree=False):
+    """
+    Load mesh, its topology and optionally the ADT of its cells from cache. Read, build and cache them if the source
+    file or the options changed.
+
+    :param file_name: GMSH file.
+    :param cache_dir: directory holding cache entries.
+    :param tree: whether to build and cache ADT of cell boxes.
+    :return: Mesh and ADT, or Mesh and None if tree is False.
+    """
+    option = {'tree': bool(tree)}
+    directory = os.path.join(cache_dir, cache_key(file_name, option))
+    entry = load(directory)
+    if entry is None:
+        mesh = Mesh(file_name)
+        array = {name: getattr(mesh, name) for name in MESH_ARRAY}
+        adt = None
+        if tree:
+            adt = ADT(2)
+            adt.build_from_boxes(mesh.cell_box())
+            array.update({'tree_' + name: getattr(adt, name) for name in TREE_ARRAY})
+        save(directory, array, {'source': os.path.abspath(file_name), 'option': option})
+        return mesh, adt
+
+    header, array = entry
+    mesh = Mesh()
+    for name in MESH_ARRAY:
+        setattr(mesh, name, array[name])
+    adt = None
+    if tree:
+        adt = ADT(2)
+        for name in TREE_ARRAY:
+            setattr(adt, name, array['tree_' + name])
+    return mesh, adt
@@ -0,0 +1,208 @@
+import numpy as np
+import scipy.sparse as sparse
+
+import Geometry
+from Index import build_index
+
+# maximum number of cells crossed by a walk before falling back to the tree search.
+MAX_STEP = 32
+
+# locations of values interpolated by interpolation matrices.
+LOCATION = ('point', 'cell')
+
+
+class DonorSearch:
+    """
+    Find cells of a mesh containing receptor points and interpolation weights of their vertices.
+    Candidate cells come from the boxes of a spatial index, an ADT by default. Containment is confirmed by mapping
+    points to local coordinates of candidates: barycentric for triangles, inverse bilinear for quads.
+    With a guess, e.g. donors of the previous time step, points walk through cell neighbors towards their donors
+    and only those which leave the mesh or exceed the step limit are searched in the tree.
+    """
+    def __init__(self, mesh, tree=None, backend='adt'):
+        """
+        :param mesh: Mesh providing donor cells.
+        :param tree: SpatialIndex built from mesh.cell_box(). built if None. if the mesh moves rigidly afterwards, set
+                     the motion with tree.set_transform and keep this object; points are mapped to the reference frame.
+        :param backend: backend of the index built if tree is None. see Index.build_index.
+        """
+        self.mesh = mesh
+        self.polygon = mesh.cell_polygon()
+        self.triangle = mesh.cell_n_point == 3
+        if tree is None:
+            tree = build_index(mesh.cell_box(), 2, backend)
+        self.tree = tree
+        # +1 for counter-clockwise, -1 for clockwise cells. flips edge normals outward.
+        self.orientation = np.where(Geometry.signed_area(self.polygon) < 0, -1.0, 1.0)
+        self.n_hit = 0  # number of points whose donor is found by walking in the last search.
+        self.n_fallback = 0  # number of points searched in the tree in the last search.
+
+    @property
+    def hit_ratio(self):
+        """
+        Fraction of points of the last search whose donor is found by walking.
+        """
+        n = self.n_hit + self.n_fallback
+        return self.n_hit / n if n else 0.0
+
+    def locate(self, point, cell, tol=Geometry.TOL):
+        """
+        Check whether points lie in given cells.
+
+        :param point: (n, 2) points.
+        :param cell: (n,) cells.
+        :param tol: tolerance in local coordinates.
+        :return: (n,) bool array of points inside and (n, 4) weights of cell vertices.
+        """
+        triangle = self.triangle[cell]
+        local, converged = Geometry.local_coord(self.polygon[cell], point, triangle)
+        inside = converged & Geometry.inside_local(local, triangle, tol)
+        return inside, Geometry.shape_function(local, triangle)
+
+    def search(self, point, tol=Geometry.TOL, guess=None, max_step=MAX_STEP):
+        """
+        Find donor cells of receptor points.
+
+        :param point: (n, 2) receptor points.
+        :param tol: tolerance in local coordinates.
+        :param guess: (n,) cells to start walking from, e.g. donors of the previous time step. -1 or None searches
+                      the tree directly.
+        :param max_step: maximum number of cells crossed by a walk.
+        :return: (n,) donor cells or -1 where no cell contains the point, and (n, 4) weights of the vertices of
+                 donors in the order of mesh.cell_point. weights are zero where there is no donor.
+        """
+        point = np.asarray(point, dtype=np.float64).reshape(-1, 2)
+        if guess is None:
+            self.n_hit = 0
+            self.n_fallback = len(point)
+            return self.search_tree(point, tol)
+        donor, weight = self.walk(point, np.asarray(guess, dtype=np.int64), tol, max_step)
+        fallback = np.flatnonzero(donor < 0)
+        self.n_hit = len(point) - len(fallback)
+        self.n_fallback = len(fallback)
+        if len(fallback):
+            donor[fallback], weight[fallback] = self.search_tree(point[fallback], tol)
+        return donor, weight
+
+    def walk(self, point, guess, tol=Geometry.TOL, max_step=MAX_STEP):
+        """
+        Walk from guessed cells towards the cells containing points. At each step a point crosses the face of its
+        current cell which it lies farthest outside of.
+
+        :param point: (n, 2) points.
+        :param guess: (n,) cells to start from. -1 for no guess.
+        :param tol: tolerance in local coordinates.
+        :param max_step: maximum number of cells crossed.
+        :return: donor cells and weights as in search. donor is -1 where the walk left the mesh, exceeded max_step
+                 or had no guess.
+        """
+        point = self.tree.to_reference(point)
+        n = len(point)
+        donor = np.full(n, -1, dtype=np.int64)
+        weight = np.zeros((n, 4))
+        active = np.flatnonzero(guess >= 0)
+        cell = guess[active]
+        for _ in range(max_step + 1):
+            if len(active) == 0:
+                break
+            p = point[active]
+            poly = self.polygon[cell]
+            # signed distance of point to the line of each edge. positive outside.
+            edge = np.roll(poly, -1, axis=1) - poly
+            length = np.hypot(edge[:, :, 0], edge[:, :, 1])
+            normal = np.stack((edge[:, :, 1], -edge[:, :, 0]), axis=-1) * self.orientation[cell][:, None, None]
+            dist = np.sum((p[:, None] - poly) * normal, axis=2) / np.where(length > 0, length, 1)
+            dist[length == 0] = -np.inf
+            edge_index = np.argmax(dist, axis=1)
+            outside = dist[np.arange(len(cell)), edge_index] > 0
+
+            # points inside all edges: confirm with local coordinates.
+            check = np.flatnonzero(~outside)
+            inside, w = self.locate(p[check], cell[check], tol)
+            donor[active[check[inside]]] = cell[check[inside]]
+            weight[active[check[inside]]] = w[inside]
+
+            # the others cross the farthest edge. the padded fourth edge of a triangle is its third face.
+            move = np.flatnonzero(outside)
+            face = edge_index[move]
+            face = np.where(self.triangle[cell[move]] & (face == 3), 2, face)
+            nei = self.mesh.cell_nei[cell[move], face]
+            stay = nei >= 0
+            active = active[move[stay]]
+            cell = nei[stay]
+        return donor, weight
+
+    def search_tree(self, point, tol=Geometry.TOL):
+        """
+        Find donor cells of receptor points in the tree. If a point lies in several cells, e.g. on a shared face, the
+        cell with the smallest index is the donor.
+
+        :param point: (n, 2) receptor points.
+        :param tol: tolerance in local coordinates.
+        :return: (n,) donor cells or -1 where no cell contains the point, and (n, 4) weights of the vertices of
+                 donors in the order of mesh.cell_point. weights are zero where there is no donor.
+        """
+        point = np.asarray(point, dtype=np.float64).reshape(-1, 2)
+        n = len(point)
+        donor = np.full(n, -1, dtype=np.int64)
+        weight = np.zeros((n, 4))
+        offset, index = self.tree.search_points(point)
+        point = self.tree.to_reference(point)
+        row = np.repeat(np.arange(n), np.diff(offset))
+        inside, w = self.locate(point[row], index, tol)
+        # rows are sorted and candidates of each row are sorted by cell. keep the first hit of each row.
+        hit_row, first = np.unique(row[inside], return_index=True)
+        hit = np.flatnonzero(inside)[first]
+        donor[hit_row] = index[hit]
+        weight[hit_row] = w[hit]
+        return donor, weight
+
+    def interpolate(self, donor, weight, value):
+        """
+        Interpolate point values of the mesh to receptors.
+
+        :param donor: (n,) donor cells from search.
+        :param weight: (n, 4) weights from search.
+        :param value: (n_point,) or (n_point, m) values at mesh points.
+        :return: (n,) or (n, m) interpolated values. zero where there is no donor.
+        """
+        value = np.asarray(value)
+        vertex = self.mesh.cell_point[np.maximum(donor, 0)]
+        vertex = np.where(vertex >= 0, vertex, 0)
+        w = np.where(donor[:, None] >= 0, weight, 0)
+        if value.ndim == 1:
+            return np.sum(w * value[vertex], axis=1)
+        return np.einsum('nk,nkm->nm', w, value[vertex])
+
+    def matrix(self, donor, weight, location='point'):
+        """
+        Interpolation operator of receptors as a sparse matrix. Interpolating one or many fields is then a single
+        product matrix @ value, which is much faster than interpolate when the same donors are used repeatedly.
+
+        :param donor: (n,) donor cells from search.
+        :param weight: (n, 4) weights from search.
+        :param location: 'point' interpolates values at mesh points with the weights. 'cell' takes values of donor
+                         cells.
+        :return: (n, n_point) or (n, n_cell) scipy.sparse.csr_matrix. rows of receptors without donor are empty.
+        :error: if location is unknown raise ValueError.
+        """
+        donor = np.asarray(donor, dtype=np.int64)
+        n = len(donor)
+        row = np.flatnonzero(donor >= 0)
+        donor = donor[row]
+        if location == 'point':
+            col = self.mesh.cell_point[donor]
+            data = np.asarray(weight)[row]
+            # padded vertices of triangles and vertices with zero weight are not stored.
+            keep = (col >= 0) & (data != 0)
+            row = np.broadcast_to(row[:, None], col.shape)[keep]
+            col = col[keep]
+            data = data[keep]
+            n_col = len(self.mesh.coord)
+        elif location == 'cell':
+            col = donor
+            data = np.ones(len(donor))
+            n_col = len(self.mesh.cell_point)
+        else:
+            raise ValueError('location must be one of %s.' % ', '.join(LOCATION))
+        return sparse.csr_matrix((data, (row, col)), shape=(n, n_col))
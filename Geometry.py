@@ -0,0 +1,346 @@
+import numpy as np
+
+# distance below which separated polygons are still considered overlapping.
+TOL = 0.0
+
+
+def polygon(coord, cell_point):
+    """
+    Vertex coordinates of triangles and quads as a fixed size array.
+
+    :param coord: (n_point, 2) coordinates.
+    :param cell_point: (n, k) vertices. k <= 4. -1 pads unused entries.
+    :return: (n, 4, 2) array. the last vertex of a triangle is repeated so that its fourth edge has zero length.
+    """
+    cell_point = np.asarray(cell_point)
+    index = cell_point.copy()
+    for j in range(1, index.shape[1]):
+        index[:, j] = np.where(index[:, j] >= 0, index[:, j], index[:, j - 1])
+    if index.shape[1] < 4:
+        index = np.hstack([index] + [index[:, -1:]] * (4 - index.shape[1]))
+    return coord[index]
+
+
+def signed_area(poly):
+    """
+    :param poly: (n, 4, 2) polygons.
+    :return: (n,) signed areas. positive for counter-clockwise polygons.
+    """
+    x = poly[:, :, 0]
+    y = poly[:, :, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+
+
+def centroid(poly):
+    """
+    :param poly: (n, 4, 2) polygons. see polygon.
+    :return: (n, 2) area centroids. the average of vertices for degenerate polygons.
+    """
+    x = poly[:, :, 0]
+    y = poly[:, :, 1]
+    x1 = np.roll(x, -1, axis=1)
+    y1 = np.roll(y, -1, axis=1)
+    cross = x * y1 - x1 * y
+    area = 0.5 * cross.sum(axis=1)
+    c = np.stack((np.sum((x + x1) * cross, axis=1), np.sum((y + y1) * cross, axis=1)), axis=1)
+    degenerate = area == 0
+    c[~degenerate] /= 6 * area[~degenerate, None]
+    c[degenerate] = poly[degenerate].mean(axis=1)
+    return c
+
+
+def face_metric(a, b, inside):
+    """
+    Midpoints, unit normals and lengths of straight faces.
+
+    :param a: (n, 2) first vertices of faces.
+    :param b: (n, 2) second vertices of faces.
+    :param inside: (n, 2) points, e.g. cell centroids. normals point away from them.
+    :return: (n, 2) midpoints, (n, 2) unit normals and (n,) lengths. normals of faces of zero length are zero.
+    """
+    mid = 0.5 * (a + b)
+    edge = b - a
+    length = np.hypot(edge[:, 0], edge[:, 1])
+    normal = np.stack((edge[:, 1], -edge[:, 0]), axis=1) / np.where(length > 0, length, 1)[:, None]
+    flip = np.einsum('nd,nd->n', normal, mid - inside) < 0
+    normal[flip] *= -1
+    return mid, normal, length
+
+
+def counter_clockwise(poly):
+    """
+    :return: polygons with vertex order reversed where they are clockwise.
+    """
+    cw = signed_area(poly) < 0
+    if np.any(cw):
+        poly = poly.copy()
+        poly[cw] = poly[cw, ::-1]
+    return poly
+
+
+def turn(poly):
+    """
+    Cross product of incoming and outgoing edges at each vertex of counter-clockwise polygons.
+
+    :return: (n, 4) array. negative at reflex vertices. zero at repeated vertices.
+    """
+    incoming = poly - np.roll(poly, 1, axis=1)
+    outgoing = np.roll(poly, -1, axis=1) - poly
+    return incoming[:, :, 0] * outgoing[:, :, 1] - incoming[:, :, 1] * outgoing[:, :, 0]
+
+
+def is_convex(poly):
+    """
+    :param poly: (n, 4, 2) counter-clockwise polygons.
+    :return: (n,) bool array.
+    """
+    return np.all(turn(poly) >= 0, axis=1)
+
+
+def triangulate(poly):
+    """
+    Split counter-clockwise quads into two triangles along a diagonal which lies inside the quad.
+    The diagonal starts from the reflex vertex if any.
+
+    :param poly: (n, 4, 2) polygons.
+    :return: (n, 2, 4, 2) triangles in the padded form of polygon.
+    """
+    reflex = turn(poly) < 0
+    odd = reflex[:, 1] | reflex[:, 3]  # split along diagonal 1-3 instead of 0-2.
+    first = np.where(odd[:, None], [1, 2, 3, 3], [0, 1, 2, 2])
+    second = np.where(odd[:, None], [3, 0, 1, 1], [2, 3, 0, 0])
+    row = np.arange(len(poly))[:, None]
+    return np.stack((poly[row, first], poly[row, second]), axis=1)
+
+
+def sat_overlap(a, b, tol=TOL):
+    """
+    Separating axis test of pairs of convex polygons.
+
+    :param a: (n, k, 2) convex polygons. repeated vertices are allowed.
+    :param b: (n, l, 2) convex polygons.
+    :param tol: polygons closer than tol overlap. negative tol requires penetration deeper than -tol.
+    :return: (n,) bool array.
+    """
+    edge = np.concatenate((np.roll(a, -1, axis=1) - a, np.roll(b, -1, axis=1) - b), axis=1)
+    length = np.hypot(edge[:, :, 0], edge[:, :, 1])
+    valid = length > 0
+    length[~valid] = 1
+    axis = np.stack((-edge[:, :, 1], edge[:, :, 0]), axis=-1) / length[:, :, None]
+    proj_a = np.einsum('nkd,nvd->nkv', axis, a)
+    proj_b = np.einsum('nkd,nvd->nkv', axis, b)
+    separated = (proj_a.max(axis=2) < proj_b.min(axis=2) - tol) | (proj_b.max(axis=2) < proj_a.min(axis=2) - tol)
+    return ~np.any(separated & valid, axis=1)
+
+
+def overlap(a, b, tol=TOL):
+    """
+    Exact overlap test of pairs of triangles or quads.
+
+    Convex pairs are tested with the separating axis theorem directly. Pairs with a non-convex quad are split into
+    triangles and overlap if any pair of triangles does.
+    :param a: (n, 4, 2) polygons. see polygon.
+    :param b: (n, 4, 2) polygons.
+    :param tol: polygons closer than tol overlap. negative tol requires penetration deeper than -tol.
+    :return: (n,) bool array.
+    """
+    a = counter_clockwise(np.asarray(a, dtype=np.float64))
+    b = counter_clockwise(np.asarray(b, dtype=np.float64))
+    result = np.empty(len(a), dtype=bool)
+    convex = is_convex(a) & is_convex(b)
+    result[convex] = sat_overlap(a[convex], b[convex], tol)
+    other = np.flatnonzero(~convex)
+    if len(other):
+        ta = triangulate(a[other])
+        tb = triangulate(b[other])
+        hit = np.zeros(len(other), dtype=bool)
+        for i in range(2):
+            for j in range(2):
+                hit |= sat_overlap(ta[:, i], tb[:, j], tol)
+        result[other] = hit
+    return result
+
+
+def shape_function(local, triangle):
+    """
+    Interpolation weights of polygon vertices at local coordinates.
+
+    :param local: (n, 2) local coordinates.
+    :param triangle: (n,) bool array. barycentric weights for triangles, bilinear weights for quads.
+    :return: (n, 4) weights. the weight of the padded fourth vertex of triangles is zero.
+    """
+    xi = local[:, 0]
+    eta = local[:, 1]
+    bilinear = np.stack(((1 - xi) * (1 - eta), xi * (1 - eta), xi * eta, (1 - xi) * eta), axis=1)
+    barycentric = np.stack((1 - xi - eta, xi, eta, np.zeros_like(xi)), axis=1)
+    return np.where(triangle[:, None], barycentric, bilinear)
+
+
+def local_coord(poly, point, triangle, n_iter=20, eps=1e-12):
+    """
+    Map points to local coordinates of polygons. Triangles are inverted exactly. Quads are inverted with Newton
+    iterations of the bilinear map starting from the center.
+
+    :param poly: (n, 4, 2) polygons in the vertex order of the mesh. see polygon.
+    :param point: (n, 2) points.
+    :param triangle: (n,) bool array.
+    :param n_iter: maximum number of Newton iterations.
+    :param eps: convergence tolerance of Newton iterations.
+    :return: (n, 2) local coordinates and (n,) bool array of converged points.
+    """
+    n = len(point)
+    local = np.full((n, 2), 0.5)
+    converged = np.zeros(n, dtype=bool)
+
+    # triangles: solve x = x0 + xi (x1 - x0) + eta (x2 - x0).
+    tri = np.flatnonzero(triangle)
+    if len(tri):
+        jac = np.stack((poly[tri, 1] - poly[tri, 0], poly[tri, 2] - poly[tri, 0]), axis=2)
+        det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+        ok = det != 0
+        r = point[tri] - poly[tri, 0]
+        local[tri, 0] = (jac[:, 1, 1] * r[:, 0] - jac[:, 0, 1] * r[:, 1]) / np.where(ok, det, 1)
+        local[tri, 1] = (jac[:, 0, 0] * r[:, 1] - jac[:, 1, 0] * r[:, 0]) / np.where(ok, det, 1)
+        converged[tri] = ok
+
+    # quads: newton iterations on the bilinear map.
+    quad = np.flatnonzero(~triangle)
+    p = poly[quad]
+    x = point[quad]
+    for _ in range(n_iter):
+        if len(quad) == 0:
+            break
+        xi = local[quad, 0:1]
+        eta = local[quad, 1:2]
+        r = ((1 - xi) * (1 - eta) * p[:, 0] + xi * (1 - eta) * p[:, 1] + xi * eta * p[:, 2]
+             + (1 - xi) * eta * p[:, 3]) - x
+        d_xi = (1 - eta) * (p[:, 1] - p[:, 0]) + eta * (p[:, 2] - p[:, 3])
+        d_eta = (1 - xi) * (p[:, 3] - p[:, 0]) + xi * (p[:, 2] - p[:, 1])
+        det = d_xi[:, 0] * d_eta[:, 1] - d_xi[:, 1] * d_eta[:, 0]
+        ok = det != 0
+        det = np.where(ok, det, 1)
+        step_xi = (d_eta[:, 1] * r[:, 0] - d_eta[:, 0] * r[:, 1]) / det
+        step_eta = (d_xi[:, 0] * r[:, 1] - d_xi[:, 1] * r[:, 0]) / det
+        local[quad, 0] -= np.where(ok, step_xi, 0)
+        local[quad, 1] -= np.where(ok, step_eta, 0)
+        done = ok & (np.abs(step_xi) + np.abs(step_eta) < eps)
+        converged[quad[done]] = True
+        quad = quad[~done & ok]
+        p = p[~done & ok]
+        x = x[~done & ok]
+    return local, converged
+
+
+def inside_local(local, triangle, tol=TOL):
+    """
+    :param local: (n, 2) local coordinates.
+    :param triangle: (n,) bool array.
+    :param tol: tolerance in local coordinates. points this far outside of the reference element are inside.
+    :return: (n,) bool array of points inside the reference triangle or square.
+    """
+    inside = np.all((local >= -tol) & (local <= 1 + tol), axis=1)
+    return inside & (~triangle | (local.sum(axis=1) <= 1 + tol))
+
+
+def convex_hull(point):
+    """
+    Convex hull of a set of points with the monotone chain algorithm.
+
+    :param point: (m, 2) points.
+    :return: (h, 2) counter-clockwise hull vertices without collinear points.
+    """
+    point = np.unique(np.asarray(point, dtype=np.float64).reshape(-1, 2), axis=0)  # sorted by x then y.
+    if len(point) < 3:
+        return point
+
+    def chain(p):
+        h = list()
+        for q in p:
+            while len(h) >= 2 and ((h[-1][0] - h[-2][0]) * (q[1] - h[-2][1])
+                                   - (h[-1][1] - h[-2][1]) * (q[0] - h[-2][0])) <= 0:
+                h.pop()
+            h.append(q)
+        return h[:-1]
+
+    return np.array(chain(point) + chain(point[::-1]))
+
+
+def min_area_rect(point, direction):
+    """
+    Rectangle of minimum area enclosing points with a side parallel to one of the given directions.
+
+    :param point: (n, m, 2) point sets.
+    :param direction: (n, l, 2) candidate directions of each set. zero directions are ignored.
+    :return: (n, 2) centers, (n, 2, 2) unit axes as rows and (n, 2) half extents along axes.
+    """
+    length = np.hypot(direction[:, :, 0], direction[:, :, 1])
+    u = direction / np.where(length > 0, length, 1)[:, :, None]
+    v = np.stack((-u[:, :, 1], u[:, :, 0]), axis=-1)
+    pu = np.einsum('nld,nmd->nlm', u, point)
+    pv = np.einsum('nld,nmd->nlm', v, point)
+    u_min, u_max = pu.min(axis=2), pu.max(axis=2)
+    v_min, v_max = pv.min(axis=2), pv.max(axis=2)
+    area = np.where(length > 0, (u_max - u_min) * (v_max - v_min), np.inf)
+    best = np.argmin(area, axis=1)
+    row = np.arange(len(point))
+    if not np.all(np.isfinite(area[row, best])):
+        # all points coincide. use coordinate axes.
+        u[row, best] = np.where(np.isfinite(area[row, best])[:, None], u[row, best], [1.0, 0.0])
+        v[row, best] = np.where(np.isfinite(area[row, best])[:, None], v[row, best], [0.0, 1.0])
+    axis = np.stack((u[row, best], v[row, best]), axis=1)
+    mid_u = 0.5 * (u_min[row, best] + u_max[row, best])
+    mid_v = 0.5 * (v_min[row, best] + v_max[row, best])
+    center = mid_u[:, None] * axis[:, 0] + mid_v[:, None] * axis[:, 1]
+    half = 0.5 * np.stack((u_max[row, best] - u_min[row, best], v_max[row, best] - v_min[row, best]), axis=1)
+    return center, axis, half
+
+
+def obb(poly):
+    """
+    Minimum area oriented bounding boxes of small polygons.
+
+    The minimum area rectangle has a side on an edge of the convex hull (rotating calipers). Every hull edge of a
+    triangle or quad joins two of its vertices, so all vertex pairs are tried as directions.
+    :param poly: (n, k, 2) polygons. see polygon.
+    :return: (n, 2) centers, (n, 2, 2) unit axes as rows and (n, 2) half extents along axes.
+    """
+    poly = np.asarray(poly, dtype=np.float64)
+    i, j = np.triu_indices(poly.shape[1], 1)
+    return min_area_rect(poly, poly[:, j] - poly[:, i])
+
+
+def obb_overlap(a, b, tol=TOL):
+    """
+    Separating axis test of pairs of oriented boxes.
+
+    :param a: (center, axis, half) arrays of boxes as returned by obb.
+    :param b: (center, axis, half) arrays of boxes.
+    :param tol: boxes closer than tol overlap.
+    :return: (n,) bool array.
+    """
+    ca, aa, ha = a
+    cb, ab, hb = b
+    d = cb - ca
+    separated = np.zeros(len(d), dtype=bool)
+    for axis in (aa[:, 0], aa[:, 1], ab[:, 0], ab[:, 1]):
+        ra = np.sum(ha * np.abs(np.einsum('nkd,nd->nk', aa, axis)), axis=1)
+        rb = np.sum(hb * np.abs(np.einsum('nkd,nd->nk', ab, axis)), axis=1)
+        separated |= np.abs(np.sum(d * axis, axis=1)) > ra + rb + tol
+    return ~separated
+
+
+def point_segment_distance(point, a, b):
+    """
+    Distances of pairs of points and segments.
+
+    :param point: (n, dim) points.
+    :param a: (n, dim) first end points of segments.
+    :param b: (n, dim) second end points of segments.
+    :return: (n,) distances.
+    """
+    ab = b - a
+    ap = point - a
+    length2 = np.einsum('nd,nd->n', ab, ab)
+    t = np.einsum('nd,nd->n', ap, ab) / np.where(length2 > 0, length2, 1)
+    d = ap - np.clip(t, 0, 1)[:, None] * ab
+    return np.sqrt(np.einsum('nd,nd->n', d, d))
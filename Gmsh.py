@@ -0,0 +1,575 @@
+import mmap
+import struct
+
+import numpy as np
+
+# number of nodes of GMSH element types.
+ELEMENT_NODE = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9, 11: 10, 12: 27, 13: 18, 14: 14, 15: 1,
+                16: 8, 17: 20, 18: 15, 19: 13}
+
+# default memory budget of a chunk of stream in bytes.
+MEMORY = 64 << 20
+
+# bytes of memory per node or element record while a chunk is parsed. an upper estimate for text and arrays.
+RECORD_BYTES = 128
+
+
+class GmshData:
+    """
+    Arrays read from a GMSH file. Elements are grouped by type.
+    """
+    def __init__(self, node_tag, coord, element):
+        """
+        :param node_tag: (n_node,) int array of GMSH node tags.
+        :param coord: (n_node, 3) float array of node coordinates.
+        :param element: dict of element type to (element tag, physical tag, node tag connectivity) arrays.
+        """
+        self.node_tag = node_tag
+        self.coord = coord
+        self.element = element
+
+    def node_index(self, tag):
+        """
+        Convert GMSH node tags to zero-based indices of coord.
+
+        :param tag: int array of node tags.
+        :return: int array of the same shape.
+        """
+        lookup = np.full(int(self.node_tag.max(initial=0)) + 1, -1, dtype=np.int64)
+        lookup[self.node_tag] = np.arange(len(self.node_tag))
+        return lookup[tag]
+
+
+def read(file_name):
+    """
+    Read a mesh file generated by GMSH. MSH 2.2 and 4.1 are supported in both ASCII and binary form.
+    Sections are located in a memory-mapped view of the file and parsed in bulk.
+
+    :param file_name: name of file to read.
+    :return: GmshData
+    :error: if the version is not supported or an element type is unknown raise ValueError.
+    """
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            version, binary, size, order = read_format(mm)
+            if version.startswith('2'):
+                reader = read_v2_binary if binary else read_v2_ascii
+            elif version.startswith('4'):
+                reader = read_v4_binary if binary else read_v4_ascii
+            else:
+                raise ValueError('unsupported MSH version %s.' % version)
+            return reader(mm, size, order)
+        finally:
+            mm.close()
+
+
+def section(mm, name):
+    """
+    Locate the content of a section.
+
+    :param mm: memory-mapped file.
+    :param name: name of section without '$'.
+    :return: start and end byte offsets of the content or None if the section does not exist.
+    """
+    start = mm.find(b'$' + name.encode())
+    if start < 0:
+        return None
+    start = mm.find(b'\n', start) + 1
+    end = mm.find(b'$End' + name.encode(), start)
+    return start, end
+
+
+def read_line(mm, start):
+    """
+    :return: the line starting at start and the offset of the next line.
+    """
+    end = mm.find(b'\n', start)
+    return mm[start:end].decode(), end + 1
+
+
+def read_format(mm):
+    """
+    :return: version string, whether file is binary, data size and byte order of binary data.
+    """
+    start, end = section(mm, 'MeshFormat')
+    line, start = read_line(mm, start)
+    version, file_type, size = line.split()
+    binary = file_type == '1'
+    order = '<'
+    if binary:
+        # integer 1 is written in binary to detect endianness.
+        if struct.unpack_from('<i', mm, start)[0] != 1:
+            order = '>'
+    return version, binary, int(size), order
+
+
+def token_per_line(buf):
+    """
+    Count whitespace separated tokens of every non-empty line.
+
+    :param buf: bytes.
+    :return: int array.
+    """
+    b = np.frombuffer(buf, dtype=np.uint8)
+    space = (b == 32) | (b == 9) | (b == 10) | (b == 13)
+    start = ~space
+    start[1:] &= space[:-1]
+    line = np.searchsorted(np.flatnonzero(b == 10), np.flatnonzero(start))
+    count = np.bincount(line)
+    return count[count > 0]
+
+
+def group_element(tag, etype, phys, start, flat):
+    """
+    Group element records of a flat int array by type.
+
+    :param start: offset of the first node of each record in flat.
+    :return: dict of element type to (element tag, physical tag, node tag connectivity).
+    """
+    element = dict()
+    for t in np.unique(etype):
+        if int(t) not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % t)
+        i = np.flatnonzero(etype == t)
+        node = flat[start[i][:, None] + np.arange(ELEMENT_NODE[int(t)])]
+        element[int(t)] = (tag[i], phys[i], node)
+    return element
+
+
+def merge_element(block):
+    """
+    Concatenate element blocks of the same type.
+
+    :param block: list of (type, element tag, physical tag, node tag connectivity).
+    :return: dict of element type to (element tag, physical tag, node tag connectivity).
+    """
+    element = dict()
+    for t in sorted(set(b[0] for b in block)):
+        same = [b[1:] for b in block if b[0] == t]
+        element[t] = tuple(np.concatenate([s[_] for s in same]) for _ in range(3))
+    return element
+
+
+def read_v2_ascii(mm, size, order):
+    start, end = section(mm, 'Nodes')
+    line, start = read_line(mm, start)
+    node = np.fromstring(mm[start:end], sep=' ').reshape(int(line), 4)
+
+    start, end = section(mm, 'Elements')
+    line, start = read_line(mm, start)
+    return GmshData(node[:, 0].astype(np.int64), node[:, 1:], parse_v2_element(mm[start:end]))
+
+
+def parse_v2_element(buf):
+    """
+    Parse element records of MSH 2.2 ASCII format.
+
+    :param buf: bytes of whole lines of records.
+    :return: dict of element type to (element tag, physical tag, node tag connectivity).
+    """
+    flat = np.fromstring(buf, dtype=np.int64, sep=' ')
+    # records have variable length. each record is on its own line.
+    count = token_per_line(buf)
+    offset = np.zeros(len(count), dtype=np.int64)
+    np.cumsum(count[:-1], out=offset[1:])
+    # record: tag, type, number of tags, tags..., nodes...
+    n_tag = flat[offset + 2]
+    phys = np.where(n_tag > 0, flat[np.minimum(offset + 3, len(flat) - 1)], 0)
+    return group_element(flat[offset], flat[offset + 1], phys, offset + 3 + n_tag, flat)
+
+
+def read_v2_binary(mm, size, order):
+    start, end = section(mm, 'Nodes')
+    line, start = read_line(mm, start)
+    dtype = np.dtype([('tag', order + 'i4'), ('coord', order + 'f8', 3)])
+    node = np.frombuffer(mm, dtype=dtype, count=int(line), offset=start)
+    node_tag = node['tag'].astype(np.int64)
+    coord = node['coord'].astype(np.float64)
+    del node
+
+    start, end = section(mm, 'Elements')
+    line, start = read_line(mm, start)
+    n = int(line)
+    block = list()
+    while n > 0:
+        # header: type, number of elements following, number of tags.
+        etype, n_follow, n_tag = struct.unpack_from(order + '3i', mm, start)
+        start += 12
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + n_tag + ELEMENT_NODE[etype]
+        data = np.frombuffer(mm, dtype=order + 'i4', count=n_follow * width, offset=start)
+        data = data.reshape(n_follow, width).astype(np.int64)
+        phys = data[:, 1] if n_tag > 0 else np.zeros(n_follow, dtype=np.int64)
+        block.append((etype, data[:, 0], phys, data[:, 1 + n_tag:]))
+        start += 4 * n_follow * width
+        n -= n_follow
+    return GmshData(node_tag, coord, merge_element(block))
+
+
+def read_v4_entity_ascii(mm):
+    """
+    :return: dict of (dimension, entity tag) to the first physical tag of entity.
+    """
+    physical = dict()
+    s = section(mm, 'Entities')
+    if s is None:
+        return physical
+    flat = np.fromstring(mm[s[0]:s[1]], sep=' ')
+    count = flat[:4].astype(np.int64)
+    i = 4
+    for dim in range(4):
+        for _ in range(count[dim]):
+            tag = int(flat[i])
+            i += 4 if dim == 0 else 7  # tag and coordinates or bounding box.
+            n_phys = int(flat[i])
+            if n_phys > 0:
+                physical[(dim, tag)] = int(flat[i + 1])
+            i += 1 + n_phys
+            if dim > 0:
+                i += 1 + int(flat[i])  # bounding entities.
+    return physical
+
+
+def read_v4_entity_binary(mm, size, order):
+    physical = dict()
+    s = section(mm, 'Entities')
+    if s is None:
+        return physical
+    st = order + ('Q' if size == 8 else 'I')
+    start = s[0]
+    count = struct.unpack_from(order + 4 * st[-1], mm, start)
+    start += 4 * size
+    for dim in range(4):
+        for _ in range(count[dim]):
+            tag = struct.unpack_from(order + 'i', mm, start)[0]
+            start += 4 + (3 if dim == 0 else 6) * 8
+            n_phys = struct.unpack_from(st, mm, start)[0]
+            start += size
+            if n_phys > 0:
+                physical[(dim, tag)] = struct.unpack_from(order + 'i', mm, start)[0]
+            start += 4 * n_phys
+            if dim > 0:
+                n_bound = struct.unpack_from(st, mm, start)[0]
+                start += size + 4 * n_bound
+    return physical
+
+
+def read_v4_ascii(mm, size, order):
+    physical = read_v4_entity_ascii(mm)
+
+    start, end = section(mm, 'Nodes')
+    flat = np.fromstring(mm[start:end], sep=' ')
+    i = 4
+    node_tag = list()
+    coord = list()
+    for _ in range(int(flat[0])):
+        # block header: entity dimension, entity tag, parametric, number of nodes.
+        dim, parametric, n = int(flat[i]), int(flat[i + 2]), int(flat[i + 3])
+        i += 4
+        node_tag.append(flat[i:i + n].astype(np.int64))
+        i += n
+        width = 3 + (dim if parametric else 0)
+        coord.append(flat[i:i + n * width].reshape(n, width)[:, :3])
+        i += n * width
+
+    start, end = section(mm, 'Elements')
+    flat = np.fromstring(mm[start:end], dtype=np.int64, sep=' ')
+    i = 4
+    block = list()
+    for _ in range(int(flat[0])):
+        # block header: entity dimension, entity tag, element type, number of elements.
+        dim, tag, etype, n = (int(_) for _ in flat[i:i + 4])
+        i += 4
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + ELEMENT_NODE[etype]
+        data = flat[i:i + n * width].reshape(n, width)
+        block.append((etype, data[:, 0], np.full(n, physical.get((dim, tag), 0), dtype=np.int64), data[:, 1:]))
+        i += n * width
+    return GmshData(np.concatenate(node_tag), np.concatenate(coord), merge_element(block))
+
+
+def read_v4_binary(mm, size, order):
+    physical = read_v4_entity_binary(mm, size, order)
+    st = order + ('u8' if size == 8 else 'u4')
+    header = order + '3i' + ('Q' if size == 8 else 'I')
+
+    start, end = section(mm, 'Nodes')
+    n_block = int(np.frombuffer(mm, dtype=st, count=4, offset=start)[0])
+    start += 4 * size
+    node_tag = list()
+    coord = list()
+    for _ in range(n_block):
+        dim, tag, parametric, n = struct.unpack_from(header, mm, start)
+        start += 12 + size
+        node_tag.append(np.frombuffer(mm, dtype=st, count=n, offset=start).astype(np.int64))
+        start += n * size
+        width = 3 + (dim if parametric else 0)
+        coord.append(np.frombuffer(mm, dtype=order + 'f8', count=n * width, offset=start).reshape(n, width)[:, :3]
+                     .astype(np.float64))
+        start += 8 * n * width
+
+    start, end = section(mm, 'Elements')
+    n_block = int(np.frombuffer(mm, dtype=st, count=4, offset=start)[0])
+    start += 4 * size
+    block = list()
+    for _ in range(n_block):
+        dim, tag, etype, n = struct.unpack_from(header, mm, start)
+        start += 12 + size
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + ELEMENT_NODE[etype]
+        data = np.frombuffer(mm, dtype=st, count=n * width, offset=start).reshape(n, width).astype(np.int64)
+        block.append((etype, data[:, 0], np.full(n, physical.get((dim, tag), 0), dtype=np.int64), data[:, 1:]))
+        start += n * width * size
+    return GmshData(np.concatenate(node_tag), np.concatenate(coord), merge_element(block))
+
+
+def stream(file_name, memory=MEMORY):
+    """
+    Read a mesh file generated by GMSH in chunks. Formats are the ones of read.
+    Only one chunk is parsed at a time, so memory does not grow with the file, and chunks can be processed before the
+    whole file is read.
+
+    Items are yielded in this order:
+        ('header', number of nodes, number of elements)
+        ('node', node tags, (n, 3) coordinates) for chunks of nodes in file order.
+        ('element', element type, element tags, physical tags, node tag connectivity) for chunks of elements of the
+        same type in file order.
+    :param file_name: name of file to read.
+    :param memory: approximate memory of a chunk in bytes.
+    :return: generator of items.
+    :error: if the version is not supported or an element type is unknown raise ValueError.
+    """
+    n_record = max(1, memory // RECORD_BYTES)
+    with open(file_name, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            version, binary, size, order = read_format(mm)
+            if version.startswith('2'):
+                reader = stream_v2_binary if binary else stream_v2_ascii
+            elif version.startswith('4'):
+                reader = stream_v4_binary if binary else stream_v4_ascii
+            else:
+                raise ValueError('unsupported MSH version %s.' % version)
+            yield from reader(mm, size, order, n_record)
+        finally:
+            mm.close()
+
+
+def line_chunk(mm, start, end, n_byte):
+    """
+    Split a byte range at line ends into ranges of about n_byte bytes.
+
+    :return: generator of start and end offsets.
+    """
+    while start < end:
+        stop = min(start + n_byte, end)
+        if stop < end:
+            cut = mm.rfind(b'\n', start, stop)
+            if cut < 0:
+                cut = mm.find(b'\n', stop, end)
+            stop = end if cut < 0 else cut + 1
+        yield start, stop
+        start = stop
+
+
+def skip_line(mm, start, n, n_byte):
+    """
+    :return: offset after n lines from start. bytes are scanned in windows of n_byte.
+    """
+    while n > 0 and start < len(mm):
+        window = np.frombuffer(mm, dtype=np.uint8, count=min(n_byte, len(mm) - start), offset=start)
+        line_end = np.flatnonzero(window == 10)
+        size = len(window)
+        del window  # release the buffer of mm.
+        if len(line_end) >= n:
+            return start + int(line_end[n - 1]) + 1
+        n -= len(line_end)
+        start += size
+    return start
+
+
+def stream_v2_ascii(mm, size, order, n_record):
+    start, end = section(mm, 'Nodes')
+    line, start = read_line(mm, start)
+    e_start, e_end = section(mm, 'Elements')
+    e_line, e_start = read_line(mm, e_start)
+    yield 'header', int(line), int(e_line)
+    for a, b in line_chunk(mm, start, end, n_record * RECORD_BYTES // 2):
+        node = np.fromstring(mm[a:b], sep=' ').reshape(-1, 4)
+        if len(node):
+            yield 'node', node[:, 0].astype(np.int64), node[:, 1:]
+    for a, b in line_chunk(mm, e_start, e_end, n_record * RECORD_BYTES // 2):
+        buf = mm[a:b]
+        if buf.strip():
+            for etype, (tag, phys, node) in parse_v2_element(buf).items():
+                yield 'element', etype, tag, phys, node
+
+
+def stream_v2_binary(mm, size, order, n_record):
+    start, end = section(mm, 'Nodes')
+    line, start = read_line(mm, start)
+    n_node = int(line)
+    e_start, e_end = section(mm, 'Elements')
+    e_line, e_start = read_line(mm, e_start)
+    n = int(e_line)
+    yield 'header', n_node, n
+    dtype = np.dtype([('tag', order + 'i4'), ('coord', order + 'f8', 3)])
+    for i in range(0, n_node, n_record):
+        node = np.frombuffer(mm, dtype=dtype, count=min(n_record, n_node - i), offset=start + i * dtype.itemsize)
+        tag = node['tag'].astype(np.int64)
+        coord = node['coord'].astype(np.float64)
+        del node
+        yield 'node', tag, coord
+
+    start = e_start
+    while n > 0:
+        etype, n_follow, n_tag = struct.unpack_from(order + '3i', mm, start)
+        start += 12
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + n_tag + ELEMENT_NODE[etype]
+        for i in range(0, n_follow, n_record):
+            count = min(n_record, n_follow - i)
+            data = np.frombuffer(mm, dtype=order + 'i4', count=count * width, offset=start + 4 * i * width)
+            data = data.reshape(count, width).astype(np.int64)
+            phys = data[:, 1] if n_tag > 0 else np.zeros(count, dtype=np.int64)
+            yield 'element', etype, data[:, 0], phys, data[:, 1 + n_tag:]
+        start += 4 * n_follow * width
+        n -= n_follow
+
+
+def stream_v4_ascii(mm, size, order, n_record):
+    physical = read_v4_entity_ascii(mm)
+    n_byte = n_record * RECORD_BYTES // 2
+
+    start, end = section(mm, 'Nodes')
+    line, start = read_line(mm, start)
+    n_block, n_node = (int(_) for _ in line.split()[:2])
+    e_start, e_end = section(mm, 'Elements')
+    e_line, e_start = read_line(mm, e_start)
+    n_e_block, n_element = (int(_) for _ in e_line.split()[:2])
+    yield 'header', n_node, n_element
+
+    for _ in range(n_block):
+        line, start = read_line(mm, start)
+        dim, tag, parametric, n = (int(_) for _ in line.split())
+        width = 3 + (dim if parametric else 0)
+        # tags are followed by coordinates. both are read in step with two cursors.
+        tag_start = start
+        coord_start = skip_line(mm, tag_start, n, n_byte)
+        for i in range(0, n, n_record):
+            count = min(n_record, n - i)
+            tag_end = skip_line(mm, tag_start, count, n_byte)
+            coord_end = skip_line(mm, coord_start, count, n_byte)
+            node_tag = np.fromstring(mm[tag_start:tag_end], dtype=np.int64, sep=' ')
+            coord = np.fromstring(mm[coord_start:coord_end], sep=' ').reshape(count, width)[:, :3]
+            yield 'node', node_tag, coord
+            tag_start = tag_end
+            coord_start = coord_end
+        start = coord_start
+
+    start = e_start
+    for _ in range(n_e_block):
+        line, start = read_line(mm, start)
+        dim, tag, etype, n = (int(_) for _ in line.split())
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + ELEMENT_NODE[etype]
+        for i in range(0, n, n_record):
+            count = min(n_record, n - i)
+            stop = skip_line(mm, start, count, n_byte)
+            data = np.fromstring(mm[start:stop], dtype=np.int64, sep=' ').reshape(count, width)
+            yield 'element', etype, data[:, 0], np.full(count, physical.get((dim, tag), 0), dtype=np.int64), \
+                data[:, 1:]
+            start = stop
+
+
+def stream_v4_binary(mm, size, order, n_record):
+    physical = read_v4_entity_binary(mm, size, order)
+    st = order + ('u8' if size == 8 else 'u4')
+    header = order + '3i' + ('Q' if size == 8 else 'I')
+
+    start, end = section(mm, 'Nodes')
+    n_block, n_node = (int(_) for _ in np.frombuffer(mm, dtype=st, count=4, offset=start)[:2])
+    e_start, e_end = section(mm, 'Elements')
+    n_e_block, n_element = (int(_) for _ in np.frombuffer(mm, dtype=st, count=4, offset=e_start)[:2])
+    yield 'header', n_node, n_element
+
+    start += 4 * size
+    for _ in range(n_block):
+        dim, tag, parametric, n = struct.unpack_from(header, mm, start)
+        start += 12 + size
+        width = 3 + (dim if parametric else 0)
+        coord_start = start + n * size
+        for i in range(0, n, n_record):
+            count = min(n_record, n - i)
+            node_tag = np.frombuffer(mm, dtype=st, count=count, offset=start + i * size).astype(np.int64)
+            coord = np.frombuffer(mm, dtype=order + 'f8', count=count * width, offset=coord_start + 8 * i * width)
+            coord = coord.reshape(count, width)[:, :3].astype(np.float64)
+            yield 'node', node_tag, coord
+        start = coord_start + 8 * n * width
+
+    start = e_start + 4 * size
+    for _ in range(n_e_block):
+        dim, tag, etype, n = struct.unpack_from(header, mm, start)
+        start += 12 + size
+        if etype not in ELEMENT_NODE:
+            raise ValueError('unknown element type %i.' % etype)
+        width = 1 + ELEMENT_NODE[etype]
+        for i in range(0, n, n_record):
+            count = min(n_record, n - i)
+            data = np.frombuffer(mm, dtype=st, count=count * width, offset=start + i * width * size)
+            data = data.reshape(count, width).astype(np.int64)
+            yield 'element', etype, data[:, 0], np.full(count, physical.get((dim, tag), 0), dtype=np.int64), \
+                data[:, 1:]
+        start += n * width * size
+
+
+def write(file_name, coord, element, binary=False):
+    """
+    Write a mesh file in MSH 2.2 format. Elementary tags are set to physical tags.
+
+    :param file_name: name of file to write.
+    :param coord: (n_node, 2) or (n_node, 3) coordinates. node tags are 1, ..., n_node.
+    :param element: dict of element type to (physical tag, zero-based node connectivity) arrays. elements are
+                    numbered in the order of the dict.
+    :param binary: write binary data if True else ASCII.
+    :return: msh file
+    """
+    coord = np.asarray(coord, dtype=np.float64)
+    node = np.zeros((len(coord), 3))
+    node[:, :coord.shape[1]] = coord
+    n_element = sum(len(phys) for phys, _ in element.values())
+    with open(file_name, 'wb') as f:
+        f.write(b'$MeshFormat\n2.2 %i 8\n' % int(binary))
+        if binary:
+            f.write(struct.pack('<i', 1) + b'\n')
+        f.write(b'$EndMeshFormat\n$Nodes\n%i\n' % len(node))
+        if binary:
+            data = np.empty(len(node), dtype=[('tag', '<i4'), ('coord', '<f8', 3)])
+            data['tag'] = np.arange(1, len(node) + 1)
+            data['coord'] = node
+            f.write(data.tobytes() + b'\n')
+        else:
+            np.savetxt(f, np.column_stack((np.arange(1, len(node) + 1), node)), fmt='%d %.17g %.17g %.17g')
+        f.write(b'$EndNodes\n$Elements\n%i\n' % n_element)
+        tag = 1
+        for etype, (phys, conn) in element.items():
+            phys = np.asarray(phys, dtype=np.int64)
+            conn = np.asarray(conn, dtype=np.int64) + 1  # GMSH has base 1.
+            n = len(phys)
+            number = np.arange(tag, tag + n)
+            tag += n
+            if binary:
+                f.write(struct.pack('<3i', etype, n, 2))
+                f.write(np.column_stack((number, phys, phys, conn)).astype('<i4').tobytes())
+            else:
+                data = np.column_stack((number, np.full(n, etype), np.full(n, 2), phys, phys, conn))
+                np.savetxt(f, data, fmt='%d')
+        if binary:
+            f.write(b'\n')
+        f.write(b'$EndElements\n')
@@ -0,0 +1,161 @@
+import numpy as np
+
+import Stats
+from SpatialIndex import QUERY_CHUNK, SpatialIndex, box_overlap, expand_range, to_csr
+
+# maximum number of buckets and of (element, bucket) pairs per element. bounds memory if element sizes vary
+# widely.
+MAX_BUCKET_RATIO = 4
+
+
+class UniformGrid(SpatialIndex):
+    """
+    Uniform bucket grid. Every element is listed in the buckets its box overlaps, and a query visits the buckets its
+    box overlaps. Fast for elements of similar size, e.g. background Cartesian meshes, where a point query visits
+    one bucket of a few elements. Elements much larger than buckets are listed in many buckets.
+    """
+    NAME = 'grid'
+
+    def __init__(self, dim, bucket_size=None):
+        """
+        :param dim: Spatial dimension.
+        :param bucket_size: edge lengths of buckets. the median extent of elements along each dimension if None.
+        """
+        super().__init__(dim)
+        self.bucket_size = None if bucket_size is None else np.broadcast_to(
+            np.asarray(bucket_size, dtype=np.float64), (dim,)).copy()
+        self.origin = None  # (dim,) lower corner of the grid.
+        self.size = None  # (dim,) edge lengths of buckets of the built grid.
+        self.shape = None  # (dim,) number of buckets along each dimension.
+        self.bound = None  # (n_var,) bounding box of all elements.
+        # elements of bucket b are bucket_element[bucket_offset[b]:bucket_offset[b+1]]. buckets are in C order.
+        self.bucket_offset = None
+        self.bucket_element = None
+
+    @property
+    def n_bucket(self):
+        return 0 if self.shape is None else int(np.prod(self.shape))
+
+    @Stats.timed('grid_build')
+    def build_from_boxes(self, boxes):
+        """
+        Bin element bounding boxes into buckets.
+
+        :param boxes: (n_element, n_var) array of min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        :error: if boxes do not have n_var columns raise ValueError.
+        :rtype: None
+        """
+        boxes = self.check_boxes_(boxes)
+        dim = self.dim
+        m = len(boxes)
+        self.box = boxes
+        if m == 0:
+            self.origin = np.zeros(dim)
+            self.size = np.ones(dim)
+            self.shape = np.ones(dim, dtype=np.int64)
+            self.bound = np.concatenate((np.full(dim, np.inf), np.full(dim, -np.inf)))
+            self.bucket_offset = np.zeros(2, dtype=np.int64)
+            self.bucket_element = np.empty(0, dtype=np.int64)
+            return
+        lo = boxes[:, :dim].min(axis=0)
+        hi = boxes[:, dim:].max(axis=0)
+        extent = hi - lo
+        size = self.bucket_size
+        if size is None:
+            size = np.median(boxes[:, dim:] - boxes[:, :dim], axis=0)
+        # degenerate extents, e.g. of points, fall back to buckets of the average element.
+        size = np.where(size > 0, size, extent / max(m, 1) ** (1 / dim))
+        size = np.where(size > 0, size, 1.0)
+        # coarsen buckets until both buckets and (element, bucket) pairs are bounded.
+        while True:
+            shape = np.maximum(np.ceil(extent / size), 1)
+            n_pair = np.sum(np.prod(np.floor((boxes[:, dim:] - lo) / size) - np.floor((boxes[:, :dim] - lo) / size)
+                                    + 1, axis=1))
+            ratio = max(np.prod(shape), n_pair) / (MAX_BUCKET_RATIO * m)
+            if ratio <= 1:
+                break
+            size = size * max(ratio ** (1 / dim), 1.5)
+        self.origin = lo
+        self.size = size
+        self.shape = shape.astype(np.int64)
+        self.bound = np.concatenate((lo, hi))
+
+        owner, bucket = self.cover_(boxes)
+        order = np.argsort(bucket, kind='stable')
+        self.bucket_element = owner[order]
+        self.bucket_offset = np.zeros(self.n_bucket + 1, dtype=np.int64)
+        np.cumsum(np.bincount(bucket, minlength=self.n_bucket), out=self.bucket_offset[1:])
+        if self.stats is not None:
+            self.stats.add_histogram('grid_bucket_size', np.diff(self.bucket_offset))
+
+    def bucket_coord(self, point):
+        """
+        :param point: (n, dim) points.
+        :return: (n, dim) coordinates of buckets containing points. points outside are moved to the nearest bucket.
+        """
+        c = np.floor((point - self.origin) / self.size).astype(np.int64)
+        return np.clip(c, 0, self.shape - 1)
+
+    def bucket_index(self, coord):
+        """
+        :param coord: (n, dim) bucket coordinates.
+        :return: (n,) buckets in C order.
+        """
+        bucket = np.zeros(len(coord), dtype=np.int64)
+        for d in range(self.dim):
+            bucket = bucket * self.shape[d] + coord[:, d]
+        return bucket
+
+    def cover_(self, box):
+        """
+        Buckets overlapped by boxes. Do not call this function explicitly. It meant to be called in build_from_boxes
+        and search_boxes_.
+
+        :return: box and bucket of each pair.
+        """
+        dim = self.dim
+        lo = self.bucket_coord(box[:, :dim])
+        count = self.bucket_coord(box[:, dim:]) - lo + 1
+        owner, local = expand_range(np.zeros(len(box), dtype=np.int64), np.prod(count, axis=1))
+        bucket = np.zeros(len(owner), dtype=np.int64)
+        for d in range(dim):
+            n = count[owner, d]
+            bucket = bucket * self.shape[d] + lo[owner, d] + local % n
+            local //= n
+        return owner, bucket
+
+    def search_boxes_(self, query, chunk=QUERY_CHUNK):
+        """
+        Search query boxes given in the reference frame of the grid. Do not call this function explicitly. It meant
+        to be called in search_boxes and search_points.
+
+        An element overlapping a query may share several buckets with it. The pair is reported only in the bucket
+        containing the lower corner of the intersection of their boxes.
+        """
+        stats = self.stats
+        with Stats.timer(stats, self.NAME + '_search'):
+            dim = self.dim
+            n_query = len(query)
+            found_query = list()
+            found_element = list()
+            for start in range(0, n_query if self.n_element else 0, chunk):
+                q = np.arange(start, min(start + chunk, n_query))
+                q = q[box_overlap(query[q], self.bound[None, :], dim)]
+                owner, bucket = self.cover_(query[q])
+                pair, slot = expand_range(self.bucket_offset[bucket],
+                                          self.bucket_offset[bucket + 1] - self.bucket_offset[bucket])
+                qq = q[owner[pair]]
+                element = self.bucket_element[slot]
+                own = box_overlap(query[qq], self.box[element], dim)
+                corner = np.maximum(query[qq[own], :dim], self.box[element[own], :dim])
+                own[own] = self.bucket_index(self.bucket_coord(corner)) == bucket[pair[own]]
+                if stats is not None:
+                    stats.add('grid_bucket_visit', len(bucket))
+                    stats.add('grid_element_test', len(own))
+                found_query.append(qq[own])
+                found_element.append(element[own])
+            offset, index = to_csr(found_query, found_element, n_query)
+            if stats is not None:
+                stats.add('grid_query', n_query)
+                stats.add('grid_candidate', len(index))
+            return offset, index
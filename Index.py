@@ -0,0 +1,71 @@
+import numpy as np
+
+from ADT import ADT
+from BVH import BVH
+from Grid import UniformGrid
+
+# spatial index backends by name.
+BACKEND = {'adt': ADT, 'grid': UniformGrid, 'bvh': BVH}
+
+# the uniform grid is selected if element sizes spread less than this, the BVH if more than BVH_SPREAD.
+GRID_SPREAD = 4.0
+BVH_SPREAD = 64.0
+
+
+def size_spread(boxes, dim):
+    """
+    Spread of element sizes as the largest ratio over dimensions of the 95th to the 5th percentile of box extents of
+    elements. Stretched cells spread along the dimension they are thin in.
+
+    :param boxes: (n_element, 2*dim) element boxes.
+    :param dim: Spatial dimension.
+    :return: spread. 1 if all elements have the same size or there are none, inf if small elements are degenerate.
+    """
+    if len(boxes) == 0:
+        return 1.0
+    small, large = np.percentile(boxes[:, dim:] - boxes[:, :dim], [5, 95], axis=0)
+    # dimensions along which all elements are flat do not count.
+    flat = large <= 0
+    if np.all(flat):
+        return 1.0
+    with np.errstate(divide='ignore'):
+        return float(np.max(large[~flat] / small[~flat]))
+
+
+def select_backend(boxes, dim):
+    """
+    Pick a backend from element size statistics: the uniform grid for elements of near-uniform size, e.g.
+    background Cartesian meshes, the BVH for strongly clustered sizes, e.g. stretched near-wall cells, and the ADT
+    in between.
+
+    :param boxes: (n_element, 2*dim) element boxes.
+    :param dim: Spatial dimension.
+    :return: name of backend. see BACKEND.
+    """
+    spread = size_spread(np.asarray(boxes, dtype=np.float64), dim)
+    if spread < GRID_SPREAD:
+        return 'grid'
+    if spread > BVH_SPREAD:
+        return 'bvh'
+    return 'adt'
+
+
+def build_index(boxes, dim, backend='auto', stats=None):
+    """
+    Build a spatial index of element boxes.
+
+    :param boxes: (n_element, 2*dim) element boxes.
+    :param dim: Spatial dimension.
+    :param backend: name of backend or 'auto' to use select_backend.
+    :param stats: Stats of the index. instrumentation is off if None.
+    :return: SpatialIndex.
+    :error: if backend is unknown raise ValueError.
+    """
+    if backend == 'auto':
+        backend = select_backend(boxes, dim)
+    if backend not in BACKEND:
+        raise ValueError('backend must be auto or one of %s.' % ', '.join(BACKEND))
+    index = BACKEND[backend](dim)
+    index.stats = stats
+    index.build_from_boxes(boxes)
+    return index
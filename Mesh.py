@@ -1,263 +1,859 @@
+import numpy as np
 import sympy.geometry as symgeo
 
+import Geometry
+import Gmsh
+import Stats
+import VTK
+from ADT import ADT
 
-class Mesh:
-    def __init__(self, file_name):
-        self.point = list()  # list of points.
-        self.cell = list()  # list of cells.
-        self.bface = list()  # list of boundary faces.
-        self.iface = list()  # list of interior faces.
-        self.read_gmsh(file_name)
-        self.topology_connectivity()
 
-    def read_gmsh(self, file_name):
+class Mesh:
+    def __init__(self, file_name=None, stats=None, memory=None):
+        """
+        :param file_name: GMSH file to read. an empty mesh is created if None, e.g. to set arrays from a cache.
+        :param stats: Stats accumulating times of read, topology and write phases. not collected if None.
+        :param memory: read file in chunks of about this many bytes. see read_gmsh.
+        """
+        # mesh data is stored in contiguous arrays. Point, Cell and Face objects are views created on demand.
+        self._metric = dict()  # geometric metrics computed on demand. cleared when coordinates or topology change.
+        self.coord = np.empty((0, 2))  # (n_point, 2) coordinates of points.
+        self.cell_point = np.empty((0, 4), dtype=np.int64)  # (n_cell, k) cell vertices. -1 pads unused entries.
+        self.cell_n_point = np.empty(0, dtype=np.int64)  # number of vertices of each cell.
+        self.cell_tag = np.empty(0, dtype=np.int64)  # physical tag of each cell.
+        self.bface_point = np.empty((0, 2), dtype=np.int64)  # (n_bface, 2) boundary face vertices.
+        self.bface_tag = np.empty(0, dtype=np.int64)  # physical tag of each boundary face.
+        self.bface_wall = np.empty(0, dtype=bool)  # whether boundary face is a wall.
+        self.bface_cell = np.empty(0, dtype=np.int64)  # the cell to which boundary face belongs to.
+        self.iface_point = np.empty((0, 2), dtype=np.int64)  # (n_iface, 2) interior face vertices.
+        self.iface_cell = np.empty((0, 2), dtype=np.int64)  # (n_iface, 2) the cells sharing interior face.
+        self.cell_nei = np.empty((0, 4), dtype=np.int64)  # (n_cell, k) neighbor across each cell face or -1.
+        self.cell_bface = np.empty((0, 4), dtype=np.int64)  # (n_cell, k) boundary face of each cell face or -1.
+        self.cell_iface = np.empty((0, 4), dtype=np.int64)  # (n_cell, k) interior face of each cell face or -1.
+        self._point_cell = None  # point-to-cell connectivity in CSR form. built on demand.
+        self._point_bface = None  # point-to-bface connectivity in CSR form. built on demand.
+        self.stats = stats
+        if file_name is not None:
+            key = self.read_gmsh(file_name, memory)
+            self.topology_connectivity(key)
+
+    @property
+    def coord(self):
+        return self._coord
+
+    @coord.setter
+    def coord(self, value):
+        self._coord = value
+        self.invalidate_metric()
+
+    @property
+    def point(self):
+        return EntityList(self, Point, len(self.coord))
+
+    @property
+    def cell(self):
+        return EntityList(self, Cell, len(self.cell_point))
+
+    @property
+    def bface(self):
+        return EntityList(self, BoundaryFace, len(self.bface_point))
+
+    @property
+    def iface(self):
+        return EntityList(self, InteriorFace, len(self.iface_point))
+
+    def read_gmsh(self, file_name, memory=None):
         """
         Read mesh from a file generated by GMSH. Call in __init__.
+        MSH 2.2 and 4.1 files in ASCII or binary form are supported. See Gmsh.read.
 
         :param filename: name of file to read grid from. it comes from __init__. (default=None)
         :type filename: str
+        :param memory: if given, the file is streamed in chunks of about this many bytes with Gmsh.stream and mesh
+                       arrays are filled chunk by chunk. see set_gmsh_stream.
+        :return: None, or keys of cell faces if memory is given.
+        """
+        if memory is not None:
+            return self.set_gmsh_stream(Gmsh.stream(file_name, memory))
+        with Stats.timer(self.stats, 'mesh_read_file'):
+            data = Gmsh.read(file_name)
+        self.set_gmsh(data)
+
+    @Stats.timed('mesh_set_arrays')
+    def set_gmsh(self, data):
+        """
+        Set mesh arrays from elements grouped by type.
+        Lines become boundary faces. Triangles and quads become cells in the order of their element tags.
+
+        :param data: Gmsh.GmshData
         :rtype: None
         """
-        with open(file_name, 'r') as f:
-            # read number of points
-            for line in f:
-                if '$Nodes' in line:
-                    np = int(next(f))
-                    break
-            # read points
-            for _ in range(np):
-                a = []  # dummy list
-                for token in next(f).split():  # split coordinates.
-                    a.append(float(token))
-                self.point.append(Point(x=a[1], y=a[2], parent_mesh=self))  # ignoring first char.
-            # read number of elements
-            for line in f:
-                if '$Elements' in line:
-                    ne = int(next(f))
-                    break
-            # read elements
-            for i in range(ne):
-                a = list()  # dummy list
-                # a[0] refers to tag.
-                # a[1] refers to geometric shape.
-                # a[2] refers to number of tags.
-                # according to number of tags:
-                # a[3] refers to physical tag.
-                # a[4] refers to geometric tag.
-                # a[5] refers to number of partitions.
-                # according to number of partitions:
-                # a[...] refers to partitions.
-                # the rest refers to vertices.
-                for token in next(f).split():
-                    a.append(int(token))
-                if a[1] == 15:  # point
-                    pass
-                elif a[1] == 1:  # line
-                    # read last two entries.
-                    point = list()
-                    point.append(self.point[a[-2] - 1])  # -1 because GMSH has base 1.
-                    point.append(self.point[a[-1] - 1])  # -1 because GMSH has base 1.
-                    wall = False  # so adjust physical number accordingly when creating GMSH file.
-                    if a[3] == 1:
-                        wall = True
-                    #self.bface.append(BoundaryFace(Geometry.Line([shape for shape in point]), point, wall, self))
-                    self.bface.append(BoundaryFace(symgeo.Line(point[0].shape, point[1].shape), point, wall, self))
-                elif a[1] == 3:  # quad
-                    # read last four entries.
-                    point = list()
-                    point.append(self.point[a[-4] - 1])  # -1 because GMSH has base 1.
-                    point.append(self.point[a[-3] - 1])  # -1 because GMSH has base 1.
-                    point.append(self.point[a[-2] - 1])  # -1 because GMSH has base 1.
-                    point.append(self.point[a[-1] - 1])  # -1 because GMSH has base 1.
-                    #self.cell.append(Cell(Geometry.Quad([shape for shape in point]), point, self))
-                    self.cell.append(Cell(symgeo.Polygon(point[0].shape, point[1].shape, point[2].shape, point[3].shape), point, self))
-
-    def print_vtk(self, file_name):
-        """
-        Write mesh to a file in vtk format.
+        self.coord = np.ascontiguousarray(data.coord[:, :2], dtype=np.float64)
+
+        # cells. triangles are padded to four vertices with -1.
+        tag = list()
+        phys = list()
+        point = list()
+        for etype in (2, 3):  # triangle, quad
+            if etype in data.element:
+                e_tag, e_phys, e_node = data.element[etype]
+                node = np.full((len(e_tag), 4), -1, dtype=np.int64)
+                node[:, :e_node.shape[1]] = data.node_index(e_node)
+                tag.append(e_tag)
+                phys.append(e_phys)
+                point.append(node)
+        if point:
+            order = np.argsort(np.concatenate(tag), kind='stable')
+            self.cell_point = np.concatenate(point)[order]
+            self.cell_tag = np.concatenate(phys)[order]
+        else:
+            self.cell_point = np.empty((0, 4), dtype=np.int64)
+            self.cell_tag = np.empty(0, dtype=np.int64)
+        self.cell_n_point = (self.cell_point >= 0).sum(axis=1)
+
+        # boundary faces.
+        if 1 in data.element:  # line
+            e_tag, e_phys, e_node = data.element[1]
+            order = np.argsort(e_tag, kind='stable')
+            self.bface_point = data.node_index(e_node[order])
+            self.bface_tag = e_phys[order]
+        else:
+            self.bface_point = np.empty((0, 2), dtype=np.int64)
+            self.bface_tag = np.empty(0, dtype=np.int64)
+        self.bface_wall = self.bface_tag == 1  # so adjust physical number accordingly when creating GMSH file.
+        self._point_cell = None
+        self._point_bface = None
+
+    @Stats.timed('mesh_read_stream')
+    def set_gmsh_stream(self, chunk):
+        """
+        Set mesh arrays from chunks of Gmsh.stream as they arrive. Arrays are allocated once from the header, so
+        the file is never held in memory. Faces of cells are hashed chunk by chunk for topology_connectivity.
+        The result equals set_gmsh.
+
+        :param chunk: iterator of items of Gmsh.stream.
+        :return: (n_cell, 4) keys of cell faces. see cell_face_key.
+        """
+        kind, n_node, n_element = next(chunk)
+        if kind != 'header':
+            raise ValueError('stream must start with a header.')
+        coord = np.empty((n_node, 2))
+        node_tag = np.empty(n_node, dtype=np.int64)
+        n = 0
+        cell_point = np.empty((n_element, 4), dtype=np.int64)  # number of cells is at most number of elements.
+        cell_tag = np.empty(n_element, dtype=np.int64)
+        cell_phys = np.empty(n_element, dtype=np.int64)
+        key = np.empty((n_element, 4), dtype=np.int64)
+        m = 0
+        bface = list()
+        lookup = None
+        for item in chunk:
+            if item[0] == 'node':
+                _, tag, xyz = item
+                coord[n:n + len(tag)] = xyz[:, :2]
+                node_tag[n:n + len(tag)] = tag
+                n += len(tag)
+                continue
+            if lookup is None:
+                # nodes precede elements.
+                lookup = np.full(int(node_tag.max(initial=0)) + 1, -1, dtype=np.int64)
+                lookup[node_tag] = np.arange(n_node)
+            _, etype, tag, phys, node = item
+            if etype == 1:  # line
+                bface.append((tag, phys, lookup[node]))
+            elif etype in (2, 3):  # triangle, quad
+                c = cell_point[m:m + len(tag)]
+                c[:, :node.shape[1]] = lookup[node]
+                c[:, node.shape[1]:] = -1
+                cell_tag[m:m + len(tag)] = tag
+                cell_phys[m:m + len(tag)] = phys
+                key[m:m + len(tag)] = cell_face_key(c, np.full(len(c), node.shape[1]), n_node)
+                m += len(tag)
+        self.coord = coord
+
+        # cells in the order of their element tags. files written by GMSH are already in order.
+        order = np.argsort(cell_tag[:m], kind='stable') if np.any(np.diff(cell_tag[:m]) < 0) else slice(0, m)
+        self.cell_point = cell_point[:m][order]
+        self.cell_tag = cell_phys[:m][order]
+        self.cell_n_point = (self.cell_point >= 0).sum(axis=1)
+        key = key[:m][order]
+
+        if bface:
+            tag, phys, node = (np.concatenate([b[_] for b in bface]) for _ in range(3))
+            order = np.argsort(tag, kind='stable')
+            self.bface_point = node[order]
+            self.bface_tag = phys[order]
+        else:
+            self.bface_point = np.empty((0, 2), dtype=np.int64)
+            self.bface_tag = np.empty(0, dtype=np.int64)
+        self.bface_wall = self.bface_tag == 1
+        self._point_cell = None
+        self._point_bface = None
+        return key
+
+    @Stats.timed('mesh_print_vtk')
+    def print_vtk(self, file_name, binary=False, point_data=None, cell_data=None):
+        """
+        Write mesh to a file in legacy vtk format.
 
         :param file_name: name of file to write.
+        :param binary: write binary data instead of ASCII.
+        :param point_data: dict of name to per-point array.
+        :param cell_data: dict of name to per-cell array.
         :return: vtk file
         """
+        VTK.write_legacy(file_name, self.coord, self.cell_point, self.cell_n_point, point_data, cell_data, binary)
+
+    @Stats.timed('mesh_print_vtu')
+    def print_vtu(self, file_name, point_data=None, cell_data=None, compress=True):
+        """
+        Write mesh to a file in VTK XML (vtu) format with appended raw data.
+
+        :param file_name: name of file to write.
+        :param point_data: dict of name to per-point array.
+        :param cell_data: dict of name to per-cell array.
+        :param compress: compress data with zlib.
+        :return: vtu file
+        """
+        VTK.write_vtu(file_name, self.coord, self.cell_point, self.cell_n_point, point_data, cell_data, compress)
+
+    def point_cell(self, index):
+        """
+        Cells to which point belongs to.
+
+        :param index: index of point.
+        :return: array of cell indices.
+        """
+        if self._point_cell is None:
+            self._point_cell = csr_transpose(self.cell_point, len(self.coord))
+        offset, value = self._point_cell
+        return value[offset[index]:offset[index + 1]]
+
+    def point_bface(self, index):
+        """
+        Boundary faces to which point belongs to.
+
+        :param index: index of point.
+        :return: array of boundary face indices.
+        """
+        if self._point_bface is None:
+            self._point_bface = csr_transpose(self.bface_point, len(self.coord))
+        offset, value = self._point_bface
+        return value[offset[index]:offset[index + 1]]
 
-        f = open(file_name, 'w')
+    def cell_face_point(self, index):
+        """
+        Vertices of faces of a cell with GMSH convention.
+
+        :param index: index of cell.
+        :return: list of (v0, v1) tuples.
+        """
+        n = self.cell_n_point[index]
+        v = self.cell_point[index]
+        return [(v[i], v[(i + 1) % n]) for i in range(n)]
+
+    def face_point(self):
+        """
+        Vertices of all cell faces with GMSH convention.
+
+        :return: (n_cell, k, 2) int array of face vertices and (n_cell, k) bool array marking faces which exist.
+        """
+        n_cell, k = self.cell_point.shape
+        j = np.arange(k)
+        valid = j[None, :] < self.cell_n_point[:, None]
+        nxt = (j[None, :] + 1) % np.maximum(self.cell_n_point[:, None], 1)
+        row = np.arange(n_cell)[:, None]
+        face = np.stack((self.cell_point, self.cell_point[row, nxt]), axis=-1)
+        return face, valid
+
+    def cell_box(self):
+        """
+        Axis-aligned bounding boxes of cells. Can be passed to ADT.build_from_boxes.
+
+        :return: (n_cell, 4) array of x_min, y_min, x_max, y_max.
+        """
+        p = self.coord[self.cell_point]
+        valid = (self.cell_point >= 0)[:, :, None]
+        return np.hstack((np.where(valid, p, np.inf).min(axis=1), np.where(valid, p, -np.inf).max(axis=1)))
+
+    def cell_polygon(self):
+        """
+        Vertex coordinates of cells for the batch kernels of Geometry.
+
+        :return: (n_cell, 4, 2) array. see Geometry.polygon.
+        """
+        return Geometry.polygon(self.coord, self.cell_point)
+
+    def invalidate_metric(self):
+        """
+        Discard cached metrics. Assigning coord does this automatically; call after modifying coord in place.
+
+        :rtype: None
+        """
+        self._metric.clear()
+
+    def metric_(self, name, compute):
+        """
+        Return a cached metric or compute and cache it. Cached arrays are read-only.
+        """
+        value = self._metric.get(name)
+        if value is None:
+            value = compute()
+            for a in value if isinstance(value, tuple) else (value,):
+                a.flags.writeable = False
+            self._metric[name] = value
+        return value
+
+    def cell_centroid(self):
+        """
+        :return: (n_cell, 2) area centroids of cells. cached.
+        """
+        return self.metric_('cell_centroid', lambda: Geometry.centroid(self.cell_polygon()))
 
-        f.write('# vtk DataFile Version 3.0\n')
-        f.write('All in VTK format\n')
-        f.write('ASCII\n')
-        f.write('DATASET UNSTRUCTURED_GRID\n')
-        f.write('POINTS %i float\n' % len(self.point))
+    def cell_area(self):
+        """
+        :return: (n_cell,) signed areas of cells. positive for counter-clockwise cells. cached.
+        """
+        return self.metric_('cell_area', lambda: Geometry.signed_area(self.cell_polygon()))
 
-        # write points
-        for p in self.point:
-            f.write('%s ' % p.shape.x)
-            f.write('%s ' % p.shape.y)
-            f.write('\n')
+    def iface_metric(self):
+        """
+        Midpoints, unit normals and lengths of interior faces. Normals point from the first to the second cell of
+        iface_cell. cached.
 
-        # write cell list size
-        celllistsize = 0
-        for i in self.cell:
-            celllistsize += len(i.shape.args) + 1
-        f.write('CELLS %i %i\n' % (len(self.cell), celllistsize))
+        :return: (n_iface, 2) midpoints, (n_iface, 2) normals and (n_iface,) lengths.
+        """
+        def compute():
+            p = self.coord[self.iface_point]
+            return Geometry.face_metric(p[:, 0], p[:, 1], self.cell_centroid()[self.iface_cell[:, 0]])
+        return self.metric_('iface_metric', compute)
 
-        # write cell vertices
-        for i in self.cell:
-            f.write('%s ' % len(i.shape.args))
-            for v in i.point:
-                f.write('%s ' % self.point.index(v))
-            f.write('\n')
+    def bface_metric(self):
+        """
+        Midpoints, unit normals and lengths of boundary faces. Normals point out of the mesh. cached.
 
-        # write cell types
-        f.write('CELL_TYPES %i\n' % len(self.cell))
-        for cell in self.cell:
-            if len(cell.shape.args) == 4:  # check if cell shape is quad.
-                f.write('%i\n' % 9)
+        :return: (n_bface, 2) midpoints, (n_bface, 2) normals and (n_bface,) lengths.
+        """
+        def compute():
+            p = self.coord[self.bface_point]
+            # faces without cells keep the normal of their vertex order.
+            mid = p.mean(axis=1)
+            edge = p[:, 1] - p[:, 0]
+            inside = np.where((self.bface_cell >= 0)[:, None], self.cell_centroid()[np.maximum(self.bface_cell, 0)],
+                              mid - np.stack((edge[:, 1], -edge[:, 0]), axis=1))
+            return Geometry.face_metric(p[:, 0], p[:, 1], inside)
+        return self.metric_('bface_metric', compute)
+
+    def wall_distance(self, point=None):
+        """
+        Distance to the nearest wall boundary face. Wall faces are put in an ADT and queried with
+        ADT.search_nearest_segments.
 
-    def topology_connectivity(self):
+        :param point: (n, 2) points. cell centroids if None.
+        :return: (n,) distances and nearest wall faces as indices of bface. inf and -1 if mesh has no walls.
+        """
+        point = self.cell_centroid() if point is None else np.asarray(point, dtype=np.float64).reshape(-1, 2)
+        wall = np.flatnonzero(self.bface_wall)
+        if len(wall) == 0:
+            return np.full(len(point), np.inf), np.full(len(point), -1, dtype=np.int64)
+        segment = self.coord[self.bface_point[wall]]
+        tree = ADT(2)
+        tree.build_from_boxes(np.hstack((segment.min(axis=1), segment.max(axis=1))))
+        nearest, distance = tree.search_nearest_segments(point, segment)
+        return distance, wall[nearest]
+
+    def reorder(self, method='rcm'):
+        """
+        Renumber cells, points and boundary faces for memory locality.
+        Cells are ordered by reverse Cuthill-McKee over cell neighbors or along a Hilbert curve through cell
+        centroids. Points are numbered in the order of their first use by cells, and boundary faces in the order of
+        their first points. Topology is rebuilt, so interior faces follow the new cell order. Trees, donor searches and
+        other objects built from the mesh before reordering are invalid.
+
+        :param method: 'rcm' or 'hilbert'.
+        :return: cell, point and boundary face permutations. entry i is the old index of new entity i.
+        :error: if method is unknown raise ValueError.
+        """
+        n_cell = len(self.cell_point)
+        has_topology = len(self.cell_nei) == n_cell and n_cell > 0
+        if method == 'rcm':
+            if not has_topology:
+                self.topology_connectivity()
+            cell_order = reverse_cuthill_mckee(self.cell_nei)
+        elif method == 'hilbert':
+            cell_order = np.argsort(hilbert_key(self.cell_centroid()), kind='stable')
+        else:
+            raise ValueError('method must be rcm or hilbert.')
+        cell_point = self.cell_point[cell_order]
+        point_order = first_use(np.concatenate((cell_point.ravel(), self.bface_point.ravel())), len(self.coord))
+        point_new = inverse_permutation(point_order)
+
+        self.coord = self.coord[point_order]
+        self.cell_point = np.where(cell_point >= 0, point_new[np.maximum(cell_point, 0)], -1)
+        self.cell_n_point = self.cell_n_point[cell_order]
+        self.cell_tag = self.cell_tag[cell_order]
+        bface_point = point_new[self.bface_point]
+        # boundary faces by their first point. points follow cells, so faces do too.
+        bface_order = np.argsort(bface_point.min(axis=1), kind='stable')
+        self.bface_point = bface_point[bface_order]
+        self.bface_tag = self.bface_tag[bface_order]
+        self.bface_wall = self.bface_wall[bface_order]
+        self._point_cell = None
+        self._point_bface = None
+        if has_topology or method == 'rcm':
+            self.topology_connectivity()
+        return cell_order, point_order, bface_order
+
+    @Stats.timed('mesh_topology')
+    def topology_connectivity(self, key=None):
         """
         Establish cell-to-cell, face-to-cell connectivity of mesh. Create interior faces.
+
+        Every cell face is keyed by its sorted vertex pair. Sorting the keys brings the two cells sharing an interior
+        face next to each other, and boundary faces are matched to the remaining keys with a binary search.
+        :param key: (n_cell, k) keys of cell faces from cell_face_key, e.g. hashed while streaming. computed if None.
         :return:
         """
-        # loop through cells.
-        for cell in self.cell:
-            faces = cell.set_face_vertices()
-            # loop through points of faces.
-            # note that 'faces' is not assigned to the cell yet.
-            for face in faces:
-                if face[0].parent_bface:  # needed to use continue statement.
-                    # loop though bfaces that the first face vertex belongs to.
-                    for parent_bface in face[0].parent_bface:  # face[0] is the first face vertex.
-                        # count number of parent bfaces other points of the face belongs to.
-                        sig = 0
-                        for point in face[1:]:  # do not consider the first face point.
-                            if parent_bface in point.parent_bface:
-                                sig += 1
-                        if sig == len(face) - 1:  # '-1' because we start from the second vertex to count matches.
-                            cell.bface.append(parent_bface)
-                            parent_bface.parent_cell.append(cell)
-                            break  # looping though bfaces of the first face vertex.
-                    continue  # with the next face as we are done with the current one.
-
-                # loop through parent cells of the face vertex.
-                for parent_cell in face[0].parent_cell:
-                    # make sure that parent cell is not the current cell.
-                    if parent_cell != cell:
-                        # check if this parent cell is already processed.
-                        if parent_cell not in cell.nei:
-                            sig = 0
-                            for point in face[1:]:  # do not consider the first face point.
-                                sig += point.parent_cell.count(parent_cell)
-                            if sig == len(face) - 1:  # '-1' because we start from the second vertex to count matches.
-                                cell.nei.append(parent_cell)
-                                parent_cell.nei.append(cell)
-                                if len(cell.shape.args) == 4:  # check if the shape is quad.
-                                    shape = symgeo.Line(face[0].shape, face[1].shape)
-                                self.iface.append(InteriorFace(shape, face, self))
-                                cell.iface.append(self.iface[-1])
-                                parent_cell.iface.append(self.iface[-1])
-                                break  # looping though parent cells of the first face vertex.
+        n_cell, k = self.cell_point.shape
+        n_point = len(self.coord)
+        self.invalidate_metric()
+        self.cell_nei = np.full((n_cell, k), -1, dtype=np.int64)
+        self.cell_bface = np.full((n_cell, k), -1, dtype=np.int64)
+        self.cell_iface = np.full((n_cell, k), -1, dtype=np.int64)
+        self.bface_cell = np.full(len(self.bface_point), -1, dtype=np.int64)
+
+        if key is None:
+            key = cell_face_key(self.cell_point, self.cell_n_point, n_point)
+        key = key.ravel()
+        slot = np.flatnonzero(key >= 0)  # slot = cell * k + local face index.
+        key = key[slot]
+
+        # sort keys so that the faces shared by two cells are adjacent.
+        order = np.argsort(key, kind='stable')
+        slot = slot[order]
+        key = key[order]
+        same = key[1:] == key[:-1]
+        if np.any(same[1:] & same[:-1]):
+            raise ValueError('face shared by more than two cells.')
+
+        # interior faces. first slot belongs to the cell with smaller index due to stable sort.
+        pair = np.flatnonzero(same)
+        owner = slot[pair]
+        other = slot[pair + 1]
+        first = np.argsort(owner, kind='stable')  # number interior faces in cell order.
+        owner = owner[first]
+        other = other[first]
+        cell = owner // k
+        j = owner % k
+        nxt = (j + 1) % self.cell_n_point[cell]
+        self.iface_point = np.stack((self.cell_point[cell, j], self.cell_point[cell, nxt]), axis=1)
+        self.iface_cell = np.stack((owner // k, other // k), axis=1)
+        iface = np.arange(len(owner))
+        self.cell_iface.ravel()[owner] = iface
+        self.cell_iface.ravel()[other] = iface
+        self.cell_nei.ravel()[owner] = other // k
+        self.cell_nei.ravel()[other] = owner // k
+
+        # boundary faces. remaining slots are matched against keys of line elements.
+        single = np.ones(len(key), dtype=bool)
+        single[pair] = False
+        single[pair + 1] = False
+        b_slot = slot[single]
+        b_key = key[single]
+        key = face_key(self.bface_point, n_point)
+        pos = np.minimum(np.searchsorted(b_key, key), max(len(b_key) - 1, 0))
+        match = np.flatnonzero(b_key[pos] == key) if len(b_key) else np.empty(0, dtype=np.int64)
+        s = b_slot[pos[match]]
+        self.cell_bface.ravel()[s] = match
+        self.bface_cell[match] = s // k
+
+
+def face_key(face, n):
+    """
+    Orientation independent integer key of faces.
+
+    :param face: (m, 2) int array of face vertices.
+    :param n: number of points.
+    :return: (m,) int64 array.
+    """
+    face = np.asarray(face, dtype=np.int64)
+    return np.minimum(face[:, 0], face[:, 1]) * n + np.maximum(face[:, 0], face[:, 1])
+
+
+def cell_face_key(cell_point, cell_n_point, n):
+    """
+    Keys of all cell faces. see face_key.
+
+    :param cell_point: (m, k) cell vertices. -1 pads unused entries.
+    :param cell_n_point: (m,) number of vertices of each cell.
+    :param n: number of points.
+    :return: (m, k) int64 array. -1 for faces which do not exist.
+    """
+    m, k = cell_point.shape
+    j = np.arange(k)
+    valid = j[None, :] < cell_n_point[:, None]
+    nxt = (j[None, :] + 1) % np.maximum(cell_n_point[:, None], 1)
+    other = cell_point[np.arange(m)[:, None], nxt]
+    key = np.minimum(cell_point, other) * n + np.maximum(cell_point, other)
+    key[~valid] = -1
+    return key
+
+
+def csr_transpose(connectivity, n):
+    """
+    Invert an entity-to-point connectivity array to point-to-entity CSR arrays.
+
+    :param connectivity: (m, k) int array. negative entries are ignored.
+    :param n: number of points.
+    :return: offset and value arrays such that value[offset[i]:offset[i+1]] holds entities of point i.
+    """
+    entity = np.repeat(np.arange(len(connectivity)), connectivity.shape[1])
+    point = connectivity.ravel()
+    valid = point >= 0
+    entity = entity[valid]
+    point = point[valid]
+    order = np.argsort(point, kind='stable')
+    offset = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(point, minlength=n), out=offset[1:])
+    return offset, entity[order]
+
+
+def grow(cell_nei, seed, n_layer, free):
+    """
+    Layers of cells around seed cells through cell neighbors.
+
+    :param cell_nei: (n_cell, k) neighbor across each cell face or -1.
+    :param seed: seed cells.
+    :param n_layer: number of layers.
+    :param free: (n_cell,) bool array. only free cells join layers.
+    :return: (n_cell,) layer of each cell. 0 for seeds, -1 for cells which are not reached.
+    """
+    layer = np.full(len(cell_nei), -1, dtype=np.int64)
+    front = np.unique(seed)
+    layer[front] = 0
+    for k in range(1, n_layer + 1):
+        nei = cell_nei[front].ravel()
+        nei = np.unique(nei[nei >= 0])
+        front = nei[(layer[nei] < 0) & free[nei]]
+        if len(front) == 0:
+            break
+        layer[front] = k
+    return layer
+
+
+def inverse_permutation(order):
+    """
+    :param order: permutation. entry i is the old index of new entity i.
+    :return: new index of each old entity.
+    """
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    return inverse
+
+
+def first_use(connectivity, n):
+    """
+    Order points by their first use in a connectivity array. Unused points follow in their original order.
+
+    :param connectivity: int array of points. negative entries are ignored.
+    :param n: number of points.
+    :return: (n,) permutation. entry i is the old index of new point i.
+    """
+    point = connectivity.ravel()
+    point = point[point >= 0]
+    first = np.full(n, len(point), dtype=np.int64)
+    np.minimum.at(first, point, np.arange(len(point)))
+    return np.argsort(first, kind='stable')
+
+
+def cuthill_mckee_level(nei, degree, start, visited):
+    """
+    Cuthill-McKee order of the component of a start node. Nodes of a level join in the order of their first parent
+    in the previous level, and children of a parent in the order of increasing degree.
+
+    :param visited: (n,) bool array. updated in place.
+    :return: list of levels.
+    """
+    level = np.array([start], dtype=np.int64)
+    visited[start] = True
+    result = [level]
+    k = nei.shape[1]
+    while True:
+        child = nei[level].ravel()
+        parent = np.repeat(np.arange(len(level)), k)
+        valid = child >= 0
+        child = child[valid]
+        parent = parent[valid]
+        valid = ~visited[child]
+        child = child[valid]
+        parent = parent[valid]
+        if len(child) == 0:
+            return result
+        order = np.lexsort((child, degree[child], parent))
+        child = child[order]
+        _, first = np.unique(child, return_index=True)
+        level = child[np.sort(first)]
+        visited[level] = True
+        result.append(level)
+
+
+def reverse_cuthill_mckee(nei):
+    """
+    Reverse Cuthill-McKee ordering of a graph. Each component starts from a pseudo-peripheral node: the node of
+    minimum degree of the last level of a search from a node of minimum degree.
+
+    :param nei: (n, k) neighbors of each node or -1.
+    :return: (n,) permutation. entry i is the old index of new node i.
+    """
+    n = len(nei)
+    degree = (nei >= 0).sum(axis=1)
+    visited = np.zeros(n, dtype=bool)
+    order = list()
+    # nodes of each degree in increasing order of index. the minimum degree free node is found from here.
+    candidate = np.argsort(degree, kind='stable')
+    pos = 0
+    while True:
+        while pos < n and visited[candidate[pos]]:
+            pos += 1
+        if pos == n:
+            break
+        start = candidate[pos]
+        level = cuthill_mckee_level(nei, degree, start, visited)
+        last = level[-1]
+        component = np.concatenate(level)
+        visited[component] = False
+        level = cuthill_mckee_level(nei, degree, last[np.argmin(degree[last])], visited)
+        order.extend(level)
+    return np.concatenate(order)[::-1] if order else np.empty(0, dtype=np.int64)
+
+
+def hilbert_key(point, n_bit=16):
+    """
+    Index of points along a Hilbert curve over their bounding square.
+
+    :param point: (n, 2) coordinates.
+    :param n_bit: number of bits of each quantized coordinate.
+    :return: (n,) int64 array.
+    """
+    if len(point) == 0:
+        return np.empty(0, dtype=np.int64)
+    low = point.min(axis=0)
+    span = (point.max(axis=0) - low).max()
+    side = 1 << n_bit
+    q = ((point - low) / (span if span > 0 else 1) * (side - 1)).astype(np.int64)
+    x = q[:, 0]
+    y = q[:, 1]
+    key = np.zeros(len(point), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        key += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so that the curve is continuous.
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return key
+
+
+class EntityList:
+    """
+    Read-only sequence of views over mesh arrays. Views are created only when accessed.
+    """
+    def __init__(self, parent_mesh, entity, n):
+        self.parent_mesh = parent_mesh
+        self.entity = entity  # view class.
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.entity(self.parent_mesh, i) for i in range(*index.indices(self.n))]
+        if index < 0:
+            index += self.n
+        if index < 0 or index >= self.n:
+            raise IndexError('index out of range')
+        return self.entity(self.parent_mesh, index)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield self.entity(self.parent_mesh, i)
+
+    def index(self, item):
+        return item.index
 
 
 class Face:
-    def __init__(self, shape, point, parent_mesh):
-        self.shape = shape  # the geometric shape of the face.
+    __slots__ = ('parent_mesh', 'index')
+
+    def __init__(self, parent_mesh, index):
         self.parent_mesh = parent_mesh  # the mesh to which face belongs to.
-        self.parent_cell = list()  # the cell to which face belongs to.
-        self.point = point  # list of face vertices.
+        self.index = index  # index of face in the arrays of the parent mesh.
 
-    def __eq__(self, other):
-        return self.point == other.point
+    def _point(self):
+        raise NotImplementedError
 
+    @property
+    def point(self):
+        # list of face vertices.
+        return [Point(self.parent_mesh, i) for i in self._point()]
 
-class BoundaryFace(Face):
-    def __init__(self, shape, point, wall, parent_mesh):
-        self.wall = wall  # boolean to indicate whether boundary face is a wall.
-        # set this boundary face as parent of its vertices.
-        for p in point:
-            if p.parent_bface is not None:
-                p.parent_bface.append(self)
-        super(BoundaryFace, self).__init__(shape, point, parent_mesh)
+    @property
+    def shape(self):
+        # the geometric shape of the face.
+        p = self.point
+        return symgeo.Line(p[0].shape, p[1].shape)
 
+    def _metric(self):
+        raise NotImplementedError
 
-class InteriorFace(Face):
-    def __init__(self, shape, point, parent_mesh):
-        # set this interior face as parent of its vertices.
-        for p in point:
-            if p.parent_iface is not None:
-                p.parent_iface.append(self)
-        super(InteriorFace, self).__init__(shape, point, parent_mesh)
+    @property
+    def midpoint(self):
+        return self._metric()[0][self.index]
 
+    @property
+    def normal(self):
+        # unit normal. see Mesh.iface_metric and Mesh.bface_metric for orientation.
+        return self._metric()[1][self.index]
 
-class Cell:
-    def __init__(self, shape, point, parent_mesh):
-        self.parent_mesh = parent_mesh  # the mesh to which the cell belongs to.
-        self.shape = shape  # geometric shape of the cell.
-        self.point = point  # list of cell vertices.
-        self.bface = list()  # list of cell boundary faces if any.
-        self.iface = list()  # list of cell interior faces.
-        self.nei = list()  # list of cell neighbors.
-        # set this cell as parent of its vertices.
-        for p in point:
-            if p.parent_cell is not None:
-                p.parent_cell.append(self)
+    @property
+    def length(self):
+        return float(self._metric()[2][self.index])
 
     def __eq__(self, other):
         return self.point == other.point
 
-    def set_face_vertices(self):
-        """
-        Determine vertices of cell faces with GMSH convention.
-        Do not modify cell faces but returns a new list.
-        :return:
-        """
-        faces = list()  # list of faces which holds lists of vertices.
-        if len(self.shape.args) == 4:  # check if the shape is quad.
-            face = list()  # list of vertices.
-            face.append(self.point[0])
-            face.append(self.point[1])
-            faces.append(face)
 
-            face = list()
-            face.append(self.point[1])
-            face.append(self.point[2])
+class BoundaryFace(Face):
+    __slots__ = ()
 
-            face = list()
-            face.append(self.point[2])
-            face.append(self.point[3])
+    def _point(self):
+        return self.parent_mesh.bface_point[self.index]
 
-            face = list()
-            face.append(self.point[3])
-            face.append(self.point[0])
+    def _metric(self):
+        return self.parent_mesh.bface_metric()
 
-            return faces
+    @property
+    def wall(self):
+        # boolean to indicate whether boundary face is a wall.
+        return bool(self.parent_mesh.bface_wall[self.index])
 
-        return None
+    @property
+    def parent_cell(self):
+        # the cell to which face belongs to.
+        c = self.parent_mesh.bface_cell[self.index]
+        return [Cell(self.parent_mesh, c)] if c >= 0 else []
 
 
-class Point:
-    def __init__(self, x, y, parent_mesh):
-        self.x = x
-        self.y = y
-        self.shape = symgeo.Point(x, y)
-        self.parent_mesh = parent_mesh  # the mesh to which point belongs to.
-        self.parent_cell = list()  # the cell to which point belongs to.
-        self.parent_bface = list()  # the boundary face to which point belongs to if any.
-        self.parent_iface = list()  # the interior face to which point belongs to if any.
+class InteriorFace(Face):
+    __slots__ = ()
 
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
+    def _point(self):
+        return self.parent_mesh.iface_point[self.index]
 
+    def _metric(self):
+        return self.parent_mesh.iface_metric()
 
+    @property
+    def parent_cell(self):
+        # the cells to which face belongs to.
+        return [Cell(self.parent_mesh, c) for c in self.parent_mesh.iface_cell[self.index]]
 
 
+class Cell:
+    __slots__ = ('parent_mesh', 'index')
 
+    def __init__(self, parent_mesh, index):
+        self.parent_mesh = parent_mesh  # the mesh to which the cell belongs to.
+        self.index = index  # index of cell in the arrays of the parent mesh.
+
+    @property
+    def point(self):
+        # list of cell vertices.
+        m = self.parent_mesh
+        return [Point(m, i) for i in m.cell_point[self.index, :m.cell_n_point[self.index]]]
+
+    @property
+    def shape(self):
+        # geometric shape of the cell.
+        return symgeo.Polygon(*[p.shape for p in self.point])
+
+    @property
+    def centroid(self):
+        return self.parent_mesh.cell_centroid()[self.index]
+
+    @property
+    def area(self):
+        # signed area. positive for counter-clockwise cells.
+        return float(self.parent_mesh.cell_area()[self.index])
+
+    @property
+    def bface(self):
+        # list of cell boundary faces if any.
+        return [BoundaryFace(self.parent_mesh, i) for i in self.parent_mesh.cell_bface[self.index] if i >= 0]
+
+    @property
+    def iface(self):
+        # list of cell interior faces.
+        return [InteriorFace(self.parent_mesh, i) for i in self.parent_mesh.cell_iface[self.index] if i >= 0]
+
+    @property
+    def nei(self):
+        # list of cell neighbors.
+        return [Cell(self.parent_mesh, i) for i in self.parent_mesh.cell_nei[self.index] if i >= 0]
 
+    def __eq__(self, other):
+        return self.point == other.point
 
+    def set_face_vertices(self):
+        """
+        Determine vertices of cell faces with GMSH convention.
+        Do not modify cell faces but returns a new list.
+        :return:
+        """
+        m = self.parent_mesh
+        return [[Point(m, a), Point(m, b)] for a, b in m.cell_face_point(self.index)]
 
 
+class Point:
+    __slots__ = ('parent_mesh', 'index')
 
+    def __init__(self, parent_mesh, index):
+        self.parent_mesh = parent_mesh  # the mesh to which point belongs to.
+        self.index = index  # index of point in the coordinate array of the parent mesh.
+
+    @property
+    def x(self):
+        return float(self.parent_mesh.coord[self.index, 0])
+
+    @property
+    def y(self):
+        return float(self.parent_mesh.coord[self.index, 1])
 
+    @property
+    def shape(self):
+        return symgeo.Point(self.x, self.y)
 
+    @property
+    def parent_cell(self):
+        # the cells to which point belongs to.
+        return [Cell(self.parent_mesh, i) for i in self.parent_mesh.point_cell(self.index)]
 
+    @property
+    def parent_bface(self):
+        # the boundary faces to which point belongs to if any.
+        return [BoundaryFace(self.parent_mesh, i) for i in self.parent_mesh.point_bface(self.index)]
 
+    @property
+    def parent_iface(self):
+        # the interior faces to which point belongs to if any.
+        m = self.parent_mesh
+        mask = (m.iface_point == self.index).any(axis=1)
+        return [InteriorFace(m, i) for i in np.flatnonzero(mask)]
 
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
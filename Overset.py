@@ -0,0 +1,357 @@
+import numpy as np
+
+import Geometry
+from ADT import ADT
+from Donor import DonorSearch
+from Mesh import grow
+from SweepAndPrune import SweepAndPrune
+
+# status of cells.
+FIELD = 0  # solved.
+FRINGE = 1  # interpolated from donors of another mesh.
+HOLE = 2  # inside a body or cut by a wall. neither solved nor interpolated.
+
+
+def compose(rotation, translation, r=None, t=None):
+    """
+    Compose rigid motions: x moves by (r, t) first, then by (rotation, translation).
+
+    :param rotation: (2, 2) rotation matrix.
+    :param translation: (2,) translation.
+    :param r: (2, 2) rotation matrix of the first motion. identity if None.
+    :param t: (2,) translation of the first motion. zero if None.
+    :return: rotation and translation of the composed motion.
+    """
+    r = np.eye(2) if r is None else r
+    t = np.zeros(2) if t is None else t
+    return rotation @ r, rotation @ t + translation
+
+
+def wall_segment(mesh):
+    """
+    :return: (n_wall, 2, 2) end points of wall boundary faces.
+    """
+    return mesh.coord[mesh.bface_point[mesh.bface_wall]]
+
+
+class Overset:
+    """
+    Hole cutting and donor search of overlapping meshes.
+
+    Walls of every mesh (boundary faces with wall=True) must form closed loops around bodies. Cells of other meshes
+    which are cut by walls or whose centroids lie inside the loops become holes. Layers of cells around holes and along
+    outer boundaries lying in other meshes become fringes, and each fringe gets a donor cell in another mesh.
+    All stages are batched queries on trees: wall segments are stored in an ADT per mesh, and cells in the spatial
+    index of a DonorSearch per mesh. A SweepAndPrune broad phase restricts them to pairs of overlapping meshes, and
+    donor searches to cells in overlapping blocks.
+
+    Meshes move between assemblies with move, which keeps the spatial index of their DonorSearch, or by assigning
+    their coord, after which assemble rebuilds it.
+    """
+    def __init__(self, mesh, n_fringe=2, tol=Geometry.TOL, backend='adt'):
+        """
+        :param mesh: list of Mesh with topology_connectivity called.
+        :param n_fringe: number of fringe layers.
+        :param tol: tolerance of donor search in local coordinates.
+        :param backend: spatial index of cells of donor searches, or 'auto' to pick one per mesh. see Index.BACKEND.
+        """
+        self.mesh = list(mesh)
+        self.n_fringe = n_fringe
+        self.tol = tol
+        self.backend = backend
+        self.wall_tree = [None] * len(self.mesh)  # ADT of wall segments of each mesh. None if mesh has no walls.
+        self.donor_search = [None] * len(self.mesh)  # DonorSearch of each mesh. built on demand.
+        self.status = [np.zeros(len(m.cell_point), dtype=np.int8) for m in self.mesh]
+        # donor of each cell: mesh, cell and weights of the vertices of the donor cell. -1 and zero if none.
+        self.donor_mesh = [np.full(len(m.cell_point), -1, dtype=np.int64) for m in self.mesh]
+        self.donor_cell = [np.full(len(m.cell_point), -1, dtype=np.int64) for m in self.mesh]
+        self.donor_weight = [np.zeros((len(m.cell_point), 4)) for m in self.mesh]
+        self.receptor = [np.empty(0, dtype=np.int64) for _ in self.mesh]  # fringe cells of the last find_donor.
+        self.source = [list() for _ in self.mesh]  # meshes providing donors to each mesh.
+        self.operator = dict()  # (i, j, location) to cached interpolation matrices. see interpolation.
+        self.broad = SweepAndPrune(self.mesh)
+        # coord of each mesh which the broad phase and DonorSearch follow. meshes whose coord is assigned otherwise
+        # are updated by assemble.
+        self.coord = [m.coord for m in self.mesh]
+        # rigid motion of each mesh since the broad phase computed its boxes. None if there is none.
+        self.rotation = [None] * len(self.mesh)
+        self.translation = [None] * len(self.mesh)
+        self.partner = set()  # (i, j) of meshes whose boxes overlap.
+        self.region = dict()  # (i, j) to cells of mesh i in blocks overlapping mesh j. see SweepAndPrune.overlap.
+        self.set_region()
+
+    def assemble(self):
+        """
+        Cut holes, grow fringes and find donors at the current positions of meshes.
+
+        :rtype: None
+        """
+        for i in range(len(self.mesh)):
+            if self.mesh[i].coord is not self.coord[i]:
+                self.update(i)
+            self.status[i][:] = FIELD
+        self.set_region()
+        self.cut_hole()
+        self.set_fringe()
+        self.find_donor()
+
+    def move(self, i, rotation=None, translation=None):
+        """
+        Move mesh i rigidly. A point x moves to rotation @ x + translation. Coordinates of the mesh are assigned, and
+        the broad phase and the spatial index of its DonorSearch get the motion with set_transform instead of
+        recomputing boxes. Call assemble afterwards.
+
+        :param i: index of mesh.
+        :param rotation: (2, 2) rotation matrix. identity if None.
+        :param translation: (2,) translation. zero if None.
+        :rtype: None
+        """
+        rotation = np.eye(2) if rotation is None else np.asarray(rotation, dtype=np.float64)
+        translation = np.zeros(2) if translation is None else np.asarray(translation, dtype=np.float64)
+        m = self.mesh[i]
+        if m.coord is not self.coord[i]:
+            # coordinates were assigned since. the motion applies to them.
+            self.update(i)
+        m.coord = m.coord @ rotation.T + translation
+        self.coord[i] = m.coord
+        # compose with the motion since the boxes of the broad phase and the index were computed.
+        self.rotation[i], self.translation[i] = compose(rotation, translation, self.rotation[i], self.translation[i])
+        self.broad.set_transform(i, self.rotation[i], self.translation[i])
+        if self.donor_search[i] is not None:
+            tree = self.donor_search[i].tree
+            tree.set_transform(*compose(rotation, translation, tree.rotation, tree.translation))
+
+    def update(self, i):
+        """
+        Follow coordinates of mesh i changed otherwise than by move, e.g. by deformation. The broad phase is updated
+        and the DonorSearch of the mesh is rebuilt on next use. assemble calls this for meshes whose coord was
+        assigned; call it after modifying coord in place.
+
+        :param i: index of mesh.
+        :rtype: None
+        """
+        self.coord[i] = self.mesh[i].coord
+        self.rotation[i] = None
+        self.translation[i] = None
+        self.broad.update(i)
+        self.donor_search[i] = None
+
+    def set_region(self):
+        """
+        Find overlapping meshes and their overlapping regions with the broad phase.
+
+        :rtype: None
+        """
+        pair = self.broad.component_pairs()
+        self.partner = set(map(tuple, pair.tolist())) | set(map(tuple, pair[:, ::-1].tolist()))
+        self.region = self.broad.overlap()
+
+    def set_wall_tree(self):
+        for i, m in enumerate(self.mesh):
+            segment = wall_segment(m)
+            if len(segment) == 0:
+                self.wall_tree[i] = None
+                continue
+            tree = ADT(2)
+            tree.build_from_boxes(np.hstack((segment.min(axis=1), segment.max(axis=1))))
+            self.wall_tree[i] = tree
+
+    def get_donor_search(self, j):
+        if self.donor_search[j] is None:
+            self.donor_search[j] = DonorSearch(self.mesh[j], backend=self.backend)
+        return self.donor_search[j]
+
+    def cut_hole(self):
+        """
+        Mark cells of each mesh cut by walls of other meshes or lying inside them as holes.
+
+        :rtype: None
+        """
+        self.set_wall_tree()
+        for j, tree in enumerate(self.wall_tree):
+            if tree is None:
+                continue
+            segment = wall_segment(self.mesh[j])
+            low = tree.node_box[0, :2]
+            high = tree.node_box[0, 2:]
+            for i, m in enumerate(self.mesh):
+                # cells inside walls do not overlap cells of mesh j, so whole meshes are paired here, not regions.
+                if (i, j) not in self.partner:
+                    continue
+                box = m.cell_box()
+                cell = np.flatnonzero(np.all(box[:, :2] <= high, axis=1) & np.all(box[:, 2:] >= low, axis=1))
+                if len(cell) == 0:
+                    continue
+                hole = self.cut_by_wall(m, cell, box[cell], tree, segment) | \
+                    self.inside_wall(m.cell_centroid()[cell], tree, segment, high[0])
+                self.status[i][cell[hole]] = HOLE
+
+    @staticmethod
+    def cut_by_wall(mesh, cell, box, tree, segment):
+        """
+        :return: (n,) bool array of cells crossed or touched by wall segments.
+        """
+        offset, index = tree.search_boxes(box)
+        row = np.repeat(np.arange(len(cell)), np.diff(offset))
+        # a segment is a degenerate polygon whose last vertex is repeated.
+        seg = segment[index][:, [0, 1, 1, 1]]
+        hit = Geometry.overlap(Geometry.polygon(mesh.coord, mesh.cell_point[cell[row]]), seg)
+        cut = np.zeros(len(cell), dtype=bool)
+        cut[row[hit]] = True
+        return cut
+
+    @staticmethod
+    def inside_wall(point, tree, segment, x_max):
+        """
+        Check whether points lie inside closed wall loops by the parity of crossings of rays in +x direction.
+
+        :return: (n,) bool array.
+        """
+        # the ray of a point is a degenerate box from the point to the right end of walls.
+        ray = np.column_stack((point, np.full(len(point), x_max), point[:, 1]))
+        offset, index = tree.search_boxes(ray)
+        row = np.repeat(np.arange(len(point)), np.diff(offset))
+        a = segment[index, 0]
+        b = segment[index, 1]
+        p = point[row]
+        # half-open rule counts a vertex shared by two segments once.
+        straddle = (a[:, 1] > p[:, 1]) != (b[:, 1] > p[:, 1])
+        dy = np.where(straddle, b[:, 1] - a[:, 1], 1)
+        x = a[:, 0] + (p[:, 1] - a[:, 1]) * (b[:, 0] - a[:, 0]) / dy
+        cross = straddle & (x > p[:, 0])
+        return np.bincount(row[cross], minlength=len(point)) % 2 == 1
+
+    def set_fringe(self):
+        """
+        Mark fringe layers around holes and inwards from outer boundary faces whose cells lie in other meshes.
+
+        :rtype: None
+        """
+        for i, m in enumerate(self.mesh):
+            status = self.status[i]
+            free = status != HOLE
+            layer = grow(m.cell_nei, np.flatnonzero(status == HOLE), self.n_fringe, free)
+            fringe = layer > 0
+            # outer boundary cells lying in non-hole cells of other meshes. background meshes have none.
+            cell = np.unique(m.bface_cell[~m.bface_wall & (m.bface_cell >= 0)])
+            cell = cell[free[cell]]
+            mesh, _, _ = self.search_donor(i, cell)
+            seed = cell[mesh >= 0]
+            if len(seed):
+                fringe |= grow(m.cell_nei, seed, self.n_fringe - 1, free) >= 0
+            status[fringe] = FRINGE
+
+    def search_donor(self, i, cell):
+        """
+        Find donors of cells of mesh i in other meshes. Hole cells are not donors. Field cells are preferred over
+        fringe cells, then smaller cells over larger ones.
+
+        :param i: index of receptor mesh.
+        :param cell: receptor cells.
+        :return: donor mesh, donor cell and (n, 4) weights. -1 and zero where there is no donor.
+        """
+        n = len(cell)
+        donor_mesh = np.full(n, -1, dtype=np.int64)
+        donor_cell = np.full(n, -1, dtype=np.int64)
+        weight = np.zeros((n, 4))
+        score = np.full(n, np.inf)
+        point = self.mesh[i].cell_centroid()[cell]
+        for j in range(len(self.mesh)):
+            region = self.region.get((i, j))
+            if region is None or n == 0:
+                continue
+            # a cell containing the centroid of a receptor overlaps the receptor, so it lies in an overlapping block.
+            mark = np.zeros(len(self.mesh[i].cell_point), dtype=bool)
+            mark[region] = True
+            sub = np.flatnonzero(mark[cell])
+            donor, w = self.get_donor_search(j).search_tree(point[sub], self.tol)
+            valid = donor >= 0
+            valid[valid] = self.status[j][donor[valid]] != HOLE
+            s = np.full(len(sub), np.inf)
+            area = np.abs(self.mesh[j].cell_area()[donor[valid]])
+            s[valid] = area + np.where(self.status[j][donor[valid]] == FRINGE, np.inf, 0)
+            # fringe donors have infinite score. keep them only if nothing else is found.
+            better = valid & ((s < score[sub]) | (donor_mesh[sub] < 0))
+            donor_mesh[sub[better]] = j
+            donor_cell[sub[better]] = donor[better]
+            weight[sub[better]] = w[better]
+            score[sub[better]] = s[better]
+        return donor_mesh, donor_cell, weight
+
+    def find_donor(self):
+        """
+        Find donors of fringe cells. Cached interpolation matrices of a mesh are dropped if its fringe cells, donors or
+        weights change, e.g. after motion, and kept if an assembly reproduces them exactly.
+
+        :rtype: None
+        """
+        for i in range(len(self.mesh)):
+            n = len(self.status[i])
+            donor_mesh = np.full(n, -1, dtype=np.int64)
+            donor_cell = np.full(n, -1, dtype=np.int64)
+            donor_weight = np.zeros((n, 4))
+            cell = np.flatnonzero(self.status[i] == FRINGE)
+            donor_mesh[cell], donor_cell[cell], donor_weight[cell] = self.search_donor(i, cell)
+            same = np.array_equal(cell, self.receptor[i]) and np.array_equal(donor_mesh, self.donor_mesh[i]) and \
+                np.array_equal(donor_cell, self.donor_cell[i]) and np.array_equal(donor_weight, self.donor_weight[i])
+            if same:
+                continue
+            self.receptor[i] = cell
+            self.donor_mesh[i] = donor_mesh
+            self.donor_cell[i] = donor_cell
+            self.donor_weight[i] = donor_weight
+            self.source[i] = np.unique(donor_mesh[cell][donor_mesh[cell] >= 0]).tolist()
+            for key in [key for key in self.operator if key[0] == i]:
+                del self.operator[key]
+
+    def interpolation(self, i, j, location='point'):
+        """
+        Interpolation matrix from mesh j to fringe cells of mesh i. Built from the donor lists on first use and
+        cached until find_donor changes them.
+
+        :param i: index of receptor mesh.
+        :param j: index of donor mesh.
+        :param location: 'point' or 'cell'. see DonorSearch.matrix.
+        :return: (n_fringe_i, n_point_j) or (n_fringe_i, n_cell_j) scipy.sparse.csr_matrix. rows are the fringe
+                 cells of donor_list(i). rows of cells without donors in mesh j are empty.
+        """
+        key = (i, j, location)
+        if key not in self.operator:
+            cell = self.receptor[i]
+            donor = np.where(self.donor_mesh[i][cell] == j, self.donor_cell[i][cell], -1)
+            self.operator[key] = self.get_donor_search(j).matrix(donor, self.donor_weight[i][cell], location)
+        return self.operator[key]
+
+    def transfer(self, i, value, location='point'):
+        """
+        Interpolate fields of other meshes to fringe cells of mesh i with one sparse product per donor mesh.
+
+        :param i: index of receptor mesh.
+        :param value: list of (n_j,) or (n_j, m) values of each mesh at points or cells. values of meshes which do
+                      not provide donors to mesh i are not used and may be None.
+        :param location: 'point' or 'cell'. see DonorSearch.matrix.
+        :return: (n_fringe_i,) or (n_fringe_i, m) values at the fringe cells of donor_list(i). zero at orphans.
+        """
+        result = None
+        for j in self.source[i]:
+            v = self.interpolation(i, j, location) @ value[j]
+            result = v if result is None else result + v
+        if result is None:
+            shape = next((np.shape(v)[1:] for v in value if v is not None), ())
+            result = np.zeros((len(self.receptor[i]),) + shape)
+        return result
+
+    def donor_list(self, i):
+        """
+        Donors of fringe cells of mesh i.
+
+        :return: receptor cells, donor meshes, donor cells and (n, 4) weights of donor vertices.
+        """
+        cell = np.flatnonzero(self.status[i] == FRINGE)
+        return cell, self.donor_mesh[i][cell], self.donor_cell[i][cell], self.donor_weight[i][cell]
+
+    def orphan(self, i):
+        """
+        :return: fringe cells of mesh i without donors.
+        """
+        return np.flatnonzero((self.status[i] == FRINGE) & (self.donor_mesh[i] < 0))
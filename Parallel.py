@@ -0,0 +1,152 @@
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ADT import ADT, QUERY_CHUNK, TREE_ARRAY
+
+# number of tasks per process. more tasks balance the load better.
+TASK_PER_PROCESS = 4
+
+# tree and shared memory blocks attached by a worker process.
+_tree = None
+_block = list()
+
+
+def share(array):
+    """
+    Copy an array to a new shared memory block.
+
+    :return: shared memory and (name, shape, dtype) to attach it in another process.
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def attach(spec):
+    """
+    Attach a shared memory block without copying.
+
+    :param spec: (name, shape, dtype) from share.
+    :return: shared memory and array viewing it.
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def init_worker(dim, spec):
+    """
+    Rebuild the tree in a worker process over shared memory. Called once per worker by the pool.
+    """
+    global _tree
+    _tree = ADT(dim)
+    for name, s in spec.items():
+        shm, array = attach(s)
+        _block.append(shm)
+        setattr(_tree, name, array)
+
+
+def search_worker(task):
+    """
+    Search a slice of the query array in a worker process.
+
+    :param task: (query spec, start, end, points, chunk, rotation, translation)
+    :return: offset and index arrays of the slice.
+    """
+    spec, start, end, points, chunk, rotation, translation = task
+    shm, query = attach(spec)
+    try:
+        _tree.set_transform(rotation, translation)
+        if points:
+            return _tree.search_points(query[start:end], chunk)
+        return _tree.search_boxes(query[start:end], chunk)
+    finally:
+        del query
+        shm.close()
+
+
+class ParallelADT:
+    """
+    Query a flat ADT from a pool of processes. The tree and the query arrays are placed in shared memory, so workers
+    read them without copies. Query batches are split into contiguous slices and the results are merged in order,
+    so search_boxes and search_points return the same arrays as the serial ADT.
+    """
+    def __init__(self, tree, n_process=None, context=None):
+        """
+        :param tree: ADT built with build_from_boxes.
+        :param n_process: number of worker processes. number of CPUs if None.
+        :param context: multiprocessing context or start method name. default context if None.
+        :error: if tree is not built raise ValueError.
+        """
+        if tree.node_element is None:
+            raise ValueError('tree is not built. call build_from_boxes first.')
+        self.tree = tree
+        self.n_process = n_process or mp.cpu_count()
+        self.block = list()
+        spec = dict()
+        for name in TREE_ARRAY:
+            shm, spec[name] = share(getattr(tree, name))
+            self.block.append(shm)
+        if context is None or isinstance(context, str):
+            context = mp.get_context(context)
+        self.pool = context.Pool(self.n_process, initializer=init_worker, initargs=(tree.dim, spec))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Stop worker processes and release shared memory.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for shm in self.block:
+            shm.close()
+            shm.unlink()
+        self.block = list()
+
+    def search_boxes(self, query, chunk=QUERY_CHUNK):
+        """
+        Parallel version of ADT.search_boxes. The rigid motion of the tree is applied in workers.
+        """
+        query = np.asarray(query, dtype=np.float64)
+        if query.ndim != 2 or query.shape[1] != self.tree.n_var:
+            raise ValueError('query must have shape (n_query, %i).' % self.tree.n_var)
+        return self.search_(query, False, chunk)
+
+    def search_points(self, point, chunk=QUERY_CHUNK):
+        """
+        Parallel version of ADT.search_points.
+        """
+        return self.search_(np.asarray(point, dtype=np.float64).reshape(-1, self.tree.dim), True, chunk)
+
+    def search_(self, query, points, chunk):
+        if self.pool is None:
+            raise ValueError('pool is closed.')
+        n_query = len(query)
+        n_task = min(max(n_query, 1), self.n_process * TASK_PER_PROCESS)
+        bound = np.linspace(0, n_query, n_task + 1).astype(np.int64)
+        shm, spec = share(query)
+        try:
+            task = [(spec, bound[i], bound[i + 1], points, chunk, self.tree.rotation, self.tree.translation)
+                    for i in range(n_task)]
+            result = self.pool.map(search_worker, task)
+        finally:
+            shm.close()
+            shm.unlink()
+        # merge slices in order.
+        offset = np.zeros(n_query + 1, dtype=np.int64)
+        shift = 0
+        for (start, end), (o, i) in zip(zip(bound[:-1], bound[1:]), result):
+            offset[start + 1:end + 1] = o[1:] + shift
+            shift += len(i)
+        index = np.concatenate([r[1] for r in result]) if result else np.empty(0, dtype=np.int64)
+        return offset, index
@@ -0,0 +1,222 @@
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+import VTK
+from Mesh import Mesh, reverse_cuthill_mckee
+
+# partitioning methods.
+METHOD = ('rcb', 'rcm')
+
+# VTK flag of duplicate cells. ghost cells are marked with it in vtkGhostType.
+DUPLICATE_CELL = 1
+
+
+def rcb(point, n_part):
+    """
+    Recursive coordinate bisection. Each set of points is split at the median along its longest extent, in
+    proportion to the numbers of parts on both sides.
+
+    :param point: (n, dim) points, e.g. cell centroids.
+    :param n_part: number of parts.
+    :return: (n,) part of each point.
+    """
+    part = np.zeros(len(point), dtype=np.int64)
+    stack = [(np.arange(len(point)), 0, n_part)]
+    while stack:
+        index, first, k = stack.pop()
+        if k == 1 or len(index) == 0:
+            part[index] = first
+            continue
+        k_left = k // 2
+        n_left = int(round(len(index) * k_left / k))
+        p = point[index]
+        d = np.argmax(p.max(axis=0) - p.min(axis=0))
+        if 0 < n_left < len(index):
+            order = np.argpartition(p[:, d], n_left)
+        else:
+            order = np.arange(len(index))
+        stack.append((index[order[:n_left]], first, k_left))
+        stack.append((index[order[n_left:]], first + k_left, k - k_left))
+    return part
+
+
+def partition(mesh, n_part, method='rcb'):
+    """
+    Assign cells of a mesh to parts of equal size.
+
+    :param mesh: Mesh.
+    :param n_part: number of parts.
+    :param method: 'rcb' bisects cell centroids recursively. 'rcm' cuts the reverse Cuthill-McKee order of cells
+                   into consecutive bands, which keeps parts connected in the cell graph.
+    :return: (n_cell,) part of each cell.
+    :error: if method is unknown raise ValueError.
+    """
+    n_cell = len(mesh.cell_point)
+    if method == 'rcb':
+        return rcb(mesh.cell_centroid(), n_part)
+    if method == 'rcm':
+        if len(mesh.cell_nei) != n_cell:
+            mesh.topology_connectivity()
+        part = np.empty(n_cell, dtype=np.int64)
+        part[reverse_cuthill_mckee(mesh.cell_nei)] = np.arange(n_cell) * n_part // max(n_cell, 1)
+        return part
+    raise ValueError('method must be one of %s.' % ', '.join(METHOD))
+
+
+def sorted_unique(a):
+    """
+    :return: sorted unique values of an int array.
+    """
+    a = np.sort(a, axis=None)
+    keep = np.ones(len(a), dtype=bool)
+    keep[1:] = a[1:] != a[:-1]
+    return a[keep]
+
+
+def ghost_layer(cell_nei, owned, n_ghost):
+    """
+    Layers of cells around a set of cells. Only the pages of the mark array around the set are touched, so the work
+    is proportional to the size of the set, not of the mesh.
+
+    :param cell_nei: (n_cell, k) neighbor across each cell face or -1.
+    :param owned: cells of the set.
+    :param n_ghost: number of layers.
+    :return: list of sorted cells of each layer.
+    """
+    mark = np.zeros(len(cell_nei), dtype=bool)
+    mark[owned] = True
+    front = owned
+    layer = list()
+    for _ in range(n_ghost):
+        nei = cell_nei[front].ravel()
+        nei = nei[nei >= 0]
+        front = sorted_unique(nei[~mark[nei]])
+        if len(front) == 0:
+            break
+        mark[front] = True
+        layer.append(front)
+    return layer
+
+
+class Partition:
+    """
+    Sub-mesh of the cells of one part and layers of ghost cells around them. Local cells are the owned cells in
+    global order followed by ghost cells layer by layer. Points and boundary faces are in global order.
+    """
+    def __init__(self, mesh, owned, index, n_ghost=1):
+        """
+        :param mesh: global Mesh with topology_connectivity called.
+        :param owned: cells of this part in increasing order.
+        :param index: index of this part.
+        :param n_ghost: number of ghost layers.
+        """
+        self.index = index
+        self.n_ghost = n_ghost
+        layer = ghost_layer(mesh.cell_nei, owned, n_ghost)
+        self.n_owned = len(owned)
+        self.cell_global = np.concatenate([owned] + layer)  # global index of each local cell.
+        # 0 for owned cells, ghost layer for ghost cells.
+        self.cell_layer = np.repeat(np.arange(len(layer) + 1), [len(owned)] + [len(c) for c in layer])
+
+        cell_point = mesh.cell_point[self.cell_global]
+        self.point_global = sorted_unique(cell_point[cell_point >= 0])  # global index of each local point.
+        bface = mesh.cell_bface[self.cell_global]
+        self.bface_global = sorted_unique(bface[bface >= 0])
+
+        self.mesh = Mesh()
+        self.mesh.coord = mesh.coord[self.point_global]
+        self.mesh.cell_point = np.where(cell_point >= 0, np.searchsorted(self.point_global, cell_point), -1)
+        self.mesh.cell_n_point = mesh.cell_n_point[self.cell_global]
+        self.mesh.cell_tag = mesh.cell_tag[self.cell_global]
+        self.mesh.bface_point = np.searchsorted(self.point_global, mesh.bface_point[self.bface_global])
+        self.mesh.bface_tag = mesh.bface_tag[self.bface_global]
+        self.mesh.bface_wall = mesh.bface_wall[self.bface_global]
+        # faces on the cut have one cell and no boundary face.
+        self.mesh.topology_connectivity()
+
+    @property
+    def ghost(self):
+        """
+        :return: (n_local_cell,) bool array of ghost cells.
+        """
+        return self.cell_layer > 0
+
+    def local_field(self, point_data=None, cell_data=None):
+        """
+        Restrict global fields to the sub-mesh and mark ghost cells in the cell field vtkGhostType.
+
+        :param point_data: dict of name to global per-point array.
+        :param cell_data: dict of name to global per-cell array.
+        :return: dicts of local point and cell fields.
+        """
+        point_data = {name: np.asarray(value)[self.point_global] for name, value in (point_data or {}).items()}
+        cell_data = {name: np.asarray(value)[self.cell_global] for name, value in (cell_data or {}).items()}
+        cell_data['vtkGhostType'] = np.where(self.ghost, DUPLICATE_CELL, 0).astype(np.uint8)
+        return point_data, cell_data
+
+    def write_vtu(self, file_name, point_data=None, cell_data=None, compress=True):
+        """
+        Write the sub-mesh with global fields restricted to it. see local_field.
+
+        :return: vtu file
+        """
+        self.mesh.print_vtu(file_name, *self.local_field(point_data, cell_data), compress=compress)
+
+
+def split(mesh, part, n_ghost=1):
+    """
+    :param mesh: global Mesh with topology_connectivity called.
+    :param part: (n_cell,) part of each cell. see partition.
+    :param n_ghost: number of ghost layers.
+    :return: list of Partition.
+    """
+    if len(mesh.cell_nei) != len(mesh.cell_point):
+        raise ValueError('topology is not built. call topology_connectivity first.')
+    order = np.argsort(part, kind='stable')
+    bound = np.searchsorted(part[order], np.arange(int(part.max()) + 2 if len(part) else 1))
+    return [Partition(mesh, order[bound[i]:bound[i + 1]], i, n_ghost) for i in range(len(bound) - 1)]
+
+
+def pool_map(func, item, n_process=None, context=None):
+    """
+    Apply a function to items in a pool of processes, e.g. to partitions.
+
+    :param func: picklable function of one argument, i.e. defined at module level.
+    :param item: list of arguments.
+    :param n_process: number of worker processes. number of CPUs if None.
+    :param context: multiprocessing context or start method name. default context if None.
+    :return: list of results in the order of items.
+    """
+    if context is None or isinstance(context, str):
+        context = mp.get_context(context)
+    with context.Pool(min(n_process or mp.cpu_count(), max(len(item), 1))) as pool:
+        return pool.map(func, item)
+
+
+def write_piece(task):
+    mesh, file_name, point_data, cell_data, compress = task
+    mesh.print_vtu(file_name, point_data, cell_data, compress)
+
+
+def write_pvtu(file_name, partitions, point_data=None, cell_data=None, compress=True, n_process=None,
+               context=None):
+    """
+    Write partitions as pieces file_name_<index>.vtu in a pool of processes and their index file_name.pvtu.
+
+    :param file_name: name of pvtu file without extension.
+    :param partitions: list of Partition.
+    :param point_data: dict of name to global per-point array.
+    :param cell_data: dict of name to global per-cell array.
+    :param compress: compress data of pieces with zlib.
+    :return: pvtu and vtu files
+    """
+    piece = ['%s_%i.vtu' % (file_name, p.index) for p in partitions]
+    # workers receive only local arrays.
+    task = [(p.mesh, f) + p.local_field(point_data, cell_data) + (compress,) for p, f in zip(partitions, piece)]
+    pool_map(write_piece, task, n_process, context)
+    cell_data = dict(cell_data or {})
+    cell_data['vtkGhostType'] = np.zeros(0, dtype=np.uint8)
+    VTK.write_pvtu(file_name + '.pvtu', [os.path.basename(f) for f in piece], point_data, cell_data,
+                   max((p.n_ghost for p in partitions), default=0))
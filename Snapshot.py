@@ -0,0 +1,145 @@
+import logging
+import os
+import queue
+import threading
+
+import numpy as np
+
+import Stats
+import VTK
+
+# number of snapshots waiting in the queue. one more is being written, so by default two are in flight.
+MAX_QUEUE = 1
+
+
+class SnapshotWriter:
+    """
+    Write fields of a static mesh as a time series of vtu files in a background thread.
+
+    The caller hands fields to write and goes on while the worker encodes and writes them; compression and file
+    writes release the GIL. Fields are copied unless told otherwise, so the caller may overwrite its arrays at once.
+    The queue is bounded: write blocks while MAX_QUEUE snapshots are waiting, which bounds memory if the disk is
+    slower than the solver. Points and cells are encoded once and their encoded blocks are reused by every snapshot.
+    Snapshots are file_name_<index>.vtu, and the index file_name.pvd is rewritten after each one.
+    """
+    def __init__(self, mesh, file_name, compress=True, max_queue=MAX_QUEUE):
+        """
+        :param mesh: Mesh. its coordinates and cells must not change while the writer is open.
+        :param file_name: name of pvd file without extension.
+        :param compress: compress data with zlib.
+        :param max_queue: number of snapshots waiting to be written before write blocks.
+        """
+        self.mesh = mesh
+        self.file_name = file_name
+        self.compress = compress
+        self.geometry = None  # VTK.Appended of points and cells. encoded by the worker with the first snapshot.
+        self.dataset = list()  # (time, vtu name) of written snapshots.
+        self.n_snapshot = 0  # number of snapshots handed to the worker.
+        self.error = None  # exception raised in the worker. raised again in the caller.
+        self.closed = False
+        # Stats collecting time waited on the queue and time of writes. instrumentation is off if None.
+        self.stats = None
+        self.queue = queue.Queue(max_queue)
+        self.thread = threading.Thread(target=self.run_, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_()
+        if exc_type is None:
+            self.check_error_()
+        elif self.error is not None:
+            # the exception of the caller propagates. the error of the worker is only logged.
+            error = self.error
+            self.error = None
+            logging.getLogger(__name__).error('snapshot writer failed', exc_info=error)
+
+    def write(self, time, point_data=None, cell_data=None, copy=True):
+        """
+        Queue a snapshot. Blocks while the queue is full.
+
+        :param time: time of the snapshot.
+        :param point_data: dict of name to per-point array.
+        :param cell_data: dict of name to per-cell array.
+        :param copy: copy fields. if False, the caller must not modify the arrays until flush, e.g. pass arrays
+                     which are not reused.
+        :return: name of the vtu file to be written.
+        :error: if the writer is closed raise ValueError. an exception of the worker is raised again.
+        """
+        if self.closed:
+            raise ValueError('writer is closed.')
+        self.check_error_()
+        convert = np.array if copy else np.asarray
+        point_data = {name: convert(value) for name, value in (point_data or {}).items()}
+        cell_data = {name: convert(value) for name, value in (cell_data or {}).items()}
+        vtu = '%s_%i.vtu' % (self.file_name, self.n_snapshot)
+        self.n_snapshot += 1
+        with Stats.timer(self.stats, 'snapshot_wait'):
+            self.queue.put((time, vtu, point_data, cell_data))
+        return vtu
+
+    def flush(self):
+        """
+        Wait until all queued snapshots are written.
+
+        :rtype: None
+        :error: an exception of the worker is raised again.
+        """
+        with Stats.timer(self.stats, 'snapshot_wait'):
+            self.queue.join()
+        self.check_error_()
+
+    def close(self):
+        """
+        Write queued snapshots and stop the worker. Closing again does nothing.
+
+        :rtype: None
+        :error: an exception of the worker is raised again.
+        """
+        self.stop_()
+        self.check_error_()
+
+    def stop_(self):
+        """
+        Write queued snapshots and join the worker. Do not call this function explicitly. It meant to be called in
+        close and __exit__.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def check_error_(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def run_(self):
+        """
+        Worker loop. Do not call this function explicitly. It meant to be called in the worker thread.
+        """
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                # snapshots after a failure are dropped. the failure is reported to the caller.
+                if self.error is None:
+                    with Stats.timer(self.stats, 'snapshot_write'):
+                        self.write_(*job)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def write_(self, time, vtu, point_data, cell_data):
+        if self.geometry is None:
+            m = self.mesh
+            self.geometry = VTK.encode_geometry(m.coord, m.cell_point, m.cell_n_point, self.compress)
+        VTK.write_vtu_fields(vtu, self.geometry, point_data, cell_data)
+        self.dataset.append((time, os.path.basename(vtu)))
+        VTK.write_pvd(self.file_name + '.pvd', self.dataset)
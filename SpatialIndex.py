@@ -0,0 +1,252 @@
+import numpy as np
+
+import Geometry
+import Stats
+
+# number of queries traversed together in batch searches.
+QUERY_CHUNK = 1 << 16
+
+
+def box_overlap(a, b, dim):
+    """
+    Evaluate overlap of pairs of boxes.
+
+    :param a: (n, 2*dim) boxes as min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+    :param b: (n, 2*dim) boxes.
+    :return: (n,) bool array. touching boxes overlap.
+    """
+    return np.all(a[:, :dim] <= b[:, dim:], axis=1) & np.all(a[:, dim:] >= b[:, :dim], axis=1)
+
+
+def to_csr(row, col, n):
+    """
+    Sort (row, col) pairs by row then col and compress rows.
+
+    :param row: list of int arrays.
+    :param col: list of int arrays.
+    :param n: number of rows.
+    :return: offset and index arrays.
+    """
+    row = np.concatenate(row) if row else np.empty(0, dtype=np.int64)
+    col = np.concatenate(col) if col else np.empty(0, dtype=np.int64)
+    order = np.lexsort((col, row))
+    offset = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row, minlength=n), out=offset[1:])
+    return offset, col[order].astype(np.int64)
+
+
+def filter_csr(offset, index, keep):
+    """
+    Remove entries of CSR arrays.
+
+    :param offset: (n + 1,) offsets.
+    :param index: (nnz,) indices.
+    :param keep: (nnz,) bool array of entries to keep.
+    :return: offset and index arrays.
+    """
+    row = np.repeat(np.arange(len(offset) - 1), np.diff(offset))
+    new_offset = np.zeros(len(offset), dtype=np.int64)
+    np.cumsum(np.bincount(row[keep], minlength=len(offset) - 1), out=new_offset[1:])
+    return new_offset, index[keep]
+
+
+def expand_range(start, count):
+    """
+    Concatenate integer ranges.
+
+    :param start: (n,) first value of each range.
+    :param count: (n,) length of each range.
+    :return: range of each value and the concatenated values.
+    """
+    owner = np.repeat(np.arange(len(count)), count)
+    first = np.cumsum(count) - count
+    return owner, np.arange(len(owner)) - first[owner] + start[owner]
+
+
+class SpatialIndex:
+    """
+    Interface of spatial indices of element boxes. Every index answers the same batched queries: boxes and points
+    (search_boxes, search_points) and polygons (search_polygons), and results are CSR arrays with elements sorted
+    in each row. Elements may move rigidly after the index is built (set_transform).
+
+    Subclasses implement build_from_boxes and search_boxes_, and name their stats counters by NAME.
+    """
+    NAME = 'index'
+
+    def __init__(self, dim):
+        """
+        :param dim: Spatial dimension.
+        """
+        self.dim = dim
+        self.n_var = 2 * dim
+        self.box = None  # (n_element, n_var) element boxes as min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        self.obb = None  # (center, axis, half) oriented boxes of elements. optional filter of search_polygons.
+        # rigid motion of elements relative to the boxes the index was built from. x = rotation @ x_ref + translation.
+        self.rotation = None
+        self.translation = None
+        # Stats collecting traversal counters and phase times. instrumentation is off if None.
+        self.stats = None
+
+    @property
+    def n_element(self):
+        return 0 if self.box is None else len(self.box)
+
+    def check_boxes_(self, boxes):
+        """
+        :return: boxes as a contiguous float array.
+        :error: if boxes do not have n_var columns raise ValueError.
+        """
+        boxes = np.ascontiguousarray(boxes, dtype=np.float64)
+        if boxes.ndim != 2 or boxes.shape[1] != self.n_var:
+            raise ValueError('boxes must have shape (n_element, %i).' % self.n_var)
+        return boxes
+
+    def check_built_(self):
+        if self.box is None:
+            raise ValueError('index is not built. call build_from_boxes first.')
+
+    def build_from_boxes(self, boxes):
+        """
+        Build the index from element bounding boxes.
+
+        :param boxes: (n_element, n_var) array of min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        :rtype: None
+        """
+        raise NotImplementedError
+
+    def search_boxes_(self, query, chunk=QUERY_CHUNK):
+        """
+        Search query boxes given in the reference frame of the index. Do not call this function explicitly. It meant
+        to be called in search_boxes, search_points and search_polygons.
+        """
+        raise NotImplementedError
+
+    def search_boxes(self, query, chunk=QUERY_CHUNK):
+        """
+        Find elements overlapping each of a batch of query boxes.
+
+        :param query: (n_query, n_var) array of min_0, ..., min_dim-1, max_0, ..., max_dim-1.
+        :param chunk: number of queries searched together. bounds the size of temporary arrays.
+        :return: offset and index arrays such that index[offset[i]:offset[i+1]] are the elements overlapping query i.
+        :error: if index is not built or query does not have n_var columns raise ValueError.
+        """
+        self.check_built_()
+        query = np.asarray(query, dtype=np.float64)
+        if query.ndim != 2 or query.shape[1] != self.n_var:
+            raise ValueError('query must have shape (n_query, %i).' % self.n_var)
+        return self.search_boxes_(self.box_to_reference(query), chunk)
+
+    def search_points(self, point, chunk=QUERY_CHUNK):
+        """
+        Find elements whose boxes contain each of a batch of points.
+
+        :param point: (n_query, dim) array of coordinates.
+        :return: offset and index arrays. see search_boxes.
+        """
+        self.check_built_()
+        # points map to the reference frame exactly.
+        point = self.to_reference(np.asarray(point, dtype=np.float64).reshape(-1, self.dim))
+        return self.search_boxes_(np.hstack((point, point)), chunk)
+
+    def set_transform(self, rotation=None, translation=None):
+        """
+        Set rigid motion of the elements relative to the boxes the index was built from. A point x_ref of the
+        reference frame moves to rotation @ x_ref + translation. Queries are mapped back to the reference frame, so the
+        index is built once while the elements move rigidly.
+        :param rotation: (dim, dim) rotation matrix. identity if None.
+        :param translation: (dim,) translation. zero if None.
+        :rtype: None
+        """
+        self.rotation = None if rotation is None else np.asarray(rotation, dtype=np.float64).reshape(self.dim,
+                                                                                                    self.dim)
+        self.translation = None if translation is None else np.asarray(translation, dtype=np.float64).reshape(
+            self.dim)
+
+    def to_reference(self, point):
+        """
+        Map points to the reference frame of the index.
+
+        :param point: (n, dim) points.
+        :return: (n, dim) points.
+        """
+        if self.translation is not None:
+            point = point - self.translation
+        if self.rotation is not None:
+            point = point @ self.rotation  # inverse of a rotation is its transpose.
+        return point
+
+    def box_to_reference(self, box):
+        """
+        Map boxes to the reference frame of the index. Rotated boxes are enclosed by the box of their corners,
+        so mapped boxes are conservatively enlarged.
+
+        :param box: (n, n_var) boxes.
+        :return: (n, n_var) boxes.
+        """
+        if self.rotation is None:
+            if self.translation is None:
+                return box
+            return box - np.tile(self.translation, 2)
+        dim = self.dim
+        lo = box[:, :dim]
+        hi = box[:, dim:]
+        r_min = np.full(lo.shape, np.inf)
+        r_max = np.full(lo.shape, -np.inf)
+        for corner in range(1 << dim):
+            upper = np.array([(corner >> d) & 1 for d in range(dim)], dtype=bool)
+            p = self.to_reference(np.where(upper, hi, lo))
+            r_min = np.minimum(r_min, p)
+            r_max = np.maximum(r_max, p)
+        return np.hstack((r_min, r_max))
+
+    def search_polygons(self, query, element, tol=Geometry.TOL, chunk=QUERY_CHUNK):
+        """
+        Find elements overlapping each of a batch of query polygons. Candidates from search_boxes are confirmed with
+        the exact test of Geometry.overlap, after the oriented boxes of set_obb if any.
+
+        :param query: (n_query, 4, 2) query polygons. see Geometry.polygon.
+        :param element: (n_element, 4, 2) polygons of the elements at the positions the index was built from.
+        :param tol: polygons closer than tol overlap.
+        :return: offset and index arrays. see search_boxes.
+        """
+        self.check_built_()
+        # polygons map to the reference frame exactly.
+        query = np.asarray(query, dtype=np.float64)
+        query = self.to_reference(query.reshape(-1, self.dim)).reshape(query.shape)
+        box = np.hstack((query.min(axis=1), query.max(axis=1)))
+        if tol > 0:
+            box[:, :self.dim] -= tol
+            box[:, self.dim:] += tol
+        stats = self.stats
+        name = self.NAME
+        offset, index = self.search_boxes_(box, chunk)
+        if self.obb is not None:
+            # second filter stage: oriented boxes are much tighter than axis-aligned ones for skewed elements.
+            with Stats.timer(stats, name + '_obb_filter'):
+                row = np.repeat(np.arange(len(query)), np.diff(offset))
+                center, axis, half = Geometry.obb(query)
+                keep = Geometry.obb_overlap((center[row], axis[row], half[row]),
+                                            tuple(a[index] for a in self.obb), max(tol, 0))
+                offset, index = filter_csr(offset, index, keep)
+            if stats is not None:
+                stats.add(name + '_obb_test', len(keep))
+                stats.add(name + '_obb_hit', keep.sum())
+        with Stats.timer(stats, name + '_true_overlap'):
+            row = np.repeat(np.arange(len(query)), np.diff(offset))
+            keep = Geometry.overlap(query[row], element[index], tol)
+            offset, index = filter_csr(offset, index, keep)
+        if stats is not None:
+            stats.add(name + '_true_overlap', len(keep))
+            stats.add(name + '_true_overlap_hit', keep.sum())
+        return offset, index
+
+    def set_obb(self, element):
+        """
+        Compute oriented bounding boxes of elements. Once set, search_polygons rejects candidates whose oriented
+        boxes are separated before the exact test.
+
+        :param element: (n_element, 4, 2) polygons of the elements at the positions the index was built from. None
+                        removes the filter.
+        :rtype: None
+        """
+        self.obb = None if element is None else Geometry.obb(element)
@@ -0,0 +1,200 @@
+import numpy as np
+
+from Partition import rcb
+from SpatialIndex import box_overlap, expand_range
+
+# number of cells of blocks, the sub-regions of components.
+BLOCK_SIZE = 256
+
+
+def resort(key, order=None):
+    """
+    Sort indices by key. With the order of a previous sort, keys which moved little since are nearly sorted along
+    it, and the stable sort (merging of runs) takes about linear time.
+
+    :param key: (n,) keys.
+    :param order: previous order of indices or None.
+    :return: (n,) indices sorted by key.
+    """
+    if order is None or len(order) != len(key):
+        return np.argsort(key, kind='stable')
+    return order[np.argsort(key[order], kind='stable')]
+
+
+def sweep(box, dim, order, axis=0):
+    """
+    Find overlapping pairs of boxes by sweeping their intervals along one axis. For every box, boxes whose lower
+    ends lie in its interval are candidates, which are confirmed on the other axes.
+
+    :param box: (n, 2*dim) boxes.
+    :param dim: Spatial dimension.
+    :param order: boxes sorted by their lower ends along axis. a subset of boxes may be given.
+    :param axis: axis of the sweep.
+    :return: (n_pair,) arrays of both boxes of each pair. every pair appears once.
+    """
+    low = box[order, axis]
+    end = np.searchsorted(low, box[order, dim + axis], side='right')
+    start = np.arange(1, len(order) + 1)
+    a, b = expand_range(start, np.maximum(end - start, 0))
+    a = order[a]
+    b = order[b]
+    keep = box_overlap(box[a], box[b], dim)
+    return a[keep], b[keep]
+
+
+def transform_box(box, dim, rotation=None, translation=None):
+    """
+    Move boxes rigidly. Rotated boxes are enclosed by the box of their corners.
+
+    :param box: (n, 2*dim) boxes.
+    :param rotation: (dim, dim) rotation matrix. identity if None.
+    :param translation: (dim,) translation. zero if None.
+    :return: (n, 2*dim) boxes.
+    """
+    if rotation is not None:
+        lo = box[:, :dim]
+        hi = box[:, dim:]
+        r_min = np.full(lo.shape, np.inf)
+        r_max = np.full(lo.shape, -np.inf)
+        for corner in range(1 << dim):
+            upper = np.array([(corner >> d) & 1 for d in range(dim)], dtype=bool)
+            p = np.where(upper, hi, lo) @ np.asarray(rotation).T
+            r_min = np.minimum(r_min, p)
+            r_max = np.maximum(r_max, p)
+        box = np.hstack((r_min, r_max))
+    if translation is not None:
+        box = box + np.tile(translation, 2)
+    return box
+
+
+class SweepAndPrune:
+    """
+    Broad phase of overlapping component meshes. Cells of every component are grouped into compact blocks, and the
+    boxes of components and of blocks are kept in interval lists sorted along the sweep axis. Overlapping
+    components are found by sweeping component boxes, then overlapping blocks of those components by sweeping
+    their block boxes. Only cells of overlapping blocks need element-level searches.
+
+    Components move with set_transform or update. Sorted orders are kept between queries and only re-sorted,
+    which is about linear in the number of boxes when components move a little between queries.
+    """
+    def __init__(self, mesh, block_size=BLOCK_SIZE, axis=0):
+        """
+        :param mesh: list of Mesh.
+        :param block_size: number of cells of blocks.
+        :param axis: axis of the sweep. choose the axis along which components are spread most.
+        """
+        self.mesh = list(mesh)
+        self.dim = 2
+        self.axis = axis
+        self.block_size = block_size
+        self.cell = list()  # cells of each component ordered by block.
+        n_block = list()
+        cell_count = list()
+        for m in self.mesh:
+            n_cell = len(m.cell_point)
+            n = -(-n_cell // block_size)
+            part = rcb(m.cell_centroid(), n) if n else np.zeros(0, dtype=np.int64)
+            self.cell.append(np.argsort(part, kind='stable'))
+            cell_count.append(np.bincount(part, minlength=n))
+            n_block.append(n)
+        # blocks of component i are block_first[i]:block_first[i+1].
+        self.block_first = np.zeros(len(self.mesh) + 1, dtype=np.int64)
+        np.cumsum(n_block, out=self.block_first[1:])
+        self.block_owner = np.repeat(np.arange(len(self.mesh)), n_block)
+        # cells of block b are cell[block_owner[b]][block_start[b]:block_start[b] + block_count[b]].
+        self.block_count = np.concatenate(cell_count) if cell_count else np.empty(0, dtype=np.int64)
+        self.block_start = np.concatenate([np.cumsum(c) - c for c in cell_count]) if cell_count else \
+            np.empty(0, dtype=np.int64)
+        # block boxes at the positions the blocks were computed from, and at the current positions.
+        self.block_ref = np.empty((self.block_first[-1], 2 * self.dim))
+        self.block_box = np.empty_like(self.block_ref)
+        self.comp_box = np.empty((len(self.mesh), 2 * self.dim))
+        self.comp_order = None
+        self.block_order = None
+        for i in range(len(self.mesh)):
+            self.update(i)
+
+    def update(self, i):
+        """
+        Recompute block boxes of component i from the current coordinates of its mesh, e.g. after deformation.
+        Blocks keep their cells, and the rigid motion of the component is reset.
+
+        :param i: index of component.
+        :rtype: None
+        """
+        block = np.arange(self.block_first[i], self.block_first[i + 1])
+        block = block[self.block_count[block] > 0]
+        # empty blocks never overlap.
+        self.block_ref[self.block_first[i]:self.block_first[i + 1]] = np.repeat([np.inf, -np.inf], self.dim)
+        if len(block):
+            box = self.mesh[i].cell_box()[self.cell[i]]
+            start = self.block_start[block]
+            self.block_ref[block] = np.hstack((np.minimum.reduceat(box[:, :self.dim], start),
+                                               np.maximum.reduceat(box[:, self.dim:], start)))
+        self.set_transform(i)
+
+    def set_transform(self, i, rotation=None, translation=None):
+        """
+        Move component i rigidly. A point x_ref of the mesh coordinates moves to rotation @ x_ref + translation.
+
+        :param i: index of component.
+        :param rotation: (dim, dim) rotation matrix. identity if None.
+        :param translation: (dim,) translation. zero if None.
+        :rtype: None
+        """
+        dim = self.dim
+        block = slice(self.block_first[i], self.block_first[i + 1])
+        self.block_box[block] = transform_box(self.block_ref[block], dim, rotation, translation)
+        box = self.block_box[block]
+        self.comp_box[i] = np.concatenate((box[:, :dim].min(axis=0, initial=np.inf),
+                                           box[:, dim:].max(axis=0, initial=-np.inf)))
+
+    def component_pairs(self):
+        """
+        :return: (n_pair, 2) pairs i < j of components whose boxes overlap.
+        """
+        self.comp_order = resort(self.comp_box[:, self.axis], self.comp_order)
+        a, b = sweep(self.comp_box, self.dim, self.comp_order, self.axis)
+        pair = np.sort(np.column_stack((a, b)), axis=1)
+        return pair[np.lexsort((pair[:, 1], pair[:, 0]))]
+
+    def block_pairs(self):
+        """
+        :return: (n_pair,) arrays of both blocks of overlapping pairs of blocks of different components.
+        """
+        active = np.zeros(len(self.mesh), dtype=bool)
+        active[self.component_pairs().ravel()] = True
+        self.block_order = resort(self.block_box[:, self.axis], self.block_order)
+        # filtering keeps the order sorted.
+        order = self.block_order[active[self.block_owner[self.block_order]]]
+        a, b = sweep(self.block_box, self.dim, order, self.axis)
+        keep = self.block_owner[a] != self.block_owner[b]
+        return a[keep], b[keep]
+
+    def overlap(self):
+        """
+        Find overlapping regions of components.
+
+        :return: dict of (i, j) to sorted cells of component i lying in blocks which overlap blocks of component j.
+                 both (i, j) and (j, i) are keys of overlapping components, and components which do not overlap are
+                 not keys.
+        """
+        a, b = self.block_pairs()
+        # every block paired with the components it overlaps.
+        block = np.concatenate((a, b))
+        other = self.block_owner[np.concatenate((b, a))]
+        key = self.block_owner[block] * len(self.mesh) + other
+        order = np.lexsort((block, key))
+        key = key[order]
+        block = block[order]
+        unique = np.ones(len(key), dtype=bool)
+        unique[1:] = (key[1:] != key[:-1]) | (block[1:] != block[:-1])
+        key = key[unique]
+        block = block[unique]
+        bound = np.flatnonzero(np.r_[True, key[1:] != key[:-1], True]) if len(key) else np.zeros(1, dtype=np.int64)
+        region = dict()
+        for start, end in zip(bound[:-1], bound[1:]):
+            i, j = divmod(int(key[start]), len(self.mesh))
+            _, slot = expand_range(self.block_start[block[start:end]], self.block_count[block[start:end]])
+            region[(i, j)] = np.sort(self.cell[i][slot])
+        return region
@@ -0,0 +1,292 @@
+import zlib
+
+import numpy as np
+
+# VTK cell type for a given number of cell vertices.
+VTK_CELL_TYPE = {3: 5, 4: 9}
+
+# VTK XML type name of numpy data types.
+VTK_DTYPE = {'int8': 'Int8', 'uint8': 'UInt8', 'int16': 'Int16', 'uint16': 'UInt16', 'int32': 'Int32',
+             'uint32': 'UInt32', 'int64': 'Int64', 'uint64': 'UInt64', 'float32': 'Float32', 'float64': 'Float64'}
+
+# size of blocks which are compressed separately in appended data.
+BLOCK_SIZE = 1 << 20
+
+
+def cell_array(cell_point, cell_n_point):
+    """
+    Flatten padded cell-to-vertex array.
+
+    :param cell_point: (n_cell, k) int array. -1 pads unused entries.
+    :param cell_n_point: (n_cell,) number of vertices of each cell.
+    :return: connectivity, end offsets and cell types.
+    """
+    connectivity = cell_point[cell_point >= 0]
+    offset = np.cumsum(cell_n_point)
+    cell_type = np.zeros(len(cell_n_point), dtype=np.uint8)
+    for n, t in VTK_CELL_TYPE.items():
+        cell_type[cell_n_point == n] = t
+    return connectivity, offset, cell_type
+
+
+def point3(coord):
+    """
+    :return: (n, 3) float64 array. 2D coordinates are padded with zero.
+    """
+    p = np.zeros((len(coord), 3))
+    p[:, :coord.shape[1]] = coord
+    return p
+
+
+def field_array(name, value, n):
+    """
+    Check a field array and reshape it to (n, number of components).
+    """
+    value = np.asarray(value)
+    if value.shape[0] != n:
+        raise ValueError('field %s has %i tuples, expected %i.' % (name, value.shape[0], n))
+    return value.reshape(n, -1)
+
+
+def write_legacy(file_name, coord, cell_point, cell_n_point, point_data=None, cell_data=None, binary=True):
+    """
+    Write unstructured grid in legacy VTK format.
+
+    :param file_name: name of file to write.
+    :param coord: (n_point, dim) coordinates.
+    :param cell_point: (n_cell, k) cell vertices. -1 pads unused entries.
+    :param cell_n_point: (n_cell,) number of vertices of each cell.
+    :param point_data: dict of name to per-point array.
+    :param cell_data: dict of name to per-cell array.
+    :param binary: write big-endian binary data if True else ASCII.
+    :return: vtk file
+    """
+    connectivity, offset, cell_type = cell_array(cell_point, cell_n_point)
+    n_point = len(coord)
+    n_cell = len(cell_n_point)
+    # cell list of legacy format: number of vertices followed by vertices.
+    cell = np.empty(n_cell + len(connectivity), dtype=np.int64)
+    start = offset - cell_n_point + np.arange(n_cell)
+    mask = np.ones(len(cell), dtype=bool)
+    mask[start] = False
+    cell[start] = cell_n_point
+    cell[mask] = connectivity
+
+    def data(f, a, fmt):
+        if binary:
+            f.write(np.ascontiguousarray(a, dtype='>' + a.dtype.str[1:]).data)
+            f.write(b'\n')
+        else:
+            np.savetxt(f, a.reshape(len(a), -1), fmt=fmt)
+
+    with open(file_name, 'wb') as f:
+        f.write(b'# vtk DataFile Version 3.0\n')
+        f.write(b'All in VTK format\n')
+        f.write(b'BINARY\n' if binary else b'ASCII\n')
+        f.write(b'DATASET UNSTRUCTURED_GRID\n')
+        f.write(b'POINTS %i double\n' % n_point)
+        data(f, point3(coord), '%.17g')
+        f.write(b'CELLS %i %i\n' % (n_cell, len(cell)))
+        data(f, cell.astype(np.int32), '%i')
+        f.write(b'CELL_TYPES %i\n' % n_cell)
+        data(f, cell_type.astype(np.int32), '%i')
+        for section, n, field in ((b'POINT_DATA', n_point, point_data), (b'CELL_DATA', n_cell, cell_data)):
+            if not field:
+                continue
+            f.write(b'%s %i\n' % (section, n))
+            f.write(b'FIELD FieldData %i\n' % len(field))
+            for name, value in field.items():
+                value = field_array(name, value, n).astype(np.float64)
+                f.write(b'%s %i %i double\n' % (name.encode(), value.shape[1], n))
+                data(f, value, '%.17g')
+
+
+def vtk_array(a):
+    """
+    Convert array to a little-endian type of VTK_DTYPE. Other types become float64.
+    """
+    a = np.asarray(a)
+    if a.dtype.name not in VTK_DTYPE:
+        a = a.astype(np.float64)
+    return a.astype(a.dtype.newbyteorder('<'), copy=False)
+
+
+def encode_block(a, compress, level=6):
+    """
+    Encode array for appended data of VTK XML formats. Header type is UInt64.
+
+    :param a: numpy array.
+    :param compress: compress with zlib if True.
+    :return: list of header and data blocks.
+    """
+    raw = memoryview(np.ascontiguousarray(a)).cast('B')
+    if not compress:
+        return [np.uint64(raw.nbytes).tobytes(), raw]
+    blocks = [zlib.compress(raw[i:i + BLOCK_SIZE], level) for i in range(0, raw.nbytes, BLOCK_SIZE)]
+    last = raw.nbytes - (len(blocks) - 1) * BLOCK_SIZE if blocks else 0
+    header = np.array([len(blocks), BLOCK_SIZE, last] + [len(b) for b in blocks], dtype=np.uint64)
+    return [header.tobytes()] + blocks
+
+
+class Appended:
+    """
+    XML elements of a vtu file and their appended data encoded so far. Points and cells come first, so a mesh
+    encoded once can be completed with different fields. see encode_geometry.
+    """
+    def __init__(self, n_point, n_cell, compress=True):
+        self.n_point = n_point
+        self.n_cell = n_cell
+        self.compress = compress
+        self.xml = list()
+        self.block = list()  # encoded blocks of appended data.
+        self.position = 0  # offset of the next block in appended data.
+
+    def copy(self):
+        other = Appended(self.n_point, self.n_cell, self.compress)
+        other.xml = list(self.xml)
+        other.block = list(self.block)
+        other.position = self.position
+        return other
+
+    def data_array(self, name, a, n_comp=None):
+        a = vtk_array(a)
+        comp = '' if n_comp is None else ' NumberOfComponents="%i"' % n_comp
+        self.xml.append('<DataArray type="%s" Name="%s"%s format="appended" offset="%i"/>'
+                        % (VTK_DTYPE[a.dtype.name], name, comp, self.position))
+        block = encode_block(a, self.compress)
+        self.block.extend(block)
+        self.position += sum(memoryview(b).nbytes for b in block)
+
+
+def encode_geometry(coord, cell_point, cell_n_point, compress=True):
+    """
+    Encode points and cells of an unstructured grid for write_vtu_fields. Encode once to write several vtu files of
+    a static mesh.
+
+    :param coord: (n_point, dim) coordinates.
+    :param cell_point: (n_cell, k) cell vertices. -1 pads unused entries.
+    :param cell_n_point: (n_cell,) number of vertices of each cell.
+    :param compress: compress appended data with zlib.
+    :return: Appended.
+    """
+    connectivity, offset, cell_type = cell_array(cell_point, cell_n_point)
+    geometry = Appended(len(coord), len(cell_n_point), compress)
+    geometry.xml.append('<Points>')
+    geometry.data_array('Points', point3(coord), 3)
+    geometry.xml.append('</Points>')
+    geometry.xml.append('<Cells>')
+    geometry.data_array('connectivity', connectivity.astype(np.int64))
+    geometry.data_array('offsets', offset.astype(np.int64))
+    geometry.data_array('types', cell_type)
+    geometry.xml.append('</Cells>')
+    return geometry
+
+
+def write_vtu_fields(file_name, geometry, point_data=None, cell_data=None):
+    """
+    Write unstructured grid in VTK XML format with raw appended data from encoded geometry and fields.
+
+    :param file_name: name of file to write.
+    :param geometry: Appended from encode_geometry. it is not modified.
+    :param point_data: dict of name to per-point array.
+    :param cell_data: dict of name to per-cell array.
+    :return: vtu file
+    """
+    data = geometry.copy()
+    for tag, n, field in (('PointData', data.n_point, point_data), ('CellData', data.n_cell, cell_data)):
+        if not field:
+            continue
+        data.xml.append('<%s>' % tag)
+        for name, value in field.items():
+            value = field_array(name, value, n)
+            data.data_array(name, value, value.shape[1])
+        data.xml.append('</%s>' % tag)
+
+    xml = list()
+    xml.append('<?xml version="1.0"?>')
+    xml.append('<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64"%s>'
+               % (' compressor="vtkZLibDataCompressor"' if data.compress else ''))
+    xml.append('<UnstructuredGrid>')
+    xml.append('<Piece NumberOfPoints="%i" NumberOfCells="%i">' % (data.n_point, data.n_cell))
+    xml.extend(data.xml)
+    xml.append('</Piece>')
+    xml.append('</UnstructuredGrid>')
+    xml.append('<AppendedData encoding="raw">')
+
+    with open(file_name, 'wb') as f:
+        f.write('\n'.join(xml).encode())
+        f.write(b'\n_')
+        for b in data.block:
+            f.write(b)
+        f.write(b'\n</AppendedData>\n</VTKFile>\n')
+
+
+def write_vtu(file_name, coord, cell_point, cell_n_point, point_data=None, cell_data=None, compress=True):
+    """
+    Write unstructured grid in VTK XML format with raw appended data.
+
+    :param file_name: name of file to write.
+    :param coord: (n_point, dim) coordinates.
+    :param cell_point: (n_cell, k) cell vertices. -1 pads unused entries.
+    :param cell_n_point: (n_cell,) number of vertices of each cell.
+    :param point_data: dict of name to per-point array.
+    :param cell_data: dict of name to per-cell array.
+    :param compress: compress appended data with zlib.
+    :return: vtu file
+    """
+    write_vtu_fields(file_name, encode_geometry(coord, cell_point, cell_n_point, compress), point_data, cell_data)
+
+
+def write_pvtu(file_name, piece, point_data=None, cell_data=None, ghost_level=0):
+    """
+    Write the index of an unstructured grid split in vtu pieces.
+
+    :param file_name: name of file to write.
+    :param piece: names of piece files relative to the directory of file_name.
+    :param point_data: dict of name to per-point array of any piece. only types and components are used.
+    :param cell_data: dict of name to per-cell array of any piece.
+    :param ghost_level: number of ghost cell layers of pieces.
+    :return: pvtu file
+    """
+    xml = list()
+    xml.append('<?xml version="1.0"?>')
+    xml.append('<VTKFile type="PUnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt64">')
+    xml.append('<PUnstructuredGrid GhostLevel="%i">' % ghost_level)
+    xml.append('<PPoints>')
+    xml.append('<PDataArray type="Float64" NumberOfComponents="3"/>')
+    xml.append('</PPoints>')
+    for tag, field in (('PPointData', point_data), ('PCellData', cell_data)):
+        if not field:
+            continue
+        xml.append('<%s>' % tag)
+        for name, value in field.items():
+            value = vtk_array(value)
+            xml.append('<PDataArray type="%s" Name="%s" NumberOfComponents="%i"/>'
+                       % (VTK_DTYPE[value.dtype.name], name, np.prod(value.shape[1:], dtype=np.int64)))
+        xml.append('</%s>' % tag)
+    for p in piece:
+        xml.append('<Piece Source="%s"/>' % p)
+    xml.append('</PUnstructuredGrid>')
+    xml.append('</VTKFile>')
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(xml) + '\n')
+
+
+def write_pvd(file_name, dataset):
+    """
+    Write the index of a time series of VTK XML files.
+
+    :param file_name: name of file to write.
+    :param dataset: list of (time, name of file relative to the directory of file_name).
+    :return: pvd file
+    """
+    xml = list()
+    xml.append('<?xml version="1.0"?>')
+    xml.append('<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">')
+    xml.append('<Collection>')
+    for time, name in dataset:
+        xml.append('<DataSet timestep="%r" group="" part="0" file="%s"/>' % (float(time), name))
+    xml.append('</Collection>')
+    xml.append('</VTKFile>')
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(xml) + '\n')
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# modules of the package are top-level modules of the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Gmsh  # noqa: E402
+from Mesh import Mesh  # noqa: E402
+
+
+def background(file_name, n, half=2.0):
+    """
+    Write and read a square quad mesh of n x n cells centered at the origin. Its sides are outer boundaries.
+    """
+    x = np.linspace(-half, half, n + 1)
+    x, y = np.meshgrid(x, x)
+    coord = np.column_stack((x.ravel(), y.ravel()))
+    index = np.arange((n + 1) ** 2).reshape(n + 1, n + 1)
+    cell = np.column_stack((index[:-1, :-1].ravel(), index[:-1, 1:].ravel(), index[1:, 1:].ravel(),
+                            index[1:, :-1].ravel()))
+    side = np.concatenate((np.column_stack((index[0, :-1], index[0, 1:])),
+                           np.column_stack((index[:-1, -1], index[1:, -1])),
+                           np.column_stack((index[-1, 1:], index[-1, :-1])),
+                           np.column_stack((index[1:, 0], index[:-1, 0]))))
+    Gmsh.write(file_name, coord, {1: (np.full(len(side), 2), side), 3: (np.full(len(cell), 5), cell)})
+    return Mesh(file_name)
+
+
+def ring(file_name, n_theta, n_radius, r_in=0.5, r_out=1.0, center=(0.1, 0.05)):
+    """
+    Write and read an annular quad mesh around a body. The inner circle is a wall (physical tag 1) and the outer
+    circle an outer boundary.
+    """
+    theta = np.linspace(0, 2 * np.pi, n_theta, endpoint=False)
+    r, theta = np.meshgrid(np.linspace(r_in, r_out, n_radius + 1), theta, indexing='ij')
+    coord = np.column_stack((center[0] + r.ravel() * np.cos(theta.ravel()),
+                             center[1] + r.ravel() * np.sin(theta.ravel())))
+    index = np.arange((n_radius + 1) * n_theta).reshape(n_radius + 1, n_theta)
+    nxt = np.roll(index, -1, axis=1)
+    cell = np.column_stack((index[:-1].ravel(), nxt[:-1].ravel(), nxt[1:].ravel(), index[1:].ravel()))
+    line = np.concatenate((np.column_stack((nxt[0], index[0])), np.column_stack((index[-1], nxt[-1]))))
+    tag = np.concatenate((np.ones(n_theta, dtype=np.int64), np.full(n_theta, 2)))
+    Gmsh.write(file_name, coord, {1: (tag, line), 3: (np.full(len(cell), 5), cell)})
+    return Mesh(file_name)
+
+
+@pytest.fixture
+def background_mesh(tmp_path):
+    return lambda n, **kwargs: background(str(tmp_path / ('background_%i.msh' % n)), n, **kwargs)
+
+
+@pytest.fixture
+def ring_mesh(tmp_path):
+    return lambda n_theta, n_radius, **kwargs: ring(str(tmp_path / ('ring_%i_%i.msh' % (n_theta, n_radius))),
+                                                    n_theta, n_radius, **kwargs)
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import Benchmark
+import Cache
+import Gmsh
+from ADT import TREE_ARRAY
+
+
+@pytest.fixture
+def source(tmp_path):
+    file_name = str(tmp_path / 'mesh.msh')
+    Gmsh.write(file_name, *Benchmark.generate('jittered', 400), binary=True)
+    return file_name
+
+
+def entry(cache_dir):
+    name, = os.listdir(cache_dir)
+    return os.path.join(cache_dir, name)
+
+
+def test_save_load(tmp_path):
+    directory = str(tmp_path / 'entry')
+    array = {'a': np.arange(10), 'b': np.ones((3, 2), dtype=np.float32)}
+    Cache.save(directory, array, {'note': 'x'})
+    header, loaded = Cache.load(directory)
+    assert header['note'] == 'x'
+    assert header['version'] == Cache.VERSION
+    for name, a in array.items():
+        assert loaded[name].dtype == a.dtype
+        assert np.array_equal(loaded[name], a)
+    # arrays are copy-on-write.
+    loaded['a'][0] = 5
+    assert Cache.load(directory)[1]['a'][0] == 0
+    assert Cache.load(str(tmp_path / 'missing')) is None
+
+
+def test_load_mesh(tmp_path, source):
+    cache_dir = str(tmp_path / 'cache')
+    mesh, tree = Cache.load_mesh(source, cache_dir, tree=True)
+    cached, cached_tree = Cache.load_mesh(source, cache_dir, tree=True)
+    assert len(os.listdir(cache_dir)) == 1
+    for name in Cache.MESH_ARRAY:
+        assert np.array_equal(getattr(cached, name), getattr(mesh, name)), name
+    for name in TREE_ARRAY:
+        assert np.array_equal(getattr(cached_tree, name), getattr(tree, name)), name
+    centroid = mesh.cell_centroid()
+    for a, b in zip(cached_tree.search_points(centroid), tree.search_points(centroid)):
+        assert np.array_equal(a, b)
+    # other options are other entries.
+    _, no_tree = Cache.load_mesh(source, cache_dir)
+    assert no_tree is None
+    assert len(os.listdir(cache_dir)) == 2
+
+
+@pytest.mark.parametrize('damage', ['missing_array', 'bad_header', 'empty', 'old_version'])
+def test_corrupt_entry_is_replaced(tmp_path, source, damage):
+    cache_dir = str(tmp_path / 'cache')
+    mesh, _ = Cache.load_mesh(source, cache_dir)
+    directory = entry(cache_dir)
+    if damage == 'missing_array':
+        os.remove(os.path.join(directory, 'coord.npy'))
+    elif damage == 'bad_header':
+        with open(os.path.join(directory, 'header.json'), 'w') as f:
+            f.write('{bad')
+    elif damage == 'empty':
+        shutil.rmtree(directory)
+        os.makedirs(directory)
+    else:
+        with open(os.path.join(directory, 'header.json')) as f:
+            header = json.load(f)
+        with open(os.path.join(directory, 'header.json'), 'w') as f:
+            json.dump(dict(header, version=Cache.VERSION - 1), f)
+    assert Cache.load(directory) is None
+    rebuilt, _ = Cache.load_mesh(source, cache_dir)
+    assert np.array_equal(rebuilt.coord, mesh.coord)
+    # the entry is healed and no temporary directories are left.
+    assert Cache.load(directory) is not None
+    assert os.listdir(cache_dir) == [os.path.basename(directory)]
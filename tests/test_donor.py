@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import Benchmark
+import Gmsh
+from Donor import DonorSearch
+from Mesh import Mesh
+
+
+@pytest.fixture(scope='module')
+def mesh(tmp_path_factory):
+    file_name = str(tmp_path_factory.mktemp('donor') / 'mixed.msh')
+    Gmsh.write(file_name, *Benchmark.generate('unstructured', 2000, seed=2))
+    return Mesh(file_name)
+
+
+@pytest.mark.parametrize('backend', ['adt', 'grid', 'bvh'])
+def test_walk_matches_tree_search(mesh, backend):
+    rng = np.random.default_rng(0)
+    ds = DonorSearch(mesh, backend=backend)
+    # points of the unit square and outside of it.
+    point = rng.uniform(-0.1, 1.1, (3000, 2))
+    donor, weight = ds.search_tree(point)
+    inside = np.all((point > 0) & (point < 1), axis=1)
+    assert np.array_equal(donor >= 0, inside)
+    guess = rng.integers(0, len(mesh.cell_point), len(point))
+    walked, walked_weight = ds.search(point, guess=guess)
+    assert np.array_equal(walked, donor)
+    assert np.allclose(walked_weight, weight, atol=1e-12)
+    # walks starting from the donors stay in place.
+    ds.search(point, guess=donor)
+    assert ds.hit_ratio == pytest.approx(inside.mean())
+
+
+def test_weights_interpolate_linear_field(mesh):
+    rng = np.random.default_rng(1)
+    ds = DonorSearch(mesh)
+    point = rng.random((1000, 2))
+    donor, weight = ds.search(point)
+    assert np.all(donor >= 0)
+    assert np.allclose(weight.sum(axis=1), 1)
+
+    def f(p):
+        return 3 * p[:, 0] - 2 * p[:, 1] + 0.5
+
+    assert np.allclose(ds.interpolate(donor, weight, f(mesh.coord)), f(point), atol=1e-12)
+    assert np.allclose(ds.matrix(donor, weight) @ f(mesh.coord), f(point), atol=1e-12)
+
+
+def test_rigid_motion(mesh):
+    rng = np.random.default_rng(2)
+    ds = DonorSearch(mesh)
+    point = rng.random((500, 2))
+    donor, weight = ds.search(point)
+    angle = 0.4
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    translation = np.array([2.0, -1.0])
+    ds.tree.set_transform(rotation, translation)
+    moved = point @ rotation.T + translation
+    for guess in (None, donor):
+        moved_donor, moved_weight = ds.search(moved, guess=guess)
+        assert np.array_equal(moved_donor, donor)
+        assert np.allclose(moved_weight, weight, atol=1e-12)
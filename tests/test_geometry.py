@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import sympy
+import sympy.geometry as symgeo
+
+import Geometry
+from ADT import ADTPoint
+
+
+def random_polygon(rng, n_vertex):
+    """
+    Simple triangle or quad around a random center. Vertices at sorted angles make quads star-shaped, so some are
+    not convex. Half of the polygons are clockwise.
+    """
+    center = rng.random(2) * 2
+    angle = np.sort(rng.random(n_vertex)) * 2 * np.pi
+    radius = rng.uniform(0.2, 1.0, n_vertex)
+    point = center + np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+    return point[::-1] if rng.random() < 0.5 else point
+
+
+def sympy_overlap(a, b):
+    """
+    Overlap of the sympy implementation which Geometry.overlap replaced. Polygon.intersection only finds crossings of
+    boundaries, so containment of one polygon in the other is checked as well.
+    """
+    pa = symgeo.Polygon(*[symgeo.Point(*map(sympy.Rational, p)) for p in a])
+    pb = symgeo.Polygon(*[symgeo.Point(*map(sympy.Rational, p)) for p in b])
+    return bool(pa.intersection(pb)) or bool(pa.encloses_point(pb.vertices[0])) or \
+        bool(pb.encloses_point(pa.vertices[0]))
+
+
+def pad(point):
+    return Geometry.polygon(np.asarray(point, dtype=np.float64), [np.arange(len(point))])[0]
+
+
+def test_overlap_matches_sympy():
+    rng = np.random.default_rng(0)
+    a = list()
+    b = list()
+    expected = list()
+    for k in range(60):
+        pa = random_polygon(rng, 3 + k % 2)
+        pb = random_polygon(rng, 3 + (k // 2) % 2)
+        a.append(pad(pa))
+        b.append(pad(pb))
+        expected.append(sympy_overlap(pa, pb))
+    result = Geometry.overlap(np.array(a), np.array(b))
+    assert result.tolist() == expected
+    # both outcomes and non-convex quads are covered.
+    assert 0 < sum(expected) < len(expected)
+    assert not np.all(Geometry.is_convex(Geometry.counter_clockwise(np.array(a))))
+
+
+@pytest.mark.parametrize('other, expected', [
+    ([[1, 0], [2, 0], [2, 1], [1, 1]], True),  # shared edge.
+    ([[1, 1], [2, 1], [2, 2]], True),  # shared vertex.
+    ([[0.25, 0.25], [0.75, 0.25], [0.5, 0.75]], True),  # contained.
+    ([[1.5, 0], [2.5, 0], [2.5, 1]], False),
+])
+def test_overlap_touching(other, expected):
+    square = [[0, 0], [1, 0], [1, 1], [0, 1]]
+    assert sympy_overlap(np.array(square, dtype=float), np.array(other, dtype=float)) == expected
+    assert Geometry.overlap(pad(square)[None], pad(other)[None])[0] == expected
+
+
+def test_overlap_tolerance():
+    square = pad([[0, 0], [1, 0], [1, 1], [0, 1]])[None]
+    other = pad([[1.01, 0], [2, 0], [2, 1], [1.01, 1]])[None]
+    assert not Geometry.overlap(square, other)[0]
+    assert Geometry.overlap(square, other, tol=0.02)[0]
+
+
+def test_adt_point_true_overlap():
+    a = ADTPoint([[0, 0], [1, 0], [1, 1], [0, 1]], 0, 2)
+    b = ADTPoint([[0.5, 0.5], [2, 0.5], [2, 2]], 1, 2)
+    c = ADTPoint([[3, 3], [4, 3], [4, 4]], 2, 2)
+    assert a.aabb.r == [0.0, 1.0, 0.0, 1.0]
+    assert a.true_overlap(b) and b.true_overlap(a)
+    assert not a.true_overlap(c)
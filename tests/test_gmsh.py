@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import Benchmark
+import Gmsh
+from Mesh import Mesh
+
+
+@pytest.fixture(scope='module')
+def mixed():
+    # shuffled triangles and quads with wall and outer boundary lines.
+    return Benchmark.generate('unstructured', 300, seed=1)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_write_read_round_trip(tmp_path, mixed, binary):
+    coord, element = mixed
+    file_name = str(tmp_path / 'mixed.msh')
+    Gmsh.write(file_name, coord, element, binary)
+    data = Gmsh.read(file_name)
+    assert np.array_equal(data.coord[:, :2], coord)
+    assert np.all(data.coord[:, 2] == 0)
+    assert sorted(data.element) == sorted(element)
+    for etype, (phys, conn) in element.items():
+        e_tag, e_phys, e_node = data.element[etype]
+        assert np.array_equal(e_phys, phys)
+        assert np.array_equal(data.node_index(e_node), conn)
+    # element tags number elements in the order of the dict.
+    tags = np.concatenate([data.element[etype][0] for etype in element])
+    assert np.array_equal(tags, np.arange(1, len(tags) + 1))
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_stream_matches_read(tmp_path, mixed, binary):
+    coord, element = mixed
+    file_name = str(tmp_path / 'mixed.msh')
+    Gmsh.write(file_name, coord, element, binary)
+    data = Gmsh.read(file_name)
+    node_tag = list()
+    node = list()
+    block = dict()
+    # small chunks split every section.
+    for item in Gmsh.stream(file_name, memory=1024):
+        if item[0] == 'header':
+            assert item[1:] == (len(coord), sum(len(phys) for phys, _ in element.values()))
+        elif item[0] == 'node':
+            node_tag.append(item[1])
+            node.append(item[2])
+        else:
+            block.setdefault(item[1], list()).append(item[2:])
+    assert np.array_equal(np.concatenate(node_tag), data.node_tag)
+    assert np.array_equal(np.concatenate(node), data.coord)
+    for etype, chunks in block.items():
+        for k in range(3):
+            assert np.array_equal(np.concatenate([c[k] for c in chunks]), data.element[etype][k])
+
+
+def test_mesh_from_file(tmp_path, mixed):
+    coord, element = mixed
+    file_name = str(tmp_path / 'mixed.msh')
+    Gmsh.write(file_name, coord, element, True)
+    mesh = Mesh(file_name)
+    streamed = Mesh(file_name, memory=1024)
+    n_tri = len(element[2][1])
+    assert len(mesh.cell_point) == n_tri + len(element[3][1])
+    assert np.sum(mesh.cell_n_point == 3) == n_tri
+    assert np.array_equal(mesh.bface_wall, element[1][0] == 1)
+    assert np.isclose(np.abs(mesh.cell_area()).sum(), 1.0)
+    for name in ('coord', 'cell_point', 'cell_tag', 'bface_point', 'bface_cell', 'iface_point', 'iface_cell',
+                 'cell_nei'):
+        assert np.array_equal(getattr(streamed, name), getattr(mesh, name)), name
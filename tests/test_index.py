@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import Index
+from Index import BACKEND, build_index
+
+
+def brute_force(box, query, dim):
+    """
+    :return: list of sorted elements overlapping each query.
+    """
+    return [np.flatnonzero(np.all(box[:, :dim] <= q[dim:], axis=1) & np.all(box[:, dim:] >= q[:dim], axis=1))
+            for q in query]
+
+
+def make_boxes(rng, case, m, dim):
+    low = rng.random((m, dim))
+    if case == 'uniform':
+        size = np.full((m, dim), 0.02)
+    elif case == 'clustered':
+        size = 10 ** rng.uniform(-5, -1, (m, dim))
+        low[:m // 2] *= 0.01
+    elif case == 'points':
+        size = np.zeros((m, dim))
+    else:  # duplicates.
+        low[:] = 0.5
+        size = np.full((m, dim), 0.1)
+    return np.hstack((low, low + size))
+
+
+@pytest.mark.parametrize('backend', sorted(BACKEND))
+@pytest.mark.parametrize('dim', [2, 3])
+@pytest.mark.parametrize('case', ['uniform', 'clustered', 'points', 'duplicate'])
+def test_search_matches_brute_force(backend, dim, case):
+    rng = np.random.default_rng(1)
+    box = make_boxes(rng, case, 2000, dim)
+    low = rng.random((300, dim)) * 1.2 - 0.1
+    query = np.hstack((low, low + rng.random((300, dim)) * 0.1))
+    query[:50, dim:] = query[:50, :dim]
+    tree = build_index(box, dim, backend)
+    offset, index = tree.search_boxes(query, chunk=97)
+    for q, expected in enumerate(brute_force(box, query, dim)):
+        assert np.array_equal(index[offset[q]:offset[q + 1]], expected)
+    offset, index = tree.search_points(low)
+    for q, expected in enumerate(brute_force(box, np.hstack((low, low)), dim)):
+        assert np.array_equal(index[offset[q]:offset[q + 1]], expected)
+
+
+@pytest.mark.parametrize('backend', sorted(BACKEND))
+def test_rigid_motion_and_empty(backend):
+    rng = np.random.default_rng(2)
+    low = rng.random((500, 2))
+    box = np.hstack((low, low + 0.05))
+    point = rng.random((200, 2))
+    expected = build_index(box, 2, 'adt').search_points(point)
+    tree = build_index(box, 2, backend)
+    rotation = np.array([[0.0, -1.0], [1.0, 0.0]])
+    translation = np.array([3.0, 1.0])
+    tree.set_transform(rotation, translation)
+    for a, b in zip(tree.search_points(point @ rotation.T + translation), expected):
+        assert np.array_equal(a, b)
+    empty = build_index(np.zeros((0, 4)), 2, backend)
+    offset, index = empty.search_points(point[:3])
+    assert np.array_equal(offset, [0, 0, 0, 0]) and len(index) == 0
+    with pytest.raises(ValueError):
+        BACKEND[backend](2).search_points(point)
+
+
+def test_select_backend():
+    rng = np.random.default_rng(3)
+    assert Index.select_backend(make_boxes(rng, 'uniform', 1000, 2), 2) == 'grid'
+    assert Index.select_backend(make_boxes(rng, 'clustered', 1000, 2), 2) == 'bvh'
+    with pytest.raises(ValueError):
+        build_index(np.zeros((0, 4)), 2, 'octree')
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+from Donor import DonorSearch
+from Overset import FRINGE, HOLE, Overset
+
+
+def linear(point):
+    return 2 * point[:, 0] + point[:, 1]
+
+
+def rotation(angle):
+    return np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+
+
+@pytest.fixture
+def overset(background_mesh, ring_mesh):
+    def make(backend='adt'):
+        system = Overset([background_mesh(60), ring_mesh(96, 16)], backend=backend)
+        system.assemble()
+        return system
+    return make
+
+
+def check_fresh(system):
+    """
+    Compare an assembly with a freshly built Overset of the meshes at their current positions.
+    """
+    fresh = Overset(system.mesh, system.n_fringe, system.tol, system.backend)
+    fresh.assemble()
+    value = [linear(m.coord) for m in system.mesh]
+    for i, m in enumerate(system.mesh):
+        assert np.array_equal(system.status[i], fresh.status[i])
+        assert np.array_equal(system.donor_mesh[i], fresh.donor_mesh[i])
+        assert np.array_equal(system.donor_cell[i], fresh.donor_cell[i])
+        assert np.allclose(system.donor_weight[i], fresh.donor_weight[i], atol=1e-12)
+        # transfer is exact for linear fields and zero at orphans.
+        cell = system.receptor[i]
+        expected = np.where(system.donor_mesh[i][cell] >= 0, linear(m.cell_centroid()[cell]), 0)
+        assert np.allclose(system.transfer(i, value), expected, atol=1e-12)
+
+
+def scratch_operator(system, i, j, location):
+    """
+    Interpolation matrix from mesh j to fringe cells of mesh i from a new DonorSearch.
+    """
+    cell = np.flatnonzero(system.status[i] == FRINGE)
+    ds = DonorSearch(system.mesh[j])
+    donor, weight = ds.search_tree(system.mesh[i].cell_centroid()[cell])
+    return ds.matrix(np.where(system.donor_mesh[i][cell] == j, donor, -1), weight, location)
+
+
+def test_assemble(overset):
+    system = overset()
+    background, ring = system.mesh
+    # background cells inside the wall are holes, and both meshes have fringes.
+    center = background.cell_centroid()
+    inside = np.hypot(center[:, 0] - 0.1, center[:, 1] - 0.05) < 0.45
+    assert np.all(system.status[0][inside] == HOLE)
+    assert np.all(system.status[1] != HOLE)
+    assert all(len(r) for r in system.receptor)
+    assert system.source == [[1], [0]]
+    assert len(system.orphan(0)) == 0 and len(system.orphan(1)) == 0
+    check_fresh(system)
+
+
+@pytest.mark.parametrize('backend', ['adt', 'auto'])
+def test_motion_matches_fresh(overset, backend):
+    system = overset(backend)
+    background, ring = system.mesh
+    # assigned coordinates are followed by assemble.
+    ring.coord = ring.coord + [0.05, 0.1]
+    system.assemble()
+    check_fresh(system)
+    # rigid motion keeps the index of the DonorSearch.
+    center = ring.coord.mean(axis=0)
+    r = rotation(0.3)
+    system.move(1, r, center - r @ center + [0.2, -0.1])
+    system.assemble()
+    check_fresh(system)
+    donor_search = system.donor_search[1]
+    system.move(1, r.T, [0.03, 0.02])
+    system.move(0, None, [0.01, 0.015])
+    system.assemble()
+    check_fresh(system)
+    assert system.donor_search[1] is donor_search
+    # coordinates modified in place need update.
+    ring.coord[:] += [-0.05, 0.0]
+    ring.invalidate_metric()
+    system.update(1)
+    system.assemble()
+    check_fresh(system)
+
+
+def test_move_after_assigned_coord(overset):
+    system = overset()
+    ring = system.mesh[1]
+    system.get_donor_search(1)
+    ring.coord = ring.coord + [0.04, -0.03]
+    system.move(1, rotation(0.2), [0.01, 0.0])
+    system.assemble()
+    check_fresh(system)
+
+
+def test_move_keeps_broad_phase_boxes(overset, monkeypatch):
+    system = overset()
+    call = list()
+    update = system.broad.update
+    monkeypatch.setattr(system.broad, 'update', lambda i: (call.append(i), update(i)))
+    center = system.mesh[1].coord.mean(axis=0)
+    r = rotation(0.1)
+    for _ in range(5):
+        system.move(1, r, center - r @ center)
+        system.move(0, None, [0.001, 0.0])
+    system.assemble()
+    assert call == []
+    check_fresh(system)
+
+
+def test_operator_cache(overset):
+    system = overset()
+    ring = system.mesh[1]
+    operator = dict()
+    for i in range(2):
+        for location in ('point', 'cell'):
+            for j in system.source[i]:
+                operator[(i, j, location)] = system.interpolation(i, j, location)
+    system.assemble()
+    assert all(system.operator[key] is op for key, op in operator.items())
+    system.move(1)
+    system.assemble()
+    assert all(system.operator[key] is op for key, op in operator.items())
+
+    center = ring.coord.mean(axis=0)
+    r = rotation(0.2)
+    system.move(1, r, center - r @ center + [0.05, 0.1])
+    system.assemble()
+    assert not any(key in system.operator for key in operator)
+    point_value = [linear(m.coord) for m in system.mesh]
+    cell_value = [linear(m.cell_centroid()) for m in system.mesh]
+    for i in range(2):
+        for location, value in (('point', point_value), ('cell', cell_value)):
+            expected = sum(scratch_operator(system, i, j, location) @ value[j] for j in system.source[i])
+            assert np.allclose(system.transfer(i, value, location), expected, atol=1e-12)
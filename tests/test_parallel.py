@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from ADT import ADT
+from Parallel import ParallelADT
+
+
+@pytest.fixture(scope='module')
+def tree():
+    rng = np.random.default_rng(0)
+    low = rng.random((5000, 2))
+    tree = ADT(2)
+    tree.build_from_boxes(np.hstack((low, low + rng.random((5000, 2)) * 0.02)))
+    return tree
+
+
+def test_matches_serial(tree):
+    rng = np.random.default_rng(1)
+    low = rng.uniform(-0.1, 1.1, (3000, 2))
+    query = np.hstack((low, low + 0.01))
+    point = rng.random((2000, 2))
+    with ParallelADT(tree, n_process=2) as parallel:
+        for a, b in zip(parallel.search_boxes(query, chunk=128), tree.search_boxes(query, chunk=128)):
+            assert np.array_equal(a, b)
+        for a, b in zip(parallel.search_points(point), tree.search_points(point)):
+            assert np.array_equal(a, b)
+        # fewer queries than tasks and no queries.
+        for a, b in zip(parallel.search_points(point[:3]), tree.search_points(point[:3])):
+            assert np.array_equal(a, b)
+        offset, index = parallel.search_points(np.zeros((0, 2)))
+        assert np.array_equal(offset, [0]) and len(index) == 0
+
+
+def test_rigid_motion(tree):
+    rng = np.random.default_rng(2)
+    point = rng.random((1000, 2))
+    rotation = np.array([[0.0, -1.0], [1.0, 0.0]])
+    translation = np.array([3.0, 1.0])
+    expected = tree.search_points(point)
+    tree.set_transform(rotation, translation)
+    try:
+        with ParallelADT(tree, n_process=2) as parallel:
+            for a, b in zip(parallel.search_points(point @ rotation.T + translation), expected):
+                assert np.array_equal(a, b)
+    finally:
+        tree.set_transform()
+
+
+def test_closed(tree):
+    parallel = ParallelADT(tree, n_process=1)
+    parallel.close()
+    parallel.close()
+    with pytest.raises(ValueError):
+        parallel.search_points(np.zeros((1, 2)))
+    with pytest.raises(ValueError):
+        ParallelADT(ADT(2))
@@ -0,0 +1,59 @@
+import logging
+import os
+
+import numpy as np
+import pytest
+
+from Snapshot import SnapshotWriter
+
+
+@pytest.fixture
+def mesh(background_mesh):
+    return background_mesh(4)
+
+
+def test_write(tmp_path, mesh):
+    os.makedirs(str(tmp_path / 'out'))
+    file_name = str(tmp_path / 'out' / 'out')
+    u = np.zeros(len(mesh.coord))
+    with SnapshotWriter(mesh, file_name) as writer:
+        for k in range(3):
+            u[:] = k
+            # fields are copied, so the caller reuses its array at once.
+            writer.write(0.1 * k, point_data={'u': u}, cell_data={'c': np.full(len(mesh.cell_point), k)})
+    assert sorted(os.listdir(str(tmp_path / 'out'))) == ['out.pvd', 'out_0.vtu', 'out_1.vtu', 'out_2.vtu']
+    with open(file_name + '.pvd') as f:
+        pvd = f.read()
+    assert 'timestep="0.1"' in pvd and 'file="out_2.vtu"' in pvd
+    with pytest.raises(ValueError):
+        writer.write(1.0)
+
+
+def test_worker_error_is_raised(tmp_path, mesh):
+    writer = SnapshotWriter(mesh, str(tmp_path / 'out'))
+    writer.write(0.0, cell_data={'bad': np.zeros(3)})
+    with pytest.raises(ValueError, match='bad'):
+        writer.flush()
+    # the error is raised once. later snapshots are written.
+    writer.write(0.1, cell_data={'c': np.zeros(len(mesh.cell_point))})
+    writer.close()
+    writer.close()
+    assert not writer.thread.is_alive()
+
+
+def test_worker_error_raised_on_exit(tmp_path, mesh):
+    with pytest.raises(ValueError, match='bad'):
+        with SnapshotWriter(mesh, str(tmp_path / 'out')) as writer:
+            writer.write(0.0, cell_data={'bad': np.zeros(3)})
+    assert not writer.thread.is_alive()
+
+
+def test_caller_exception_is_kept(tmp_path, mesh, caplog):
+    with caplog.at_level(logging.ERROR, logger='Snapshot'):
+        with pytest.raises(KeyError, match='caller'):
+            with SnapshotWriter(mesh, str(tmp_path / 'out')) as writer:
+                writer.write(0.0, cell_data={'bad': np.zeros(3)})
+                raise KeyError('caller')
+    assert not writer.thread.is_alive()
+    assert writer.error is None
+    assert 'snapshot writer failed' in caplog.text